@@ -4,8 +4,16 @@
 import streamlit as st
 import pandas as pd
 
-from lib.games_service import load_games
-from lib.ui_chess import render_lichess_board
+from lib.backend import BACKEND_DUCKDB, get_backend
+from lib.games_service import (
+    carica_partite_nuove,
+    count_games,
+    list_players,
+    load_games_page,
+    page_cursor,
+)
+from lib.opening_tree import MAX_PLY, get_opening_tree, normalizza_mosse
+from lib.ui_chess import render_board
 
 st.set_page_config(
     page_title="Chess Game Explorer",
@@ -17,6 +25,21 @@ st.title("♟️ Chess Game Explorer")
 
 st.sidebar.header("Filtri")
 
+# backend locale: i CSV aggiornati si caricano nel database già aperto, senza riavviare
+if get_backend() == BACKEND_DUCKDB and st.sidebar.button(
+    "🔄 Carica partite nuove",
+    help="Ingestion incrementale dei CSV Lichess nel database DuckDB locale.",
+):
+    with st.spinner("Carico le partite nuove..."):
+        nuove = carica_partite_nuove()
+    st.sidebar.success(f"{nuove} partite nuove caricate." if nuove else "Nessuna partita nuova.")
+
+player = st.sidebar.selectbox(
+    "Giocatore",
+    options=list_players(),
+    index=0,
+)
+
 speed_filter = st.sidebar.selectbox(
     "Tipo di partita (speed)",
     options=["Tutti", "blitz", "bullet"],
@@ -24,17 +47,30 @@ speed_filter = st.sidebar.selectbox(
 )
 
 result_filter = st.sidebar.selectbox(
-    "Risultato (dal tuo punto di vista)",
+    "Risultato (dal punto di vista del giocatore)",
     options=["Tutti", "win", "loss", "draw"],
     index=0,
 )
 
 color_filter = st.sidebar.selectbox(
-    "Colore (tuo)",
+    "Colore (del giocatore)",
     options=["Tutti", "white", "black"],
     index=0,
 )
 
+# le mosse scelte dal pannello "Albero delle aperture" si scrivono nel campo prima di crearlo
+if "explorer_mosse_nuove" in st.session_state:
+    st.session_state.explorer_mosse = st.session_state.pop("explorer_mosse_nuove")
+
+mosse = normalizza_mosse(
+    st.sidebar.text_input(
+        "Prime mosse (SAN)",
+        key="explorer_mosse",
+        placeholder="es. e4 c5 Nf3",
+        help="Solo le partite che iniziano con queste mosse (si può scrivere anche 1.e4 c5 2.Nf3).",
+    )
+)
+
 rating_min, rating_max = st.sidebar.slider(
     "Rating avversario",
     min_value=800,
@@ -43,24 +79,92 @@ rating_min, rating_max = st.sidebar.slider(
     step=50,
 )
 
-limit = st.sidebar.slider(
-    "Numero massimo di partite da caricare",
+page_size = st.sidebar.slider(
+    "Partite per pagina",
     min_value=20,
     max_value=500,
     value=100,
     step=20,
 )
 
+filters = (player, speed_filter, result_filter, color_filter, (rating_min, rating_max), mosse)
+
+# =========================
+# Albero delle aperture
+# =========================
+with st.expander("🌳 Albero delle aperture", expanded=True):
+    try:
+        albero = get_opening_tree(player, color_filter)
+    except Exception as e:
+        st.error(f"Errore durante il caricamento dell'albero delle aperture: {e}")
+        st.stop()
 
-with st.spinner("Carico le partite da Snowflake..."):
+    nodo = albero.nodo(mosse)
+    col_mosse, col_indietro, col_azzera = st.columns([6, 1, 1])
+    with col_mosse:
+        st.markdown(f"**Mosse:** {' '.join(mosse) if mosse else 'posizione iniziale'}")
+    with col_indietro:
+        if st.button("↩ Indietro", disabled=not mosse, use_container_width=True):
+            st.session_state.explorer_mosse_nuove = " ".join(mosse[:-1])
+            st.rerun()
+    with col_azzera:
+        if st.button("Azzera", disabled=not mosse, use_container_width=True):
+            st.session_state.explorer_mosse_nuove = ""
+            st.rerun()
+
+    if nodo is None:
+        if len(mosse) > MAX_PLY:
+            st.caption(f"L'albero arriva alle prime {MAX_PLY} semimosse: qui filtrano solo le partite.")
+        else:
+            st.caption("Nessuna partita del giocatore inizia con queste mosse.")
+    else:
+        st.caption(
+            f"{nodo.totale} partite con queste mosse (prima dei filtri su formato, risultato e rating) — "
+            f"vinte {nodo.win}, patte {nodo.draw}, perse {nodo.loss}. Seleziona una mossa per proseguire."
+        )
+        df_prossime = albero.prossime_mosse(mosse)
+        if not df_prossime.empty:
+            evento_albero = st.dataframe(
+                df_prossime.rename(
+                    columns={
+                        "MOSSA": "Mossa",
+                        "PARTITE": "Partite",
+                        "VINTE": "Vinte",
+                        "PATTE": "Patte",
+                        "PERSE": "Perse",
+                        "PUNTEGGIO": "Punteggio %",
+                    }
+                ),
+                use_container_width=True,
+                hide_index=True,
+                height=min(35 * (len(df_prossime) + 1) + 3, 280),
+                on_select="rerun",
+                selection_mode="single-row",
+                key="albero_" + " ".join(mosse),
+            )
+            righe_albero = evento_albero.selection.rows
+            if righe_albero:
+                mossa = df_prossime.iloc[righe_albero[0]]["MOSSA"]
+                st.session_state.explorer_mosse_nuove = " ".join(mosse + (mossa,))
+                st.rerun()
+
+# Paginazione keyset: teniamo solo i cursori delle pagine già viste,
+# e si riparte dalla prima pagina quando cambiano i filtri.
+if st.session_state.get("explorer_filters") != (filters, page_size):
+    st.session_state.explorer_filters = (filters, page_size)
+    st.session_state.explorer_cursors = [None]
+    st.session_state.explorer_page = 0
+
+page = st.session_state.explorer_page
+
+with st.spinner("Carico le partite..."):
     try:
-        df_games = load_games(
-            speed_filter=speed_filter,
-            result_filter=result_filter,
-            color_filter=color_filter,
-            rating_range=(rating_min, rating_max),
-            limit=limit,
+        df_games = load_games_page(
+            *filters,
+            page_size=page_size,
+            after=st.session_state.explorer_cursors[page],
         )
+        total_games = count_games(*filters)
     except Exception as e:
         st.error(f"Errore durante il caricamento delle partite: {e}")
         st.stop()
@@ -69,6 +173,9 @@ if df_games.empty:
     st.warning("Nessuna partita trovata con i filtri selezionati.")
     st.stop()
 
+total_pages = max(1, -(-total_games // page_size))
+has_next = page + 1 < total_pages
+
 
 if "selected_game_id" not in st.session_state and not df_games.empty:
     st.session_state.selected_game_id = df_games.iloc[0]["GAME_ID"]
@@ -92,13 +199,33 @@ df_display = df_games.rename(
     }
 )
 
+col_prev, col_info, col_next = st.columns([1, 3, 1])
+
+with col_prev:
+    if st.button("◀ Precedente", disabled=page == 0, use_container_width=True):
+        st.session_state.explorer_page -= 1
+        st.rerun()
+
+with col_info:
+    st.markdown(
+        f"Pagina **{page + 1}** di **{total_pages}** ({total_games} partite)"
+    )
+
+with col_next:
+    if st.button("Successiva ▶", disabled=not has_next, use_container_width=True):
+        cursors = st.session_state.explorer_cursors
+        del cursors[page + 1:]
+        cursors.append(page_cursor(df_games))
+        st.session_state.explorer_page += 1
+        st.rerun()
+
 event = st.dataframe(
     df_display,
     use_container_width=True,
     hide_index=True,
     on_select="rerun",           
     selection_mode="single-row", 
-    key="games_table",
+    key=f"games_table_{page}",
 )
 
 try:
@@ -114,8 +241,8 @@ current_game_id = st.session_state.get("selected_game_id")
 
 
 with board_container:
-    st.subheader("Scacchiera Lichess")
-    render_lichess_board(current_game_id, height=500)
+    st.subheader("Scacchiera")
+    render_board(current_game_id, height=500)
 
 
 
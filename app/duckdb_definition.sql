@@ -0,0 +1,234 @@
+-- Replica locale (DuckDB) degli oggetti definiti in ingestion.sql e forecast_definition.sql.
+-- La tabella CHESS_DB.RAW.LICHESS_GAMES viene creata da lib/local_backend.py
+-- a partire dal Parquet costruito dai CSV Lichess.
+
+CREATE OR REPLACE TABLE CHESS_DB.RAW.DIM_PLAYER (
+    PLAYER_NAME VARCHAR NOT NULL PRIMARY KEY,
+    IS_DEFAULT  BOOLEAN DEFAULT FALSE
+);
+
+INSERT INTO CHESS_DB.RAW.DIM_PLAYER (PLAYER_NAME, IS_DEFAULT) VALUES
+    ('spellbind', TRUE),
+    ('Mouseslippin_Jimmy', FALSE);
+
+
+-- Derivazioni della dynamic table DT_GAMES_PERSPECTIVE (stessa logica di ingestion.sql):
+-- una riga per (partita, lato). lib/local_backend.py la materializza in
+-- DT_GAMES_PERSPECTIVE, ordinata per (player_name, game_date), e la rinfresca in modo incrementale.
+CREATE OR REPLACE VIEW CHESS_DB.RAW.V_GAMES_DERIVED AS
+SELECT
+    d.*,
+
+    CASE
+        WHEN d.opponent_rating IS NULL THEN NULL
+        WHEN d.opponent_rating < 1800 THEN '<1800'
+        WHEN d.opponent_rating < 2000 THEN '1800-1999'
+        WHEN d.opponent_rating < 2200 THEN '2000-2199'
+        ELSE '>=2200'
+    END AS opponent_rating_bucket,
+
+    d.my_rating - d.opponent_rating AS rating_diff,
+
+    CASE WHEN d.my_result = 'win' THEN 1 ELSE 0 END AS is_win,
+    CASE WHEN d.winner IS NULL OR d.winner = '' THEN 1 ELSE 0 END AS is_draw
+
+FROM (
+    SELECT
+        s.id,
+        s.rated,
+        s.variant,
+        s.speed,
+        s.perf,
+
+        s.created_at,
+        CAST(s.created_at AS DATE) AS game_date,
+        s.last_move_at,
+        DATEDIFF('second', s.created_at, s.last_move_at) AS game_duration_seconds,
+
+        s.status,
+        s.winner,
+
+        s.moves,
+        LEN(STRING_SPLIT(s.moves, ' ')) AS ply_count,
+
+        s.opening_name,
+        s.opening_eco,
+
+        s.white_name,
+        s.white_rating,
+        s.black_name,
+        s.black_rating,
+
+        s.player_name,
+        s.my_color,
+
+        CASE
+            WHEN s.winner = s.my_color THEN 'win'
+            WHEN s.winner IS NULL OR s.winner = '' THEN 'draw'
+            ELSE 'loss'
+        END AS my_result,
+
+        CASE WHEN s.my_color = 'white' THEN s.white_rating ELSE s.black_rating END AS my_rating,
+        CASE WHEN s.my_color = 'white' THEN s.black_name ELSE s.white_name END AS opponent_name,
+        CASE WHEN s.my_color = 'white' THEN s.black_rating ELSE s.white_rating END AS opponent_rating
+
+    FROM (
+        SELECT g.*, g.white_name AS player_name, 'white' AS my_color
+        FROM CHESS_DB.RAW.LICHESS_GAMES g
+        WHERE g.white_name IS NOT NULL
+        UNION ALL
+        SELECT g.*, g.black_name AS player_name, 'black' AS my_color
+        FROM CHESS_DB.RAW.LICHESS_GAMES g
+        WHERE g.black_name IS NOT NULL
+    ) s
+) d;
+
+
+CREATE OR REPLACE TABLE CHESS_DB.RAW.DT_GAMES_PERSPECTIVE AS
+SELECT * FROM CHESS_DB.RAW.V_GAMES_DERIVED
+LIMIT 0;
+
+
+-- Vista storica mantenuta per compatibilità: partite del giocatore di default
+CREATE OR REPLACE VIEW CHESS_DB.RAW.V_GAMES_ANALYST AS
+SELECT
+    g.id,
+    g.rated,
+    g.variant,
+    g.speed,
+    g.perf,
+    g.created_at,
+    g.game_date,
+    g.last_move_at,
+    g.game_duration_seconds,
+    g.status,
+    g.winner,
+    g.moves,
+    g.ply_count,
+    g.opening_name,
+    g.opening_eco,
+    g.white_name,
+    g.white_rating,
+    g.black_name,
+    g.black_rating,
+    g.my_color,
+    g.my_result,
+    g.opponent_name,
+    g.opponent_rating,
+    g.opponent_rating_bucket
+FROM CHESS_DB.RAW.DT_GAMES_PERSPECTIVE g
+JOIN CHESS_DB.RAW.DIM_PLAYER p
+  ON p.player_name = g.player_name
+ AND p.is_default;
+
+
+-- Partite di tutti i giocatori dal punto di vista di player_name (una riga per partita e lato)
+CREATE OR REPLACE VIEW CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI AS
+SELECT
+    g.player_name,
+    g.id,
+    g.rated,
+    g.variant,
+    g.speed,
+    g.perf,
+
+    g.created_at,
+    g.game_date,
+    g.last_move_at,
+    g.game_duration_seconds,
+
+    g.status,
+    g.winner,
+
+    g.moves,
+    g.ply_count,
+
+    g.opening_name,
+    g.opening_eco,
+
+    g.white_name,
+    g.white_rating,
+    g.black_name,
+    g.black_rating,
+
+    g.my_color,
+    g.my_result,
+    g.my_rating,
+    g.opponent_name,
+    g.opponent_rating,
+    g.rating_diff,
+    g.opponent_rating_bucket,
+    g.is_win,
+    g.is_draw
+
+FROM CHESS_DB.RAW.DT_GAMES_PERSPECTIVE g;
+
+
+-- Partite del giocatore di default (DIM_PLAYER.IS_DEFAULT), con le colonne di sempre
+CREATE OR REPLACE VIEW CHESS_DB.ANALYTICS.V_PARTITE_ANALISI AS
+SELECT
+    g.id,
+    g.rated,
+    g.variant,
+    g.speed,
+    g.perf,
+
+    g.created_at,
+    g.game_date,
+    g.last_move_at,
+    g.game_duration_seconds,
+
+    g.status,
+    g.winner,
+
+    g.moves,
+    g.ply_count,
+
+    g.opening_name,
+    g.opening_eco,
+
+    g.white_name,
+    g.white_rating,
+    g.black_name,
+    g.black_rating,
+
+    g.my_color,
+    g.my_result,
+    g.my_rating,
+    g.opponent_name,
+    g.opponent_rating,
+    g.rating_diff,
+    g.opponent_rating_bucket,
+    g.is_win,
+    g.is_draw
+
+FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI g
+JOIN CHESS_DB.RAW.DIM_PLAYER p
+  ON p.player_name = g.player_name
+ AND p.is_default;
+
+
+-- Rating giornaliero (ultima partita del giorno) di ogni giocatore del club:
+-- una serie per player_name, usata dal modello di forecast multi-serie.
+CREATE OR REPLACE VIEW CHESS_DB.ANALYTICS.V_RATING_DAILY AS
+SELECT
+    player_name,
+    CAST(game_date AS TIMESTAMP) AS ts,
+    my_rating AS rating
+FROM (
+    SELECT
+        g.player_name,
+        g.game_date,
+        g.created_at,
+        g.my_rating,
+        ROW_NUMBER() OVER (
+            PARTITION BY g.player_name, g.game_date
+            ORDER BY g.created_at DESC
+        ) AS rn
+    FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI g
+    JOIN CHESS_DB.RAW.DIM_PLAYER p
+      ON p.player_name = g.player_name
+    WHERE g.my_rating IS NOT NULL
+)
+WHERE rn = 1
+ORDER BY player_name, ts;
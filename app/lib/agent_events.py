@@ -0,0 +1,177 @@
+# lib/agent_events.py
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import pandas as pd
+
+# Tipi Snowflake (rowType del result_set) da convertire quando si costruisce il DataFrame
+_TIPI_NUMERICI = {"fixed", "real", "number", "float", "double", "decimal", "integer"}
+_TIPI_DATA = {"date", "timestamp_ntz", "timestamp_ltz", "timestamp_tz", "timestamp"}
+
+
+@dataclass
+class ToolUse:
+    """Chiamata a uno strumento decisa dall'agente (evento response.tool_use)."""
+
+    tool_use_id: str
+    name: str
+    input: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ResultTable:
+    """Tabella di risultati già calcolata dall'agente (tool_result con result_set, o response.table)."""
+
+    tool_use_id: str
+    title: str
+    df: pd.DataFrame
+    sql: str | None = None
+
+
+@dataclass
+class ToolResult:
+    """Risultato di uno strumento (evento response.tool_result)."""
+
+    tool_use_id: str
+    name: str
+    status: str | None = None
+    sql: str | None = None
+    text: str | None = None
+
+
+def result_set_to_df(result_set: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Converte un result_set dell'agente (formato SQL API: resultSetMetaData.rowType + data
+    con i valori come stringhe) in un DataFrame con nomi colonna in maiuscolo e tipi giusti.
+    """
+    meta = result_set.get("resultSetMetaData", {}) or {}
+    row_type = meta.get("rowType", []) or []
+    nomi = [str(c.get("name", f"COL{i}")).upper() for i, c in enumerate(row_type)]
+    dati = result_set.get("data", []) or []
+    if not nomi and dati:
+        nomi = [f"COL{i}" for i in range(len(dati[0]))]
+
+    df = pd.DataFrame(dati, columns=nomi)
+    for nome, colonna in zip(nomi, row_type):
+        tipo = str(colonna.get("type", "")).lower()
+        if tipo in _TIPI_NUMERICI:
+            df[nome] = pd.to_numeric(df[nome], errors="coerce")
+        elif tipo in _TIPI_DATA:
+            df[nome] = _converti_date(df[nome], tipo)
+    return df
+
+
+def _converti_date(serie: pd.Series, tipo: str) -> pd.Series:
+    # la SQL API restituisce DATE come giorni dall'epoca e TIMESTAMP come secondi.frazione
+    numeri = pd.to_numeric(serie, errors="coerce")
+    if numeri.notna().any():
+        unita = "D" if tipo == "date" else "s"
+        return pd.to_datetime(numeri, unit=unita, errors="coerce")
+    return pd.to_datetime(serie, errors="coerce")
+
+
+class AgentRun:
+    """
+    Stato di una risposta del Cortex Agent costruito evento per evento dallo stream SSE.
+
+    gestisci(event, data) aggiorna tool_uses / tool_results / tables e restituisce
+    l'eventuale delta di testo da mostrare; final_text è il testo della risposta aggregata,
+    message_id l'id del messaggio dell'assistente nel thread (evento metadata).
+    """
+
+    def __init__(self):
+        self.tool_uses: Dict[str, ToolUse] = {}
+        self.tool_results: Dict[str, ToolResult] = {}
+        self.tables: List[ResultTable] = []
+        self.final_text: str | None = None
+        self.message_id: int | None = None
+        self._viste: set[tuple[str, str]] = set()
+
+    def gestisci(self, event: str, data: str) -> str | None:
+        try:
+            payload = json.loads(data) if data else {}
+        except json.JSONDecodeError:
+            return None
+
+        if event == "response.text.delta":
+            return payload.get("text", "")
+        if event == "response.tool_use":
+            self._tool_use(payload)
+        elif event == "response.tool_result":
+            self._tool_result(payload)
+        elif event == "response.table":
+            self._table(payload)
+        elif event == "response":
+            self._risposta(payload)
+        elif event == "metadata":
+            metadata = payload.get("metadata", payload) or {}
+            if metadata.get("role") == "assistant" and metadata.get("message_id") is not None:
+                self.message_id = metadata["message_id"]
+        return None
+
+    def _tool_use(self, item: Dict[str, Any]) -> None:
+        tool_use_id = str(item.get("tool_use_id", ""))
+        self.tool_uses[tool_use_id] = ToolUse(
+            tool_use_id=tool_use_id,
+            name=item.get("name", ""),
+            input=item.get("input", {}) or {},
+        )
+
+    def _tool_result(self, item: Dict[str, Any]) -> None:
+        tool_use_id = str(item.get("tool_use_id", ""))
+        risultato = ToolResult(
+            tool_use_id=tool_use_id, name=item.get("name", ""), status=item.get("status")
+        )
+        for blocco in item.get("content", []) or []:
+            contenuto = blocco.get("json") if blocco.get("type") == "json" else None
+            if not isinstance(contenuto, dict):
+                continue
+            risultato.sql = contenuto.get("sql") or risultato.sql
+            risultato.text = contenuto.get("text") or risultato.text
+            if contenuto.get("result_set"):
+                self._aggiungi_tabella(
+                    tool_use_id,
+                    risultato.name or "Risultati",
+                    contenuto["result_set"],
+                    risultato.sql,
+                )
+        self.tool_results[tool_use_id] = risultato
+
+    def _table(self, item: Dict[str, Any]) -> None:
+        tool_use_id = str(item.get("tool_use_id", ""))
+        result_set = item.get("result_set") or {}
+        if result_set:
+            sql = self.tool_results.get(tool_use_id, ToolResult(tool_use_id, "")).sql
+            self._aggiungi_tabella(tool_use_id, item.get("title") or "Risultati", result_set, sql)
+
+    def _aggiungi_tabella(
+        self, tool_use_id: str, title: str, result_set: Dict[str, Any], sql: str | None
+    ) -> None:
+        # lo stesso result_set può arrivare sia nel tool_result sia in un evento table
+        statement = (result_set.get("resultSetMetaData", {}) or {}).get("statementHandle") or sql or ""
+        chiave = (tool_use_id, statement)
+        if chiave in self._viste:
+            return
+        self._viste.add(chiave)
+        self.tables.append(
+            ResultTable(tool_use_id=tool_use_id, title=title, df=result_set_to_df(result_set), sql=sql)
+        )
+
+    def _risposta(self, payload: Dict[str, Any]) -> None:
+        """Risposta aggregata finale: testo e (se non già arrivati a eventi) tool e tabelle."""
+        messaggio = payload.get("response", payload) or {}
+        testi = []
+        for item in messaggio.get("content", []) or []:
+            tipo = item.get("type")
+            if tipo == "text":
+                testi.append(item.get("text", ""))
+            elif tipo == "tool_use":
+                self._tool_use(item.get("tool_use", item))
+            elif tipo == "tool_result":
+                self._tool_result(item.get("tool_result", item))
+            elif tipo == "table":
+                self._table(item.get("table", item))
+        if testi:
+            self.final_text = "\n".join(testi)
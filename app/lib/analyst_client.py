@@ -0,0 +1,292 @@
+# lib/analyst_client.py
+
+import hashlib
+import json
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .chat_history import ANALYST_MAX_TOKENS, ANALYST_MAX_TURNI, Message, compatta
+from .snowflake_utils import get_rest_auth
+
+FILE_MODELLO_SEMANTICO = "@CHESS_DB.ANALYTICS.SEMANTIC_MODELS/scacchi_semantica.yaml"
+
+# Chiamate Analyst in parallelo (tutte le sessioni Streamlit del processo)
+MAX_WORKERS = 4
+TIMEOUT = (10, 60)  # (connect, read)
+
+
+class RichiestaAnnullata(Exception):
+    """La richiesta è stata annullata (l'utente ha fatto un'altra domanda)."""
+
+
+# Connessioni HTTP annullabili: prima di aspettare la risposta la connessione si fa
+# conoscere alla chiamata in corso sul thread (_locale.registra), così annulla può
+# chiuderne il socket e interrompere l'attesa invece di aspettare fino al timeout.
+_locale = threading.local()
+
+
+class _Annullabile:
+    def getresponse(self, *args, **kwargs):
+        registra = getattr(_locale, "registra", None)
+        if registra is not None:
+            registra(self)
+        return super().getresponse(*args, **kwargs)
+
+
+class _HTTPConnectionAnnullabile(_Annullabile, HTTPConnection):
+    pass
+
+
+class _HTTPSConnectionAnnullabile(_Annullabile, HTTPSConnection):
+    pass
+
+
+class _HTTPPoolAnnullabile(HTTPConnectionPool):
+    ConnectionCls = _HTTPConnectionAnnullabile
+
+
+class _HTTPSPoolAnnullabile(HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnectionAnnullabile
+
+
+class _AdapterAnnullabile(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _HTTPPoolAnnullabile,
+            "https": _HTTPSPoolAnnullabile,
+        }
+
+
+def _interrompi(conn: HTTPConnection) -> None:
+    """Chiude il socket della connessione: la lettura in corso sull'altro thread fallisce subito."""
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def normalizza_domanda(domanda: str) -> str:
+    """Forma canonica della domanda: minuscole e spazi compattati."""
+    return " ".join((domanda or "").lower().split())
+
+
+def messaggio_utente(domanda: str, giocatore: str) -> Message:
+    """Domanda come messaggio "user" per Analyst (il giocatore va nel prefisso)."""
+    return {
+        "role": "user",
+        "content": [{"type": "text", "text": f"[giocatore: {giocatore}] {domanda}"}],
+    }
+
+
+def messaggi_richiesta(domanda: str, giocatore: str, storia: List[Message] | None) -> List[Message]:
+    """
+    Messaggi da inviare: i turni precedenti (user/analyst alternati) più la domanda,
+    compattati entro ANALYST_MAX_TOKENS e ANALYST_MAX_TURNI.
+    """
+    return compatta(
+        [*(storia or []), messaggio_utente(domanda, giocatore)],
+        max_tokens=ANALYST_MAX_TOKENS,
+        max_turni=ANALYST_MAX_TURNI,
+    )
+
+
+def impronta_storia(storia: List[Message] | None) -> str:
+    """Hash della cronologia inviata: entra nelle chiavi di de-duplicazione e di cache."""
+    if not storia:
+        return ""
+    return hashlib.sha256(json.dumps(storia, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class AnalystClient:
+    """
+    Client asincrono per il REST API di Cortex Analyst.
+
+    - le chiamate girano su un pool di thread, non sul thread dello script Streamlit
+    - richieste identiche (stessa domanda normalizzata, giocatore e modello semantico)
+      ancora in corso condividono lo stesso Future: il doppio click non fa due chiamate
+    - con `storia` la domanda viene inviata insieme ai turni precedenti (multi-turn),
+      entro un budget fisso: la dimensione della richiesta non cresce con la sessione
+    - una Session requests condivisa riusa le connessioni HTTP keep-alive
+    - annulla chiude la connessione della richiesta, se nessun'altra sessione la aspetta
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analyst")
+        self._http = requests.Session()
+        adapter = _AdapterAnnullabile(pool_connections=1, pool_maxsize=max_workers)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+        self._inflight: dict[tuple, Future] = {}
+        self._annullate: dict[Future, threading.Event] = {}
+        # quante sessioni stanno aspettando ciascun Future (condiviso dalla de-duplicazione)
+        self._attese: dict[Future, int] = {}
+        # connessione HTTP di ciascuna richiesta partita (chiave: il suo Event di annullamento)
+        self._connessioni: dict[threading.Event, HTTPConnection] = {}
+        self._lock = threading.Lock()
+
+    def invia(
+        self,
+        domanda: str,
+        giocatore: str,
+        modello_semantico: str = FILE_MODELLO_SEMANTICO,
+        storia: List[Message] | None = None,
+    ) -> Future:
+        """
+        Avvia (o riusa, se già in corso) la chiamata ad Analyst e restituisce il Future.
+        `storia`: turni precedenti della conversazione (messaggi user/analyst alternati).
+        """
+        domanda = (domanda or "").strip()
+        if not domanda:
+            raise ValueError("La domanda è vuota.")
+
+        messaggi = messaggi_richiesta(domanda, giocatore, storia)
+        key = (normalizza_domanda(domanda), giocatore, modello_semantico, impronta_storia(messaggi[:-1]))
+        future = self._riusa(key)
+        if future is not None:
+            return future
+
+        # base URL e token si leggono qui, sul thread dello script (usa il pool Snowflake)
+        base_url, token = get_rest_auth()
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if self._riusabile(future):
+                self._attese[future] = self._attese.get(future, 0) + 1
+                return future
+
+            annullata = threading.Event()
+            future = self._executor.submit(
+                self._chiama, base_url, token, domanda, messaggi, modello_semantico, annullata
+            )
+            self._inflight[key] = future
+            self._annullate[future] = annullata
+            self._attese[future] = 1
+
+        future.add_done_callback(lambda f, k=key: self._rimuovi(k, f))
+        return future
+
+    def _riusabile(self, future: Future | None) -> bool:
+        """Il Future è ancora in corso e non annullato (da chiamare col lock preso)."""
+        if future is None or future.done():
+            return False
+        annullata = self._annullate.get(future)
+        return annullata is None or not annullata.is_set()
+
+    def _riusa(self, key: tuple) -> Future | None:
+        with self._lock:
+            future = self._inflight.get(key)
+            if not self._riusabile(future):
+                return None
+            self._attese[future] = self._attese.get(future, 0) + 1
+            return future
+
+    def annulla(self, future: Future) -> None:
+        """
+        Annulla una richiesta: se non è ancora partita non parte proprio,
+        altrimenti se ne chiude la connessione HTTP. Se altre sessioni
+        aspettano la stessa richiesta, questa continua per loro.
+        """
+        conn = None
+        with self._lock:
+            attese = self._attese.get(future, 1) - 1
+            if future in self._attese:
+                self._attese[future] = attese
+            if attese > 0:
+                return
+            annullata = self._annullate.get(future)
+            if annullata is not None:
+                annullata.set()
+                conn = self._connessioni.get(annullata)
+        future.cancel()
+        if conn is not None:
+            _interrompi(conn)
+
+    def _registra_connessione(self, annullata: threading.Event, conn: HTTPConnection) -> None:
+        with self._lock:
+            self._connessioni[annullata] = conn
+            if not annullata.is_set():
+                return
+        # annullata prima ancora di aspettare la risposta
+        _interrompi(conn)
+
+    def _rimuovi(self, key: tuple, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            self._annullate.pop(future, None)
+            self._attese.pop(future, None)
+
+    def _chiama(
+        self,
+        base_url: str,
+        token: str,
+        domanda: str,
+        messaggi: List[Message],
+        modello_semantico: str,
+        annullata: threading.Event,
+    ) -> Dict[str, Any]:
+        url = f"{base_url}/api/v2/cortex/analyst/message"
+
+        body = {
+            "messages": messaggi,
+            "semantic_model_file": modello_semantico,
+        }
+
+        headers = {
+            "Authorization": f'Snowflake Token="{token}"',
+            "Content-Type": "application/json",
+        }
+
+        _locale.registra = lambda conn: self._registra_connessione(annullata, conn)
+        try:
+            with self._http.post(url, json=body, headers=headers, timeout=TIMEOUT, stream=True) as resp:
+                request_id = resp.headers.get("X-Snowflake-Request-Id")
+
+                # leggiamo il body a pezzi così un annullamento non aspetta il download completo
+                chunks = []
+                for chunk in resp.iter_content(chunk_size=16384):
+                    if annullata.is_set():
+                        raise RichiestaAnnullata(domanda)
+                    chunks.append(chunk)
+                raw = b"".join(chunks)
+        except requests.RequestException:
+            # il socket chiuso da annulla arriva qui come errore di connessione
+            if annullata.is_set():
+                raise RichiestaAnnullata(domanda)
+            raise
+        finally:
+            _locale.registra = None
+            with self._lock:
+                self._connessioni.pop(annullata, None)
+
+        if annullata.is_set():
+            raise RichiestaAnnullata(domanda)
+
+        if resp.status_code >= 400:
+            raise RuntimeError(
+                f"Errore Cortex Analyst {resp.status_code} (request_id={request_id}):\n"
+                f"{raw.decode('utf-8', errors='replace')}"
+            )
+
+        resp_json = json.loads(raw)
+
+        resp_json["request_id"] = request_id
+        return resp_json
+
+
+@st.cache_resource(show_spinner=False)
+def get_analyst_client() -> AnalystClient:
+    """Client condiviso dal processo (pool di thread e connessioni HTTP)."""
+    return AnalystClient()
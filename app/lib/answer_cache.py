@@ -0,0 +1,182 @@
+# lib/answer_cache.py
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from .analyst_client import (
+    FILE_MODELLO_SEMANTICO,
+    impronta_storia,
+    messaggi_richiesta,
+    normalizza_domanda,
+)
+from .backend import BACKEND_SNOWFLAKE
+from .chat_history import Message
+from .games_service import data_watermark
+from .ingestion import REPO_ROOT, get_data_dir
+
+SEMANTIC_MODEL_PATH = REPO_ROOT / "scacchi_semantica.yaml"
+
+# Validità di una risposta e spazio massimo occupato dalla cache su disco
+TTL_S = float(os.environ.get("CHESS_ANALYST_CACHE_TTL_H", "168")) * 3600
+MAX_BYTES = int(float(os.environ.get("CHESS_ANALYST_CACHE_MB", "256")) * 1024 * 1024)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key         TEXT PRIMARY KEY,
+    question    TEXT NOT NULL,
+    player      TEXT NOT NULL,
+    response    TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    size_bytes  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    key         TEXT NOT NULL,
+    block_index INTEGER NOT NULL,
+    parquet     BLOB NOT NULL,
+    PRIMARY KEY (key, block_index)
+);
+CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access);
+"""
+
+
+def _db_path() -> Path:
+    return get_data_dir() / "analyst_cache.sqlite"
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(_db_path(), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def semantic_model_hash() -> str:
+    """Hash del contenuto di scacchi_semantica.yaml (lo stesso file caricato sullo stage)."""
+    return hashlib.sha256(SEMANTIC_MODEL_PATH.read_bytes()).hexdigest()
+
+
+def chiave_risposta(domanda: str, giocatore: str, storia: List[Message] | None = None) -> str:
+    """
+    Chiave di cache: domanda normalizzata + giocatore + contesto della conversazione
+    (i turni precedenti davvero inviati) + modello semantico (hash del YAML) + watermark
+    dei dati. Se cambia il modello o arrivano partite nuove la chiave cambia.
+    Il watermark si legge su Snowflake, dove gira la SQL di Analyst (esegui_sql), qualunque
+    sia il backend dell'app.
+    """
+    contesto = messaggi_richiesta(domanda, giocatore, storia)[:-1]
+    parti = [
+        normalizza_domanda(domanda),
+        giocatore,
+        impronta_storia(contesto),
+        FILE_MODELLO_SEMANTICO,
+        semantic_model_hash(),
+        data_watermark(BACKEND_SNOWFLAKE),
+    ]
+    return hashlib.sha256(json.dumps(parti).encode("utf-8")).hexdigest()
+
+
+def _to_parquet(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+def cerca(
+    domanda: str, giocatore: str, storia: List[Message] | None = None
+) -> Dict[str, Any] | None:
+    """
+    Risposta Analyst già vista per questa domanda, con i risultati delle query SQL:
+    {"response": <json Analyst>, "results": {indice_blocco: DataFrame}}. None se assente o scaduta.
+    """
+    key = chiave_risposta(domanda, giocatore, storia)
+    now = time.time()
+
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT response, created_at FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > TTL_S:
+            conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+            return None
+
+        results = {
+            int(block_index): pd.read_parquet(io.BytesIO(blob))
+            for block_index, blob in conn.execute(
+                "SELECT block_index, parquet FROM results WHERE key = ?", (key,)
+            )
+        }
+        conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {"response": json.loads(row[0]), "results": results}
+
+
+def salva(
+    domanda: str,
+    giocatore: str,
+    response: Dict[str, Any],
+    results: Dict[int, pd.DataFrame],
+    storia: List[Message] | None = None,
+) -> None:
+    """Salva risposta e risultati, poi libera spazio (scadute prima, poi le meno usate)."""
+    key = chiave_risposta(domanda, giocatore, storia)
+    response_json = json.dumps(response)
+    blobs = {i: _to_parquet(df) for i, df in results.items()}
+    size = len(response_json) + sum(len(b) for b in blobs.values())
+    if size > MAX_BYTES:
+        return
+
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, domanda, giocatore, response_json, now, now, size),
+            )
+            conn.executemany(
+                "INSERT INTO results VALUES (?, ?, ?)",
+                [(key, i, blob) for i, blob in blobs.items()],
+            )
+        _evict(conn, now)
+    finally:
+        conn.close()
+
+
+def _evict(conn: sqlite3.Connection, now: float) -> None:
+    with conn:
+        conn.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM answers WHERE created_at < ?)",
+            (now - TTL_S,),
+        )
+        conn.execute("DELETE FROM answers WHERE created_at < ?", (now - TTL_S,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM answers").fetchone()[0]
+        if total <= MAX_BYTES:
+            return
+
+        for key, size in conn.execute(
+            "SELECT key, size_bytes FROM answers ORDER BY last_access"
+        ).fetchall():
+            conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= MAX_BYTES:
+                break
@@ -0,0 +1,187 @@
+# lib/backend.py
+
+import json
+import os
+from typing import Iterator
+
+import pandas as pd
+import pyarrow as pa
+import requests
+
+BACKEND_SNOWFLAKE = "snowflake"
+BACKEND_DUCKDB = "duckdb"
+
+# Righe per batch Arrow letti da DuckDB (Snowflake sceglie da sé la dimensione dei batch)
+BATCH_ROWS = 65_536
+
+Params = dict | list | tuple | None
+
+
+def get_backend() -> str:
+    """
+    Restituisce il backend dati scelto con l'env CHESS_BACKEND:
+    - "snowflake" (default): query su CHESS_DB via snowflake.connector
+    - "duckdb": database locale costruito dai CSV Lichess (nessun credito, funziona offline)
+    """
+    backend = os.environ.get("CHESS_BACKEND", BACKEND_SNOWFLAKE).strip().lower()
+    if backend not in (BACKEND_SNOWFLAKE, BACKEND_DUCKDB):
+        raise ValueError(
+            f"CHESS_BACKEND non valido: {backend!r} (valori ammessi: snowflake, duckdb)"
+        )
+    return backend
+
+
+def downcast_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Riduce la memoria di un DataFrame: interi al tipo più piccolo che li contiene
+    e stringhe con pochi valori distinti (esiti, colori, aperture...) in category.
+    """
+    for col in df.columns:
+        serie = df[col]
+        if pd.api.types.is_integer_dtype(serie.dtype):
+            df[col] = pd.to_numeric(serie, downcast="integer")
+        elif (serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype)) and len(serie) > 0:
+            try:
+                distinti = serie.nunique(dropna=True)
+            except TypeError:
+                # valori non hashable (liste, dict da VARIANT): si lasciano com'erano
+                continue
+            if distinti <= len(serie) // 2:
+                df[col] = serie.astype("category")
+    return df
+
+
+def _empty_frame(cur) -> pa.Table:
+    nomi = [d[0] for d in (cur.description or [])]
+    return pa.table({n: pa.array([], type=pa.null()) for n in nomi})
+
+
+def _snowflake_batches(cur) -> Iterator[pa.Table]:
+    vuoto = True
+    for batch in cur.fetch_arrow_batches(force_microsecond_precision=True):
+        vuoto = False
+        yield batch
+    if vuoto:
+        yield _empty_frame(cur)
+
+
+def _standin_batches(base_url: str, query: str, params: Params) -> Iterator[pa.Table]:
+    """
+    Query sul server sostitutivo (lib.cortex_standin, CORTEX_REST_BASE_URL) al posto di
+    Snowflake: la esegue sul suo DuckDB e risponde con uno stream Arrow IPC.
+    """
+    resp = requests.post(
+        f"{base_url}/api/v2/statements",
+        data=json.dumps({"statement": query, "params": params}, default=str),
+        headers={"Content-Type": "application/json"},
+        timeout=(10, 300),
+    )
+    if resp.status_code >= 400:
+        raise RuntimeError(f"Errore SQL del server sostitutivo {resp.status_code}:\n{resp.text}")
+    reader = pa.ipc.open_stream(resp.content)
+    vuoto = True
+    for batch in reader:
+        vuoto = False
+        yield pa.Table.from_batches([batch])
+    if vuoto:
+        yield reader.schema.empty_table()
+
+
+def _to_pandas(table: pa.Table, downcast: bool) -> pd.DataFrame:
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    # Snowflake restituisce gli identificatori non quotati in maiuscolo (DuckDB no)
+    df.columns = [str(c).upper() for c in df.columns]
+    return downcast_dtypes(df) if downcast else df
+
+
+def iter_query_batches(
+    query: str,
+    params: Params = None,
+    *,
+    max_rows: int | None = None,
+    downcast: bool = False,
+    backend: str | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Esegue una query e restituisce il risultato a pezzi, un DataFrame per batch Arrow,
+    senza mai passare dalle tuple del DBAPI. Si ferma dopo `max_rows` righe.
+    Serve per mostrare risultati grandi man mano che arrivano.
+    """
+    backend = backend or get_backend()
+    letti = 0
+
+    def _limita(batches: Iterator[pa.Table]) -> Iterator[pd.DataFrame]:
+        nonlocal letti
+        for table in batches:
+            if max_rows is not None:
+                table = table.slice(0, max(max_rows - letti, 0))
+            letti += table.num_rows
+            yield _to_pandas(table, downcast)
+            if max_rows is not None and letti >= max_rows:
+                return
+
+    if backend == BACKEND_DUCKDB:
+        from .local_backend import iter_local_batches
+
+        yield from _limita(iter_local_batches(query, params, BATCH_ROWS))
+        return
+
+    from .snowflake_utils import REST_BASE_URL, sf_cursor
+
+    if REST_BASE_URL:
+        yield from _limita(_standin_batches(REST_BASE_URL, query, params))
+        return
+
+    with sf_cursor() as cur:
+        cur.execute(query, params or None)
+        yield from _limita(_snowflake_batches(cur))
+
+
+def run_query(
+    query: str,
+    params: Params = None,
+    *,
+    max_rows: int | None = None,
+    downcast: bool = False,
+    backend: str | None = None,
+) -> pd.DataFrame:
+    """
+    Esegue una query (placeholder stile %(nome)s, o %s con params lista) sul backend
+    configurato (o su `backend`) e restituisce un DataFrame con i nomi colonna in maiuscolo.
+
+    Il risultato arriva sempre come batch Arrow, convertiti in pandas una volta sola.
+    Con `max_rows` si leggono al massimo tante righe (df.attrs["truncated"] dice se ce n'erano
+    altre); con `downcast` si riducono i tipi (vedi downcast_dtypes).
+    """
+    backend = backend or get_backend()
+
+    def _raccogli(batches: Iterator[pa.Table]) -> pd.DataFrame:
+        tables, letti, troncato = [], 0, False
+        for table in batches:
+            if max_rows is not None and letti + table.num_rows > max_rows:
+                table = table.slice(0, max_rows - letti)
+                troncato = True
+            tables.append(table)
+            letti += table.num_rows
+            if troncato:
+                break
+        df = _to_pandas(pa.concat_tables(tables, promote_options="permissive"), downcast)
+        df.attrs["truncated"] = troncato
+        return df
+
+    if backend == BACKEND_DUCKDB:
+        from .local_backend import iter_local_batches
+
+        return _raccogli(iter_local_batches(query, params, BATCH_ROWS))
+
+    from .snowflake_utils import REST_BASE_URL, run_with_reconnect
+
+    if REST_BASE_URL:
+        return _raccogli(_standin_batches(REST_BASE_URL, query, params))
+
+    def _fetch(conn) -> pd.DataFrame:
+        with conn.cursor() as cur:
+            cur.execute(query, params or None)
+            return _raccogli(_snowflake_batches(cur))
+
+    return run_with_reconnect(_fetch)
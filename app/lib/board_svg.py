@@ -0,0 +1,84 @@
+# lib/board_svg.py
+#
+# Scacchiera disegnata in locale (SVG di python-chess) a partire dalle mosse salvate:
+# niente rete, funziona anche per partite che non sono su Lichess.
+
+from functools import lru_cache
+from typing import List, Tuple
+
+import chess
+import chess.svg
+import pandas as pd
+import streamlit as st
+
+from .backend import run_query
+
+# SVG tenuti in memoria: (partita, semimossa) -> posizione -> SVG per orientamento e dimensione
+MAX_SVG = 4096
+# Partite di cui si tengono le posizioni già rigiocate
+MAX_PARTITE = 512
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def mosse_partita(game_id: str) -> Tuple[str, ...] | None:
+    """Mosse SAN della partita (LICHESS_GAMES.moves); None se la partita non c'è."""
+    df = run_query(
+        "SELECT moves AS MOVES FROM CHESS_DB.RAW.LICHESS_GAMES WHERE id = %(id)s LIMIT 1",
+        {"id": game_id},
+    )
+    if df.empty:
+        return None
+    moves = df["MOVES"].iloc[0]
+    return tuple(moves.split()) if isinstance(moves, str) and not pd.isna(moves) else ()
+
+
+@lru_cache(maxsize=MAX_PARTITE)
+def posizioni(mosse: Tuple[str, ...]) -> List[Tuple[str, str | None, str | None]]:
+    """
+    Replay della partita: per ogni semimossa (0 = posizione iniziale) la FEN,
+    l'ultima mossa in UCI e la mossa in notazione numerata ("12. Nf3", "12... Nf6").
+    Ci si ferma alla prima mossa illeggibile.
+    """
+    board = chess.Board()
+    risultato = [(board.fen(), None, None)]
+    for san in mosse:
+        numero = board.fullmove_number
+        etichetta = f"{numero}. {san}" if board.turn == chess.WHITE else f"{numero}... {san}"
+        try:
+            move = board.push_san(san)
+        except ValueError:
+            break
+        risultato.append((board.fen(), move.uci(), etichetta))
+    return risultato
+
+
+@lru_cache(maxsize=MAX_SVG)
+def _svg(fen: str, ultima_mossa: str | None, orientamento: bool, size: int) -> str:
+    board = chess.Board(fen)
+    return chess.svg.board(
+        board,
+        orientation=orientamento,
+        lastmove=chess.Move.from_uci(ultima_mossa) if ultima_mossa else None,
+        check=board.king(board.turn) if board.is_check() else None,
+        size=size,
+    )
+
+
+def svg_partita(
+    game_id: str,
+    ply: int,
+    orientamento: bool = chess.WHITE,
+    size: int = 450,
+) -> Tuple[str, int, str | None] | None:
+    """
+    SVG della partita dopo `ply` semimosse (limitato alla lunghezza della partita).
+    Restituisce (svg, numero di semimosse della partita, mossa appena giocata);
+    None se la partita non si trova. Gli SVG già disegnati arrivano dalla cache.
+    """
+    mosse = mosse_partita(game_id)
+    if mosse is None:
+        return None
+    elenco = posizioni(mosse)
+    ply = max(0, min(int(ply), len(elenco) - 1))
+    fen, ultima_mossa, etichetta = elenco[ply]
+    return _svg(fen, ultima_mossa, orientamento, size), len(elenco) - 1, etichetta
@@ -0,0 +1,125 @@
+# lib/chat_history.py
+
+import json
+import re
+from typing import Any, Dict, List
+
+# Budget (stimato in token) della cronologia inviata a ogni richiesta
+AGENT_MAX_TOKENS = 6000
+ANALYST_MAX_TOKENS = 2000
+# Turni precedenti (coppie domanda/risposta) che Analyst riceve al massimo
+ANALYST_MAX_TURNI = 3
+# Spazio per il riassunto dei turni più vecchi, e per ciascuno dei turni riassunti
+RIASSUNTO_MAX_TOKENS = 600
+RIASSUNTO_MAX_CHARS_TURNO = 200
+
+Message = Dict[str, Any]
+
+
+def stima_token(testo: str) -> int:
+    """Stima grossolana (~4 caratteri per token), sufficiente per un budget."""
+    return (len(testo or "") + 3) // 4
+
+
+def testo_messaggio(messaggio: Message) -> str:
+    """Tutto il testo di un messaggio (blocchi text e sql)."""
+    parti = []
+    for blocco in messaggio.get("content", []) or []:
+        if blocco.get("type") == "text":
+            parti.append(blocco.get("text", ""))
+        elif blocco.get("type") == "sql":
+            parti.append(blocco.get("statement", ""))
+    return "\n".join(parti)
+
+
+def token_messaggio(messaggio: Message) -> int:
+    return stima_token(json.dumps(messaggio.get("content", []), ensure_ascii=False))
+
+
+def _prima_frase(testo: str, max_chars: int) -> str:
+    testo = " ".join((testo or "").split())
+    frase = re.split(r"(?<=[.!?])\s", testo, maxsplit=1)[0]
+    return frase if len(frase) <= max_chars else frase[: max_chars - 1] + "…"
+
+
+def riassumi(messaggi: List[Message], max_tokens: int = RIASSUNTO_MAX_TOKENS) -> str:
+    """
+    Riassunto estrattivo (nessuna chiamata LLM) dei turni tolti dalla cronologia:
+    per ogni messaggio la prima frase, partendo dai più recenti finché c'è budget.
+    """
+    righe: List[str] = []
+    usati = 0
+    for messaggio in reversed(messaggi):
+        chi = "Utente" if messaggio.get("role") == "user" else "Assistente"
+        riga = f"- {chi}: {_prima_frase(testo_messaggio(messaggio), RIASSUNTO_MAX_CHARS_TURNO)}"
+        costo = stima_token(riga)
+        if usati + costo > max_tokens:
+            break
+        righe.append(riga)
+        usati += costo
+    return "\n".join(reversed(righe))
+
+
+def compatta(
+    messaggi: List[Message],
+    max_tokens: int,
+    max_turni: int | None = None,
+    riassunto: bool = True,
+) -> List[Message]:
+    """
+    Cronologia da inviare: gli ultimi messaggi che stanno in `max_tokens` (e al massimo
+    `max_turni` turni precedenti all'ultimo messaggio), sempre a partire da un messaggio
+    "user" così i ruoli restano alternati. I messaggi tolti, se `riassunto`, diventano un
+    breve riassunto aggiunto in testa al primo messaggio tenuto.
+
+    L'ultimo messaggio (la domanda corrente) viene sempre tenuto.
+    """
+    if not messaggi:
+        return []
+
+    tenuti = [messaggi[-1]]
+    usati = token_messaggio(messaggi[-1])
+    turni = 0
+    for messaggio in reversed(messaggi[:-1]):
+        costo = token_messaggio(messaggio)
+        if usati + costo > max_tokens:
+            break
+        if messaggio.get("role") == "user":
+            if max_turni is not None and turni >= max_turni:
+                break
+            turni += 1
+        tenuti.append(messaggio)
+        usati += costo
+    tenuti.reverse()
+
+    # si parte sempre da una domanda dell'utente
+    while len(tenuti) > 1 and tenuti[0].get("role") != "user":
+        tenuti.pop(0)
+
+    tolti = messaggi[: len(messaggi) - len(tenuti)]
+    if not tolti or not riassunto:
+        return tenuti
+
+    testo_riassunto = riassumi(tolti, min(RIASSUNTO_MAX_TOKENS, max(max_tokens - usati, 0)))
+    if not testo_riassunto:
+        return tenuti
+
+    primo = tenuti[0]
+    prefisso = {
+        "type": "text",
+        "text": f"Contesto della conversazione precedente (riassunto):\n{testo_riassunto}\n\n",
+    }
+    return [{**primo, "content": [prefisso, *(primo.get("content", []) or [])]}, *tenuti[1:]]
+
+
+def messaggio_analyst(risposta: Dict[str, Any]) -> Message:
+    """
+    Risposta di Analyst come messaggio "analyst" per la richiesta successiva:
+    solo testo e SQL (i suggerimenti non servono come contesto).
+    """
+    contenuto = [
+        b
+        for b in ((risposta.get("message", {}) or {}).get("content", []) or [])
+        if b.get("type") in ("text", "sql")
+    ]
+    return {"role": "analyst", "content": contenuto}
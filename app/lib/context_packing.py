@@ -0,0 +1,171 @@
+# lib/context_packing.py
+
+import re
+from typing import Dict, List
+
+from .chat_history import stima_token
+
+# Token (stimati) riservati al contesto dei PDF per ogni modello: i modelli piccoli
+# hanno una finestra più corta e rispondono più in fretta con meno testo
+CONTEXT_BUDGET = {
+    "mistral-large2": 12000,
+    "llama3.1-70b": 8000,
+    "llama3.1-8b": 3000,
+}
+DEFAULT_BUDGET = 4000
+
+# Quasi-duplicati: Jaccard esatto sugli shingle di parole (i chunk sono al massimo una
+# decina, confrontare gli insiemi costa meno che calcolarne le firme MinHash)
+SHINGLE_WORDS = 5
+SOGLIA_DUPLICATO = 0.8
+
+# Sovrapposizione minima (in caratteri) per unire due chunk consecutivi dello stesso PDF
+MIN_OVERLAP_CHARS = 40
+# Sotto questo spazio residuo non vale la pena troncare un chunk per farcelo stare
+MIN_TOKENS_TRONCATO = 150
+
+
+def budget_contesto(model: str) -> int:
+    return CONTEXT_BUDGET.get(model, DEFAULT_BUDGET)
+
+
+def shingles(testo: str, k: int = SHINGLE_WORDS) -> set[str]:
+    """Shingle di k parole (minuscole, punteggiatura ignorata)."""
+    parole = re.findall(r"\w+", (testo or "").lower())
+    if len(parole) < k:
+        return {" ".join(parole)} if parole else set()
+    return {" ".join(parole[i:i + k]) for i in range(len(parole) - k + 1)}
+
+
+def somiglianza(shingle_a: set[str], shingle_b: set[str]) -> float:
+    """Similarità di Jaccard tra gli shingle di due testi."""
+    if not shingle_a and not shingle_b:
+        return 1.0
+    comuni = len(shingle_a & shingle_b)
+    return comuni / (len(shingle_a) + len(shingle_b) - comuni)
+
+
+def _sovrapposizione(a: str, b: str) -> int:
+    """Lunghezza del più lungo suffisso di `a` che è anche prefisso di `b` (0 se troppo corto)."""
+    if len(a) < MIN_OVERLAP_CHARS or len(b) < MIN_OVERLAP_CHARS:
+        return 0
+    inizio_b = b[:MIN_OVERLAP_CHARS]
+    pos = a.find(inizio_b)
+    while pos >= 0:
+        lunghezza = len(a) - pos
+        if lunghezza <= len(b) and b.startswith(a[pos:]):
+            return lunghezza
+        pos = a.find(inizio_b, pos + 1)
+    return 0
+
+
+def _unisci_adiacenti(chunks: List[Dict]) -> List[Dict]:
+    """
+    Unisce i chunk dello stesso PDF che si sovrappongono (il chunking dei PDF lascia
+    una parte comune tra un pezzo e il successivo): il testo comune compare una volta sola.
+    Il chunk unito prende la posizione del migliore dei due.
+    """
+    risultato: List[Dict] = []
+    for chunk in chunks:
+        testo = chunk.get("chunk", "") or ""
+        unito = False
+        for precedente in risultato:
+            if precedente.get("relative_path") != chunk.get("relative_path"):
+                continue
+            base = precedente["chunk"]
+            n = _sovrapposizione(base, testo)
+            if n:
+                precedente["chunk"] = base + testo[n:]
+                unito = True
+                break
+            n = _sovrapposizione(testo, base)
+            if n:
+                precedente["chunk"] = testo + base[n:]
+                unito = True
+                break
+        if not unito:
+            risultato.append({**chunk, "chunk": testo})
+    return risultato
+
+
+def _tronca(testo: str, max_tokens: int) -> str:
+    """Taglia il testo entro max_tokens, all'ultima fine frase se possibile."""
+    max_chars = max_tokens * 4
+    if len(testo) <= max_chars:
+        return testo
+    taglio = testo[:max_chars]
+    fine_frase = max(taglio.rfind(". "), taglio.rfind(".\n"))
+    if fine_frase > max_chars // 2:
+        taglio = taglio[: fine_frase + 1]
+    return taglio.rstrip() + " […]"
+
+
+def impacchetta_contesto(chunks: List[Dict], model: str) -> List[Dict]:
+    """
+    Sceglie i chunk da mettere nel prompt, nell'ordine di rilevanza di Cortex Search:
+    1. scarta i quasi-duplicati (Jaccard degli shingle >= SOGLIA_DUPLICATO)
+    2. unisce i pezzi sovrapposti dello stesso PDF
+    3. tiene i chunk finché stanno nel budget del modello (l'ultimo eventualmente troncato)
+    """
+    unici: List[Dict] = []
+    visti: List[set[str]] = []
+    for chunk in chunks:
+        insieme = shingles(chunk.get("chunk", ""))
+        if any(somiglianza(insieme, v) >= SOGLIA_DUPLICATO for v in visti):
+            continue
+        visti.append(insieme)
+        unici.append(chunk)
+
+    budget = budget_contesto(model)
+    scelti: List[Dict] = []
+    usati = 0
+    for chunk in _unisci_adiacenti(unici):
+        costo = stima_token(chunk["chunk"])
+        if usati + costo <= budget:
+            scelti.append(chunk)
+            usati += costo
+            continue
+        residuo = budget - usati
+        if residuo >= MIN_TOKENS_TRONCATO:
+            scelti.append({**chunk, "chunk": _tronca(chunk["chunk"], residuo)})
+        break
+    return scelti
+
+
+def build_prompt(question: str, chunks: list[dict], model: str) -> tuple[str, str]:
+    """
+    Costruisce il prompt per il modello LLM:
+    - include contesto estratto dai PDF (chunks), senza doppioni ed entro il budget del modello
+    - istruisce il modello a rispondere in italiano e solo se il contesto basta
+    """
+    chunks = impacchetta_contesto(chunks, model)
+    context_parts = []
+    for i, r in enumerate(chunks):
+        context_parts.append(
+            f"Documento {i+1} ({r['relative_path']}):\n{r['chunk']}"
+        )
+    context_str = "\n\n".join(context_parts)
+
+    prompt = f"""
+[INST]
+Sei un assistente di scacchi specializzato in aperture, soprattutto Siciliana Najdorf. Ti viene fornito un contesto estratto da libri PDF
+e appunti caricati in Snowflake.
+
+Usa **solo** le informazioni nel contesto per rispondere alla domanda dell'utente.
+Se le informazioni non sono sufficienti, rispondi soltanto:
+"Non so rispondere a questa domanda con i dati che ho."
+
+Rispondi sempre in italiano, in modo chiaro e comprensibile per un giocatore
+tra 1700 e 2300 Elo.
+
+<context>
+{context_str}
+</context>
+
+<question>
+{question}
+</question>
+[/INST]
+Risposta (in italiano):
+"""
+    return prompt, context_str
@@ -0,0 +1,98 @@
+# lib/cortex_complete.py
+
+import json
+from typing import Iterator
+
+import requests
+
+from .backend import BACKEND_SNOWFLAKE, run_query
+from .snowflake_utils import get_rest_auth
+from .sse import iter_sse
+
+TIMEOUT = (10, 300)  # (connect, read): il read vale tra un token e l'altro
+
+
+class CompletionNonDisponibile(RuntimeError):
+    """L'endpoint REST di COMPLETE ha rifiutato la richiesta (si può ripiegare sulla SQL)."""
+
+
+def complete_sql(model: str, prompt: str) -> str:
+    """
+    SNOWFLAKE.CORTEX.COMPLETE via SQL, su una connessione del pool condiviso:
+    aspetta la risposta completa.
+    """
+    df = run_query(
+        "SELECT SNOWFLAKE.CORTEX.COMPLETE(%(model)s, %(prompt)s) AS RESULT",
+        {"model": model, "prompt": prompt},
+        backend=BACKEND_SNOWFLAKE,
+    )
+    return df["RESULT"].iloc[0]
+
+
+class CompletionStream:
+    """
+    Risposta in streaming di /api/v2/cortex/inference:complete.
+
+    Iterandola si ottengono i pezzi di testo appena arrivano. close() (o l'uscita dal
+    `with`) chiude la connessione HTTP: la generazione lato server si interrompe.
+    """
+
+    def __init__(self, resp: requests.Response):
+        self._resp = resp
+        self.closed = False
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for _, data in iter_sse(self._resp.iter_content(chunk_size=None)):
+                if not data or data.strip() == "[DONE]":
+                    continue
+                try:
+                    payload = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                for choice in payload.get("choices", []) or []:
+                    delta = choice.get("delta", {}) or {}
+                    testo = delta.get("content") or delta.get("text")
+                    if testo:
+                        yield testo
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._resp.close()
+
+    def __enter__(self) -> "CompletionStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def stream_complete(model: str, prompt: str) -> CompletionStream:
+    """
+    Avvia COMPLETE in streaming (SSE) sul REST API di Cortex.
+    Solleva CompletionNonDisponibile se l'endpoint risponde con un errore.
+    """
+    base_url, token = get_rest_auth()
+    resp = requests.post(
+        f"{base_url}/api/v2/cortex/inference:complete",
+        json={
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+        },
+        headers={
+            "Authorization": f'Snowflake Token="{token}"',
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+        },
+        stream=True,
+        timeout=TIMEOUT,
+    )
+    if resp.status_code >= 400:
+        dettaglio = resp.text
+        resp.close()
+        raise CompletionNonDisponibile(f"Errore Cortex COMPLETE {resp.status_code}:\n{dettaglio}")
+    return CompletionStream(resp)
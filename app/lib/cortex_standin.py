@@ -0,0 +1,426 @@
+# lib/cortex_standin.py
+#
+# Server locale che si sostituisce a Snowflake/Cortex per test di carico e di latenza:
+#   POST /api/v2/cortex/analyst/message                           Cortex Analyst (JSON)
+#   POST /api/v2/databases/.../cortex-search-services/...:query   Cortex Search (JSON)
+#   POST /api/v2/cortex/inference:complete                        COMPLETE in streaming (SSE)
+#   POST /api/v2/cortex/threads                                   thread dell'agente
+#   POST /api/v2/databases/.../agents/...:run                     Cortex Agent in streaming (SSE)
+#   POST /api/v2/statements                                       SQL sul database DuckDB locale
+#                                                                 (risultato in Arrow IPC)
+#
+# Le risposte sono fixture (o registrazioni in --fixtures), con latenza, velocità dello
+# streaming ed errori configurabili. L'app lo usa con CORTEX_REST_BASE_URL (vedi
+# lib.snowflake_utils): anche le query "Snowflake" passano da /api/v2/statements.
+#
+# Uso (dalla cartella app/):
+#   python -m lib.cortex_standin --port 8765 --latency-ms 200 --tokens-per-s 40 --error-rate 0.02
+#   CORTEX_REST_BASE_URL=http://127.0.0.1:8765 streamlit run 1_Chess_Game_Explorer.py
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import pyarrow as pa
+
+DEFAULT_PORT = 8765
+
+ANALYST_TEXT = (
+    "This is our interpretation of your question: which openings has the player "
+    "played most often, and with what results?"
+)
+ANALYST_SQL = """
+SELECT
+    opening_name,
+    COUNT(*) AS games,
+    SUM(is_win) AS wins,
+    ROUND(100.0 * SUM(is_win) / COUNT(*), 1) AS win_pct
+FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI
+WHERE player_name = 'spellbind'
+GROUP BY opening_name
+ORDER BY games DESC
+LIMIT 10
+""".strip()
+
+AGENT_SQL = """
+SELECT id AS game_id, game_date, opening_name, my_result, opponent_name, opponent_rating
+FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI
+WHERE player_name = 'spellbind'
+ORDER BY game_date DESC, id DESC
+LIMIT 10
+""".strip()
+
+COMPLETE_TEXT = (
+    "Nella Siciliana Najdorf la mossa 5...a6 controlla la casa b5, impedisce i salti di "
+    "cavallo e alfiere e prepara ...e5 o ...b5 con gioco sul lato di donna.\n\n"
+    "Contro 6.Bg5 la risposta principale è 6...e6, mentre contro l'Attacco Inglese "
+    "(6.Be3) il Nero sceglie di solito tra 6...e5 e 6...e6, con piani diversi per il "
+    "controllo della casa d5."
+)
+
+AGENT_TEXT = (
+    "Ecco le ultime dieci partite di spellbind. La maggior parte sono blitz; "
+    "nella tabella trovi apertura, risultato e avversario di ciascuna."
+)
+
+SEARCH_CHUNKS = [
+    "The Najdorf Variation arises after 1.e4 c5 2.Nf3 d6 3.d4 cxd4 4.Nxd4 Nf6 5.Nc3 a6. "
+    "Black's fifth move prepares ...e5 without allowing Nb5 and keeps the option of ...b5.",
+    "Against 6.Bg5 the main line is 6...e6 7.f4, when Black can choose the Poisoned Pawn "
+    "with 7...Qb6 or the more solid 7...Be7 followed by ...Qc7 and ...Nbd7.",
+    "The English Attack 6.Be3 followed by f3, Qd2, g4 and O-O-O leads to opposite-side "
+    "castling; Black's counterplay comes from ...b5-b4 and pressure on the c-file.",
+    "After 6.Be2 e5 7.Nb3 Be7 the position resembles the Boleslavsky structure: "
+    "the d5 square is the key strategic battleground for both sides.",
+    "The Fischer-Sozin Attack 6.Bc4 aims the bishop at e6 and f7; Black usually answers "
+    "with 6...e6 and ...b5, chasing the bishop and gaining space on the queenside.",
+    "With 6.h3 White prepares g4 before committing the bishops. Black can react with "
+    "6...e5 7.Nde2 h5, or transpose into Scheveningen-like structures with 6...e6.",
+    "6.f4 is a direct attempt to exploit the kingside: 6...e5 7.Nf3 Nbd7 8.a4 Be7 is a "
+    "solid reply, fighting for the e5 square and keeping the pieces flexible.",
+    "In the Poisoned Pawn 8.Qd2 Qxb2 9.Rb1 Qa3 Black grabs material and must survive a "
+    "fierce initiative; precise defence has kept the line theoretically sound.",
+    "6.g3 fianchetto: White plays positionally, the bishop on g2 supports e4 and the "
+    "d5 square. Black often develops with ...e5, ...Be7 and ...O-O.",
+    "The 6.Be3 Ng4 line immediately challenges the bishop: after 7.Bg5 h6 8.Bh4 g5 "
+    "9.Bg3 Bg7 Black obtains active play at the cost of some kingside weaknesses.",
+]
+
+
+@dataclass
+class StandinConfig:
+    """Comportamento del server: latenza, velocità dello streaming, errori, fixture."""
+
+    latency_ms: float = 150.0  # attesa prima della risposta (tempo al primo byte)
+    jitter_ms: float = 50.0  # variazione casuale della latenza (uniforme, +/-)
+    tokens_per_s: float = 40.0  # velocità dei delta SSE (0 = tutto subito)
+    error_rate: float = 0.0  # frazione di richieste che falliscono
+    error_status: int = 503  # status HTTP delle richieste fallite
+    fixtures_dir: Path | None = None  # fixture/registrazioni che sostituiscono quelle di default
+
+
+def _fixture(config: StandinConfig, nome: str) -> str | None:
+    """Contenuto di una fixture in --fixtures (None se non c'è)."""
+    if config.fixtures_dir is None:
+        return None
+    path = config.fixtures_dir / nome
+    return path.read_text(encoding="utf-8") if path.exists() else None
+
+
+def _parole(testo: str) -> List[str]:
+    """Il testo diviso in token (parole con lo spazio che le segue), come i delta di un LLM."""
+    return re.findall(r"\S+\s*|\s+", testo)
+
+
+def _sse(event: str | None, data: Any) -> bytes:
+    testo = data if isinstance(data, str) else json.dumps(data, default=str)
+    righe = ([f"event: {event}"] if event else []) + [f"data: {riga}" for riga in testo.split("\n")]
+    return ("\n".join(righe) + "\n\n").encode("utf-8")
+
+
+def _sql_arrow(statement: str, params: Dict[str, Any] | List[Any] | None = None) -> pa.Table:
+    """Esegue una query sul database DuckDB locale (lib.local_backend) e la restituisce in Arrow."""
+    from .local_backend import iter_local_batches
+
+    return pa.concat_tables(
+        list(iter_local_batches(statement, params)), promote_options="permissive"
+    )
+
+
+def _result_set(table: pa.Table) -> Dict[str, Any]:
+    """Tabella Arrow -> result_set nel formato dello SQL API di Snowflake (come nel Cortex Agent)."""
+    tipi = []
+    for campo in table.schema:
+        if pa.types.is_integer(campo.type) or pa.types.is_floating(campo.type) or pa.types.is_decimal(campo.type):
+            tipi.append("fixed")
+        elif pa.types.is_date(campo.type):
+            tipi.append("date")
+        else:
+            tipi.append("text")
+    righe = [[None if v is None else str(v) for v in riga.values()] for riga in table.to_pylist()]
+    return {
+        "resultSetMetaData": {
+            "statementHandle": str(uuid.uuid4()),
+            "rowType": [{"name": c.name.upper(), "type": t} for c, t in zip(table.schema, tipi)],
+        },
+        "data": righe,
+    }
+
+
+def installa_funzioni_cortex() -> None:
+    """
+    Funzioni di Snowflake usate nelle query dell'app, rifatte come macro DuckDB:
+    SNOWFLAKE.CORTEX.COMPLETE risponde con la fixture, TRANSLATE restituisce il testo.
+    """
+    from .local_backend import get_duckdb_connection
+
+    con = get_duckdb_connection()
+    if con.execute("SELECT COUNT(*) FROM duckdb_databases() WHERE database_name = 'SNOWFLAKE'").fetchone()[0]:
+        return
+    con.execute("ATTACH ':memory:' AS SNOWFLAKE")
+    con.execute("CREATE SCHEMA SNOWFLAKE.CORTEX")
+    testo = COMPLETE_TEXT.replace("'", "''")
+    con.execute(f"CREATE MACRO SNOWFLAKE.CORTEX.COMPLETE(model, prompt) AS '{testo}'")
+    con.execute("CREATE MACRO SNOWFLAKE.CORTEX.TRANSLATE(testo, da, a) AS testo")
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Una richiesta: attesa (latenza), eventuale errore iniettato, poi la risposta della rotta."""
+
+    server: "StandinServer"
+    protocol_version = "HTTP/1.0"  # la connessione si chiude a fine risposta: ok per lo SSE
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # ---------- risposte ----------
+
+    def _json(self, status: int, body: Any) -> None:
+        payload = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Snowflake-Request-Id", str(uuid.uuid4()))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, eventi: Iterator[bytes]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Snowflake-Request-Id", str(uuid.uuid4()))
+        self.end_headers()
+        try:
+            for evento in eventi:
+                self.wfile.write(evento)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # il client ha chiuso lo stream (es. nuova domanda): ci si ferma qui
+
+    def _pausa_token(self) -> None:
+        tps = self.server.config.tokens_per_s
+        if tps > 0:
+            time.sleep(1 / tps)
+
+    # ---------- dispatch ----------
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/health":
+            self._json(200, {"status": "ok", "requests": self.server.richieste})
+        else:
+            self._json(404, {"message": f"Rotta sconosciuta: GET {self.path}"})
+
+    def do_POST(self) -> None:
+        lunghezza = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(lunghezza) or b"{}")
+        except json.JSONDecodeError:
+            self._json(400, {"message": "Body JSON non valido."})
+            return
+
+        config = self.server.config
+        self.server.conta()
+        time.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000)
+        if random.random() < config.error_rate:
+            self._json(config.error_status, {"message": "Errore iniettato dal server sostitutivo.", "code": "STANDIN"})
+            return
+
+        path = self.path.split("?", 1)[0]
+        try:
+            if path == "/api/v2/cortex/analyst/message":
+                self._analyst(body)
+            elif re.fullmatch(r"/api/v2/databases/.+/cortex-search-services/[^/]+:query", path):
+                self._search(body)
+            elif path == "/api/v2/cortex/inference:complete":
+                self._complete(body)
+            elif path == "/api/v2/cortex/threads":
+                self._json(200, {"thread_id": str(uuid.uuid4())})
+            elif re.fullmatch(r"/api/v2/databases/.+/agents/[^/]+:run", path):
+                self._agent(body)
+            elif path == "/api/v2/statements":
+                self._statement(body)
+            else:
+                self._json(404, {"message": f"Rotta sconosciuta: POST {path}"})
+        except Exception as e:
+            self._json(500, {"message": f"{type(e).__name__}: {e}"})
+
+    # ---------- rotte ----------
+
+    def _analyst(self, body: Dict[str, Any]) -> None:
+        registrata = _fixture(self.server.config, "analyst.json")
+        if registrata is not None:
+            self._json(200, json.loads(registrata))
+            return
+        self._json(
+            200,
+            {
+                "message": {
+                    "role": "analyst",
+                    "content": [
+                        {"type": "text", "text": ANALYST_TEXT},
+                        {"type": "sql", "statement": ANALYST_SQL},
+                    ],
+                },
+                "warnings": [],
+            },
+        )
+
+    def _search(self, body: Dict[str, Any]) -> None:
+        registrata = _fixture(self.server.config, "search.json")
+        chunks = json.loads(registrata) if registrata is not None else [
+            {
+                "chunk": testo,
+                "file_url": f"standin://najdorf_{i + 1}.pdf",
+                "relative_path": f"najdorf_{i + 1}.pdf",
+                "language": "English",
+            }
+            for i, testo in enumerate(SEARCH_CHUNKS)
+        ]
+        limit = int(body.get("limit") or 10)
+        self._json(200, {"results": chunks[:limit], "request_id": str(uuid.uuid4())})
+
+    def _complete(self, body: Dict[str, Any]) -> None:
+        testo = _fixture(self.server.config, "complete.txt") or COMPLETE_TEXT
+
+        def eventi() -> Iterator[bytes]:
+            for parola in _parole(testo):
+                self._pausa_token()
+                yield _sse(None, {"choices": [{"delta": {"content": parola}}]})
+            yield _sse(None, "[DONE]")
+
+        self._stream(eventi())
+
+    def _agent(self, body: Dict[str, Any]) -> None:
+        registrata = _fixture(self.server.config, "agent.sse")
+        if registrata is not None:
+            # registrazione SSE: si rimanda un evento alla volta, con il ritmo dei token
+            def eventi_registrati() -> Iterator[bytes]:
+                for blocco in re.split(r"\r?\n\r?\n", registrata.strip()):
+                    self._pausa_token()
+                    yield (blocco + "\n\n").encode("utf-8")
+
+            self._stream(eventi_registrati())
+            return
+
+        testo = _fixture(self.server.config, "agent.txt") or AGENT_TEXT
+        result_set = _result_set(_sql_arrow(AGENT_SQL))
+        tool_use_id = f"toolu_{uuid.uuid4().hex[:12]}"
+        parent = int(body.get("parent_message_id") or 0)
+
+        def eventi() -> Iterator[bytes]:
+            yield _sse("metadata", {"metadata": {"role": "user", "message_id": parent + 1}})
+            yield _sse("response.status", {"status": "planning", "message": "Pianificazione"})
+            yield _sse(
+                "response.tool_use",
+                {"tool_use_id": tool_use_id, "name": "partite_giocatore", "input": {"query": "ultime partite"}},
+            )
+            yield _sse(
+                "response.tool_result",
+                {
+                    "tool_use_id": tool_use_id,
+                    "name": "partite_giocatore",
+                    "status": "success",
+                    "content": [{"type": "json", "json": {"sql": AGENT_SQL, "result_set": result_set}}],
+                },
+            )
+            for parola in _parole(testo):
+                self._pausa_token()
+                yield _sse("response.text.delta", {"content_index": 1, "text": parola})
+            yield _sse("metadata", {"metadata": {"role": "assistant", "message_id": parent + 2}})
+            yield _sse("response", {"role": "assistant", "content": [{"type": "text", "text": testo}]})
+            yield _sse("done", "[DONE]")
+
+        self._stream(eventi())
+
+    def _statement(self, body: Dict[str, Any]) -> None:
+        statement = body.get("statement") or ""
+        if not statement.strip():
+            self._json(400, {"message": "statement mancante."})
+            return
+        table = _sql_arrow(statement, body.get("params"))
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        payload = sink.getvalue().to_pybytes()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.apache.arrow.stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StandinServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer con la configurazione e un contatore delle richieste."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: StandinConfig, verbose: bool = False):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.verbose = verbose
+        self.richieste = 0
+        self._lock = threading.Lock()
+
+    def conta(self) -> None:
+        with self._lock:
+            self.richieste += 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def avvia_in_background(config: StandinConfig | None = None, port: int = 0) -> StandinServer:
+    """Avvia il server su un thread (port 0 = porta libera qualsiasi) e lo restituisce."""
+    installa_funzioni_cortex()
+    server = StandinServer(("127.0.0.1", port), config or StandinConfig())
+    threading.Thread(target=server.serve_forever, name="cortex-standin", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Server locale al posto di Snowflake/Cortex.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="latenza prima della risposta")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="variazione casuale della latenza")
+    parser.add_argument("--tokens-per-s", type=float, default=40.0, help="velocità dei delta SSE (0 = subito)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="frazione di richieste in errore")
+    parser.add_argument("--error-status", type=int, default=503, help="status HTTP degli errori iniettati")
+    parser.add_argument("--fixtures", type=Path, default=None, help="cartella con analyst.json, search.json, complete.txt, agent.sse/agent.txt")
+    parser.add_argument("--verbose", action="store_true", help="log di ogni richiesta")
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_s=args.tokens_per_s,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        fixtures_dir=args.fixtures,
+    )
+    installa_funzioni_cortex()
+    server = StandinServer((args.host, args.port), config, verbose=args.verbose)
+    print(f"Server sostitutivo di Cortex su {server.base_url} (Ctrl+C per fermarlo)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
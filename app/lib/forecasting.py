@@ -0,0 +1,217 @@
+# lib/forecasting.py
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .backend import BACKEND_SNOWFLAKE, run_query
+
+# Orizzonte massimo della pagina: la previsione si calcola una volta a questo orizzonte
+MAX_PERIODS = 250
+# Giorni di storico caricati (gli ultimi): bastano per la stima e per lo slider della pagina
+MAX_HIST_POINTS = 730
+# Quantile normale per la banda di confidenza al 95%
+Z_95 = 1.959964
+
+# Griglia dei parametri del Holt smorzato (livello, trend, smorzamento)
+ALPHAS = np.linspace(0.05, 0.95, 19)
+BETAS = np.array([0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5])
+PHIS = np.array([0.8, 0.85, 0.9, 0.95, 0.98])
+
+
+@dataclass
+class HoltFit:
+    """Stato finale di un Holt lineare smorzato (ETS(A,Ad,N)) stimato su una serie giornaliera."""
+
+    alpha: float
+    beta: float
+    phi: float
+    level: float
+    trend: float
+    sigma: float
+    last_ts: pd.Timestamp
+    n_obs: int
+
+
+def serie_giornaliera(df_hist: pd.DataFrame) -> pd.Series:
+    """
+    Rating giornaliero (colonne TS, RATING) su un calendario continuo:
+    nei giorni senza partite il rating resta quello dell'ultima partita.
+    """
+    serie = (
+        df_hist.assign(TS=pd.to_datetime(df_hist["TS"]).dt.normalize())
+        .groupby("TS")["RATING"]
+        .last()
+        .astype(float)
+    )
+    return serie.asfreq("D").ffill()
+
+
+def fit_holt_damped(y: np.ndarray, phi: float | None = None) -> tuple[float, float, float, float, float, float]:
+    """
+    Stima (alpha, beta, phi) minimizzando l'errore quadratico a un passo su una griglia.
+    Tutte le combinazioni della griglia avanzano insieme (vettori numpy), con un solo
+    passaggio sulla serie. Restituisce (alpha, beta, phi, level, trend, sigma).
+    """
+    phis = PHIS if phi is None else np.array([phi])
+    a, b, p = (g.ravel() for g in np.meshgrid(ALPHAS, BETAS, phis, indexing="ij"))
+
+    level = np.full(a.shape, y[0])
+    trend = np.full(a.shape, (y[min(len(y) - 1, 7)] - y[0]) / max(min(len(y) - 1, 7), 1))
+    sse = np.zeros(a.shape)
+
+    for valore in y[1:]:
+        previsto = level + p * trend
+        errore = valore - previsto
+        sse += errore * errore
+        nuovo_level = previsto + a * errore
+        trend = b * (nuovo_level - level) + (1 - b) * p * trend
+        level = nuovo_level
+
+    i = int(np.argmin(sse))
+    sigma = float(np.sqrt(sse[i] / max(len(y) - 1, 1)))
+    return float(a[i]), float(b[i]), float(p[i]), float(level[i]), float(trend[i]), sigma
+
+
+def prevedi(fit: HoltFit, periods: int = MAX_PERIODS) -> pd.DataFrame:
+    """
+    Previsione giornaliera dal giorno dopo l'ultimo dato, con le stesse colonne di
+    RATING_FORECAST_MODEL!FORECAST (TS, FORECAST, LOWER_BOUND, UPPER_BOUND).
+    """
+    h = np.arange(1, periods + 1)
+    if fit.phi == 1.0:
+        somma_phi = h.astype(float)
+    else:
+        somma_phi = fit.phi * (1 - fit.phi ** h) / (1 - fit.phi)
+    forecast = fit.level + somma_phi * fit.trend
+
+    # varianza dell'errore a h passi di ETS(A,Ad,N): sigma² (1 + Σ_{j<h} c_j²)
+    c = fit.alpha * (1 + fit.beta * somma_phi[:-1])
+    varianza = fit.sigma ** 2 * (1 + np.concatenate([[0.0], np.cumsum(c * c)]))
+    ampiezza = Z_95 * np.sqrt(varianza)
+
+    return pd.DataFrame(
+        {
+            "TS": pd.date_range(fit.last_ts + pd.Timedelta(days=1), periods=periods, freq="D"),
+            "FORECAST": forecast,
+            "LOWER_BOUND": forecast - ampiezza,
+            "UPPER_BOUND": forecast + ampiezza,
+        }
+    )
+
+
+def dati_grafico(df_hist: pd.DataFrame, df_fore: pd.DataFrame) -> pd.DataFrame:
+    """
+    Storico (TS, RATING) e previsione (TS, FORECAST, LOWER_BOUND, UPPER_BOUND) in un solo
+    DataFrame per il grafico: colonne TS, VALUE, LOWER_BOUND, UPPER_BOUND, SERIES.
+    """
+    # storico
+    df_hist_plot = df_hist.copy()
+    df_hist_plot["VALUE"] = df_hist_plot["RATING"]
+    df_hist_plot["LOWER_BOUND"] = None
+    df_hist_plot["UPPER_BOUND"] = None
+    df_hist_plot["SERIES"] = "Storico"
+    df_hist_plot = df_hist_plot[["TS", "VALUE", "LOWER_BOUND", "UPPER_BOUND", "SERIES"]]
+
+    # forecast
+    df_fore_plot = df_fore.rename(columns={"FORECAST": "VALUE"})
+    df_fore_plot["SERIES"] = "Forecast"
+    df_fore_plot = df_fore_plot[["TS", "VALUE", "LOWER_BOUND", "UPPER_BOUND", "SERIES"]]
+
+    # --- trucco per togliere il “gap” visivo tra storico e forecast ---
+    last_hist_ts = df_hist_plot["TS"].max()
+    first_fore_ts = df_fore_plot["TS"].min()
+
+    if pd.notna(last_hist_ts) and pd.notna(first_fore_ts):
+        first_fore_row = df_fore_plot.iloc[0].copy()
+        first_fore_row["TS"] = last_hist_ts
+        df_fore_plot = pd.concat(
+            [pd.DataFrame([first_fore_row]), df_fore_plot],
+            ignore_index=True
+        ).sort_values("TS")
+
+    # uniamo storia + forecast
+    return pd.concat([df_hist_plot, df_fore_plot], ignore_index=True)
+
+
+@st.cache_data(show_spinner=False)
+def load_rating_history(player: str, watermark: tuple[int, int], limit: int = MAX_HIST_POINTS) -> pd.DataFrame:
+    """
+    Ultimi `limit` giorni di rating di un giocatore (V_RATING_DAILY), in ordine di data.
+    Il limite è applicato nel database; `watermark` rinnova la cache quando arrivano partite.
+    """
+    df = run_query(
+        f"""
+        SELECT ts, rating
+        FROM CHESS_DB.ANALYTICS.V_RATING_DAILY
+        WHERE player_name = %(player)s
+        ORDER BY ts DESC
+        LIMIT {int(limit)}
+        """,
+        {"player": player},
+    )
+    return df.iloc[::-1].reset_index(drop=True)
+
+
+@st.cache_data(show_spinner=False)
+def forecast_snowflake(player: str, watermark: tuple[int, int]) -> pd.DataFrame:
+    """
+    Previsione di RATING_FORECAST_MODEL all'orizzonte massimo (MAX_PERIODS), calcolata
+    una volta per giocatore e watermark: la pagina ne prende le prime `periods` righe.
+    """
+    return run_query(
+        f"""
+        SELECT
+            ts,
+            forecast,
+            lower_bound,
+            upper_bound
+        FROM TABLE(
+            CHESS_DB.ANALYTICS.RATING_FORECAST_MODEL!FORECAST(
+                SERIES_VALUE => TO_VARIANT(%(player)s),
+                FORECASTING_PERIODS => {MAX_PERIODS}
+            )
+        )
+        ORDER BY ts
+        """,
+        {"player": player},
+        backend=BACKEND_SNOWFLAKE,
+    )
+
+
+@st.cache_data(show_spinner=False)
+def fit_rating_model(player: str, watermark: tuple[int, int], phi: float | None = None) -> HoltFit | None:
+    """
+    Stima il modello sul rating del giocatore. La cache è per (giocatore, watermark dei
+    dati, parametri): si ristima solo se arrivano partite nuove o cambiano i parametri.
+    """
+    df_hist = load_rating_history(player, watermark)
+    if len(df_hist) < 2:
+        return None
+
+    serie = serie_giornaliera(df_hist)
+    alpha, beta, phi, level, trend, sigma = fit_holt_damped(serie.to_numpy(), phi)
+    return HoltFit(
+        alpha=alpha,
+        beta=beta,
+        phi=phi,
+        level=level,
+        trend=trend,
+        sigma=sigma,
+        last_ts=serie.index[-1],
+        n_obs=len(serie),
+    )
+
+
+@st.cache_data(show_spinner=False)
+def forecast_locale(player: str, watermark: tuple[int, int], phi: float | None = None) -> pd.DataFrame:
+    """
+    Previsione locale all'orizzonte massimo (MAX_PERIODS): la pagina ne prende le prime
+    `periods` righe, quindi cambiare l'orizzonte non ricalcola nulla.
+    """
+    fit = fit_rating_model(player, watermark, phi)
+    if fit is None:
+        return pd.DataFrame(columns=["TS", "FORECAST", "LOWER_BOUND", "UPPER_BOUND"])
+    return prevedi(fit, MAX_PERIODS)
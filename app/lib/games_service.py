@@ -3,71 +3,215 @@
 import streamlit as st
 import pandas as pd
 
-from .snowflake_utils import get_sf_connection
+from .backend import run_query
+from .result_cache import FILTRO_TUTTI, get_result_cache
+
+# Giocatore usato se DIM_PLAYER non indica un default
+DEFAULT_PLAYER = "spellbind"
+
+GAMES_SELECT = """
+    SELECT
+        id              AS GAME_ID,
+        game_date       AS GAME_DATE,
+        speed           AS SPEED,
+        my_color        AS MY_COLOR,
+        my_result       AS MY_RESULT,
+        opening_name    AS OPENING_NAME,
+        opponent_name   AS OPPONENT_NAME,
+        opponent_rating AS OPPONENT_RATING
+    FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI
+"""
+
+
+@st.cache_data(show_spinner=False, ttl=300)
+def data_watermark(backend: str | None = None) -> tuple[int, int]:
+    """
+    Freschezza dei dati di LICHESS_GAMES sul backend configurato (o su `backend`):
+    (last_move_at_ms più recente, numero di partite). Cambia a ogni caricamento, anche
+    quando le partite nuove sono più vecchie dell'ultima (l'export di un altro giocatore).
+    """
+    df = run_query(
+        "SELECT MAX(last_move_at_ms) AS W, COUNT(*) AS N FROM CHESS_DB.RAW.LICHESS_GAMES",
+        backend=backend,
+    )
+    value = df["W"].iloc[0]
+    return (0 if pd.isna(value) else int(value), int(df["N"].iloc[0]))
+
+
+def carica_partite_nuove() -> int:
+    """
+    Solo backend DuckDB: ingestion incrementale dei CSV nel database locale già aperto
+    (lib.local_backend.refresh_local_data). Se arrivano partite si svuotano le cache non
+    legate al watermark (watermark stesso, conteggi, cache dei risultati filtrati); le
+    cache con il watermark nella chiave, e gli alberi delle aperture, si rinnovano da sole.
+    Restituisce il numero di partite nuove.
+    """
+    from .local_backend import refresh_local_data
+
+    nuove = refresh_local_data()
+    if nuove:
+        data_watermark.clear()
+        count_games.clear()
+        get_result_cache.clear()
+    return nuove
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def list_players() -> list[str]:
+    """Giocatori del club (DIM_PLAYER), con quello di default per primo."""
+    df = run_query(
+        "SELECT player_name AS PLAYER_NAME FROM CHESS_DB.RAW.DIM_PLAYER "
+        "ORDER BY is_default DESC, player_name"
+    )
+    players = df["PLAYER_NAME"].tolist()
+    return players or [DEFAULT_PLAYER]
+
+
+def _build_where(
+    player: str,
+    speed_filter: str,
+    result_filter: str,
+    color_filter: str,
+    rating_range: tuple[int, int],
+    mosse: tuple[str, ...] = (),
+) -> tuple[str, dict]:
+    """
+    Costruisce la clausola WHERE (e i parametri) dai filtri della sidebar.
+    Il filtro su player_name viene sempre per primo: è la chiave di clustering.
+    """
+    min_rating, max_rating = rating_range
+
+    where = " WHERE player_name = %(player)s"
+    params: dict = {"player": player}
+
+    if speed_filter != FILTRO_TUTTI:
+        where += " AND speed = %(speed)s"
+        params["speed"] = speed_filter
+
+    if result_filter != FILTRO_TUTTI:
+        where += " AND my_result = %(result)s"
+        params["result"] = result_filter
+
+    if color_filter != FILTRO_TUTTI:
+        where += " AND my_color = %(my_color)s"
+        params["my_color"] = color_filter
+
+    if min_rating is not None:
+        where += " AND opponent_rating >= %(min_rating)s"
+        params["min_rating"] = int(min_rating)
+
+    if max_rating is not None:
+        where += " AND opponent_rating <= %(max_rating)s"
+        params["max_rating"] = int(max_rating)
+
+    if mosse:
+        # la partita inizia con queste mosse: moves uguale, o che continua dopo uno spazio
+        prefisso = " ".join(mosse)
+        where += " AND (moves = %(mosse)s OR LEFT(moves, %(mosse_len)s) = %(mosse_prefisso)s)"
+        params["mosse"] = prefisso
+        params["mosse_prefisso"] = prefisso + " "
+        params["mosse_len"] = len(prefisso) + 1
+
+    return where, params
 
 
-@st.cache_data(show_spinner=False)
 def load_games(
+    player: str,
     speed_filter: str,
     result_filter: str,
     color_filter: str,
     rating_range: tuple[int, int],
     limit: int,
+    mosse: tuple[str, ...] = (),
 ) -> pd.DataFrame:
     """
-    Carica le partite da V_GAMES_ANALYST applicando i filtri base.
+    Carica le partite di un giocatore da V_PARTITE_GIOCATORI applicando i filtri base,
+    sul backend configurato (Snowflake o DuckDB locale, vedi lib.backend).
 
     Filtri:
+    - player: giocatore dal cui punto di vista leggere le partite (vedi list_players)
     - speed_filter: "Tutti" | "blitz" | "bullet" | ecc.
     - result_filter: "Tutti" | "win" | "loss" | "draw"
     - color_filter: "Tutti" | "white" | "black"
     - rating_range: (min_rating, max_rating)
     - limit: numero massimo di partite
+    - mosse: mosse iniziali in SAN, es. ("e4", "c5") (vuoto: nessun filtro)
     """
-    min_rating, max_rating = rating_range
+    return load_games_page(
+        player, speed_filter, result_filter, color_filter, rating_range, mosse, page_size=limit
+    )
 
-    query = """
-    SELECT
-        id              AS GAME_ID,
-        game_date       AS GAME_DATE,
-        speed           AS SPEED,
-        my_color        AS MY_COLOR,
-        my_result       AS MY_RESULT,
-        opening_name    AS OPENING_NAME,
-        opponent_name   AS OPPONENT_NAME,
-        opponent_rating AS OPPONENT_RATING
-    FROM CHESS_DB.ANALYTICS.V_PARTITE_ANALISI
-    WHERE my_color IS NOT NULL
+
+def load_games_page(
+    player: str,
+    speed_filter: str,
+    result_filter: str,
+    color_filter: str,
+    rating_range: tuple[int, int],
+    mosse: tuple[str, ...] = (),
+    page_size: int = 100,
+    after: tuple[str, str] | None = None,
+) -> pd.DataFrame:
     """
+    Carica una pagina di partite con paginazione keyset su (game_date, id),
+    in ordine decrescente. Stessi filtri di load_games.
 
-    params: dict = {}
+    - page_size: numero di partite per pagina
+    - after: cursore (game_date ISO, game_id) dell'ultima riga della pagina
+      precedente, come restituito da page_cursor(); None per la prima pagina
 
-    if speed_filter != "Tutti":
-        query += " AND speed = %(speed)s"
-        params["speed"] = speed_filter
+    I risultati passano dalla cache di lib.result_cache: un filtro più stretto
+    di uno già caricato viene risolto in locale, senza query.
+    """
+    filters = (player, speed_filter, result_filter, color_filter, tuple(rating_range), tuple(mosse))
+    cache = get_result_cache()
 
-    if result_filter != "Tutti":
-        query += " AND my_result = %(result)s"
-        params["result"] = result_filter
+    df = cache.get(filters, after, page_size)
+    if df is not None:
+        return df
 
-    if color_filter != "Tutti":
-        query += " AND my_color = %(my_color)s"
-        params["my_color"] = color_filter
+    where, params = _build_where(*filters)
 
-    if min_rating is not None:
-        query += " AND opponent_rating >= %(min_rating)s"
-        params["min_rating"] = int(min_rating)
+    if after is not None:
+        where += (
+            " AND (game_date < CAST(%(after_date)s AS DATE)"
+            " OR (game_date = CAST(%(after_date)s AS DATE) AND id < %(after_id)s))"
+        )
+        params["after_date"], params["after_id"] = after
 
-    if max_rating is not None:
-        query += " AND opponent_rating <= %(max_rating)s"
-        params["max_rating"] = int(max_rating)
+    query = GAMES_SELECT + where + " ORDER BY game_date DESC, id DESC LIMIT %(limit)s"
+    params["limit"] = int(page_size)
+
+    df = run_query(query, params)
+    cache.put(filters, after, page_size, df)
+    return df.copy()
+
+
+@st.cache_data(show_spinner=False)
+def count_games(
+    player: str,
+    speed_filter: str,
+    result_filter: str,
+    color_filter: str,
+    rating_range: tuple[int, int],
+    mosse: tuple[str, ...] = (),
+) -> int:
+    """Numero totale di partite che soddisfano i filtri (per il contatore pagine)."""
+    filters = (player, speed_filter, result_filter, color_filter, tuple(rating_range), tuple(mosse))
+    cached = get_result_cache().count(filters)
+    if cached is not None:
+        return cached
 
-    query += " ORDER BY game_date DESC LIMIT %(limit)s"
-    params["limit"] = int(limit)
+    where, params = _build_where(*filters)
+    df = run_query(
+        "SELECT COUNT(*) AS N FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI" + where, params
+    )
+    return int(df["N"].iloc[0])
 
-    conn = get_sf_connection()
-    cur = conn.cursor()
-    cur.execute(query, params)
-    df = cur.fetch_pandas_all()
 
-    return df
+def page_cursor(df_page: pd.DataFrame) -> tuple[str, str] | None:
+    """Cursore keyset (game_date ISO, game_id) dell'ultima riga di una pagina."""
+    if df_page.empty:
+        return None
+    last = df_page.iloc[-1]
+    return pd.Timestamp(last["GAME_DATE"]).date().isoformat(), str(last["GAME_ID"])
@@ -0,0 +1,323 @@
+# lib/ingestion.py
+#
+# Pipeline di ingestion degli export CSV di Lichess:
+#   CSV (a chunk) -> Parquet tipizzato -> stage Snowflake -> MERGE in LICHESS_GAMES
+#
+# È incrementale e idempotente: un high-watermark su last_move_at_ms per ogni CSV fa sì
+# che ogni run legga solo le partite nuove, e i duplicati su id vengono scartati.
+# Su Snowflake vanno tutti i part file non ancora caricati (MERGE riuscito).
+#
+# Uso (dalla cartella app/):
+#   python -m lib.ingestion                      # CSV di default -> Parquet locale
+#   python -m lib.ingestion export1.csv ...      # altri export (anche di altri giocatori)
+#   python -m lib.ingestion --snowflake          # carica anche su Snowflake via stage
+
+import argparse
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+DEFAULT_CSV_FILES = [
+    REPO_ROOT / "lichess_blitz_games.csv",
+    REPO_ROOT / "lichess_blitz_games_secondary.csv",
+]
+
+CHUNK_ROWS = 50_000
+
+# Schema tipizzato, allineato a LICHESS_GAMES in ingestion.sql
+GAMES_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("rated", pa.bool_()),
+        ("variant", pa.string()),
+        ("speed", pa.string()),
+        ("perf", pa.string()),
+        ("created_at_ms", pa.int64()),
+        ("last_move_at_ms", pa.int64()),
+        ("status", pa.string()),
+        ("winner", pa.string()),
+        ("moves", pa.string()),
+        ("turns", pa.int32()),
+        ("opening_name", pa.string()),
+        ("opening_eco", pa.string()),
+        ("white_name", pa.string()),
+        ("white_id", pa.string()),
+        ("white_rating", pa.int32()),
+        ("black_name", pa.string()),
+        ("black_id", pa.string()),
+        ("black_rating", pa.int32()),
+        ("created_at", pa.timestamp("ms")),
+        ("last_move_at", pa.timestamp("ms")),
+    ]
+)
+
+CSV_DTYPES = {
+    "rated": "boolean",
+    "created_at_ms": "Int64",
+    "last_move_at_ms": "Int64",
+    "turns": "Int32",
+    "white_rating": "Int32",
+    "black_rating": "Int32",
+}
+for _field in GAMES_SCHEMA:
+    if pa.types.is_string(_field.type):
+        CSV_DTYPES[_field.name] = "string"
+
+STAGE = "@CHESS_DB.RAW.LICHESS_STAGE"
+
+
+def get_data_dir() -> Path:
+    """Cartella dei dati locali (env CHESS_LOCAL_DATA_DIR, default ./data nella root del repo)."""
+    data_dir = Path(os.environ.get("CHESS_LOCAL_DATA_DIR", REPO_ROOT / "data"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+
+def get_games_dir() -> Path:
+    """Dataset Parquet delle partite: un file part-*.parquet per ogni run con dati nuovi."""
+    games_dir = get_data_dir() / "lichess_games"
+    games_dir.mkdir(parents=True, exist_ok=True)
+    return games_dir
+
+
+def _state_path() -> Path:
+    return get_data_dir() / "ingestion_state.json"
+
+
+def load_state() -> dict:
+    """
+    Stato dell'ingestion:
+    - sources: per ogni CSV (percorso assoluto) il suo watermark
+        - watermark_ms: last_move_at_ms più alto già caricato da quel file
+        - ids_at_watermark: id delle partite con esattamente quel last_move_at_ms
+          (servono a non perdere né duplicare partite finite nello stesso millisecondo)
+      Un export di un altro giocatore, con partite più vecchie, ha il suo watermark.
+    - snowflake_parts: part file già caricati su Snowflake (MERGE riuscito)
+    """
+    path = _state_path()
+    if not path.exists():
+        return {"sources": {}, "snowflake_parts": []}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save_state(state: dict) -> None:
+    tmp = _state_path().with_suffix(".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    tmp.replace(_state_path())
+
+
+def _to_arrow(chunk: pd.DataFrame) -> pa.Table:
+    """Converte un chunk del CSV in una tabella Arrow con lo schema di LICHESS_GAMES."""
+    chunk = chunk.copy()
+    for col in ("created_at", "last_move_at"):
+        chunk[col] = pd.to_datetime(chunk[col], format="ISO8601")
+    return pa.Table.from_pandas(chunk[GAMES_SCHEMA.names], schema=GAMES_SCHEMA, preserve_index=False)
+
+
+def _ids_caricati() -> set[str]:
+    """Id delle partite già nel dataset Parquet locale."""
+    parts = list(get_games_dir().glob("part-*.parquet"))
+    if not parts:
+        return set()
+    ids = ds.dataset(parts, format="parquet").to_table(columns=["id"]).column("id")
+    return set(ids.unique().to_pylist())
+
+
+def ingest_csvs(csv_files: list[Path] | None = None, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """
+    Legge i CSV a chunk e scrive in un nuovo Parquet solo le partite nuove:
+    last_move_at_ms oltre il watermark di quel CSV e id non ancora nel dataset.
+
+    Restituisce un riepilogo: righe lette, righe nuove, file Parquet scritto (o None).
+    """
+    csv_files = [Path(p) for p in (csv_files or DEFAULT_CSV_FILES)]
+    missing = [str(p) for p in csv_files if not p.exists()]
+    if missing:
+        raise FileNotFoundError("CSV Lichess non trovati: " + ", ".join(missing))
+
+    state = load_state()
+    if not any(get_games_dir().glob("part-*.parquet")):
+        # dataset locale cancellato: si riparte da zero
+        state["sources"] = {}
+    sources = dict(state["sources"])
+
+    seen_ids: set[str] | None = None  # id già nel dataset, letti alla prima partita candidata
+    rows_read = rows_new = 0
+
+    # nome unico anche per due run nello stesso secondo (il file non va mai sovrascritto)
+    part_path = get_games_dir() / f"part-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+    tmp_path = part_path.with_suffix(".parquet.tmp")
+    writer = None
+
+    try:
+        for csv_file in csv_files:
+            chiave = str(csv_file.resolve())
+            source = sources.get(chiave) or {"watermark_ms": None, "ids_at_watermark": []}
+            watermark = source["watermark_ms"]
+            ids_at_watermark = set(source["ids_at_watermark"])
+            new_watermark = watermark
+            new_ids_at_watermark = set(ids_at_watermark)
+
+            for chunk in pd.read_csv(csv_file, dtype=CSV_DTYPES, chunksize=chunk_rows):
+                rows_read += len(chunk)
+
+                chunk = chunk[chunk["id"].notna()]
+                if watermark is not None:
+                    ts = chunk["last_move_at_ms"]
+                    chunk = chunk[
+                        (ts > watermark)
+                        | ((ts == watermark) & ~chunk["id"].isin(ids_at_watermark))
+                    ]
+                if chunk.empty:
+                    continue
+
+                # il watermark del file avanza anche per le partite che c'erano già
+                chunk_max = int(chunk["last_move_at_ms"].max())
+                if new_watermark is None or chunk_max > new_watermark:
+                    new_watermark = chunk_max
+                    new_ids_at_watermark = set()
+                if chunk_max == new_watermark:
+                    new_ids_at_watermark.update(chunk.loc[chunk["last_move_at_ms"] == chunk_max, "id"])
+
+                if seen_ids is None:
+                    seen_ids = _ids_caricati()
+                chunk = chunk.drop_duplicates(subset="id", keep="last")
+                chunk = chunk[~chunk["id"].isin(seen_ids)]
+                if chunk.empty:
+                    continue
+
+                seen_ids.update(chunk["id"])
+                rows_new += len(chunk)
+
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, GAMES_SCHEMA, compression="zstd")
+                writer.write_table(_to_arrow(chunk))
+
+            sources[chiave] = {
+                "watermark_ms": new_watermark,
+                "ids_at_watermark": sorted(new_ids_at_watermark),
+            }
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if writer is not None:
+        writer.close()
+        tmp_path.replace(part_path)
+    if sources != state["sources"]:
+        _save_state({**state, "sources": sources})
+    return {
+        "rows_read": rows_read,
+        "rows_new": rows_new,
+        "parquet": part_path if writer is not None else None,
+    }
+
+
+def parts_da_caricare_su_snowflake() -> list[Path]:
+    """Part file del dataset locale non ancora caricati su Snowflake, dal più vecchio."""
+    caricati = set(load_state()["snowflake_parts"])
+    return sorted(p for p in get_games_dir().glob("part-*.parquet") if p.name not in caricati)
+
+
+def segna_caricati_su_snowflake(parquet_files: list[Path]) -> None:
+    """Registra nello stato i part file il cui MERGE su Snowflake è andato a buon fine."""
+    state = load_state()
+    caricati = set(state["snowflake_parts"]) | {Path(p).name for p in parquet_files}
+    _save_state({**state, "snowflake_parts": sorted(caricati)})
+
+
+def load_parquet_to_snowflake(parquet_files: list[Path]) -> int:
+    """
+    Bulk load su Snowflake: PUT dei Parquet sullo stage, COPY INTO una tabella
+    temporanea e MERGE su id in LICHESS_GAMES (rilanciarlo non crea duplicati).
+    Restituisce il numero di righe inserite.
+    """
+    from .snowflake_utils import sf_cursor
+
+    if not parquet_files:
+        return 0
+
+    batch = time.strftime("%Y%m%dT%H%M%S")
+    with sf_cursor() as cur:
+        # la connessione torna nel pool: tabella temporanea e file sullo stage si
+        # tolgono sempre, anche se PUT, COPY o MERGE falliscono
+        try:
+            for path in parquet_files:
+                cur.execute(
+                    f"PUT 'file://{Path(path).resolve().as_posix()}' {STAGE}/{batch}/ "
+                    "AUTO_COMPRESS = FALSE OVERWRITE = TRUE"
+                )
+
+            cur.execute(
+                "CREATE OR REPLACE TEMPORARY TABLE CHESS_DB.RAW.LICHESS_GAMES_STG "
+                "LIKE CHESS_DB.RAW.LICHESS_GAMES"
+            )
+            cur.execute(
+                f"""
+                COPY INTO CHESS_DB.RAW.LICHESS_GAMES_STG
+                FROM {STAGE}/{batch}/
+                FILE_FORMAT = (FORMAT_NAME = 'CHESS_DB.RAW.LICHESS_PARQUET')
+                MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+                """
+            )
+
+            columns = ", ".join(GAMES_SCHEMA.names)
+            values = ", ".join(f"s.{c}" for c in GAMES_SCHEMA.names)
+            cur.execute(
+                f"""
+                MERGE INTO CHESS_DB.RAW.LICHESS_GAMES t
+                USING (
+                    SELECT *
+                    FROM CHESS_DB.RAW.LICHESS_GAMES_STG
+                    QUALIFY ROW_NUMBER() OVER (PARTITION BY id ORDER BY last_move_at_ms DESC) = 1
+                ) s
+                ON t.id = s.id
+                WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({values})
+                """
+            )
+            inserted = cur.fetchone()[0]
+        finally:
+            cur.execute("DROP TABLE IF EXISTS CHESS_DB.RAW.LICHESS_GAMES_STG")
+            cur.execute(f"REMOVE {STAGE}/{batch}/")
+
+    return int(inserted)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingestion incrementale degli export CSV Lichess.")
+    parser.add_argument("csv", nargs="*", type=Path, help="CSV da caricare (default: quelli del repo)")
+    parser.add_argument("--snowflake", action="store_true", help="carica le partite nuove su Snowflake")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = ingest_csvs(args.csv or None, chunk_rows=args.chunk_rows)
+    print(
+        f"Lette {result['rows_read']} righe, {result['rows_new']} partite nuove "
+        f"-> {result['parquet'] or 'nessun file'}"
+    )
+
+    if args.snowflake:
+        # tutti i part file non ancora caricati: anche quelli scritti dall'app locale
+        # o rimasti indietro per un run --snowflake fallito
+        parts = parts_da_caricare_su_snowflake()
+        inserted = load_parquet_to_snowflake(parts)
+        segna_caricati_su_snowflake(parts)
+        print(f"Snowflake: {len(parts)} file, {inserted} partite inserite in LICHESS_GAMES")
+
+    print(f"Fatto in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# lib/load_test.py
+#
+# Test di carico delle pagine Streamlit: N utenti virtuali eseguono gli stessi passi di un
+# utente vero con streamlit.testing (AppTest). AppTest non regge più script in parallelo
+# nello stesso processo, quindi ogni utente è un processo: il carico arriva in parallelo
+# ai backend (server sostitutivo o Snowflake), ma le cache in memoria non sono condivise
+# come in un singolo server Streamlit.
+# Per ogni passo misura la durata end-to-end e riporta p50/p95/max ed errori.
+#
+# Uso (dalla cartella app/), senza account Snowflake:
+#   python -m lib.load_test --standin --users 8 --iterations 3
+#   python -m lib.load_test --url http://127.0.0.1:8765 --scenari explorer,agent
+# Con --standin il server sostitutivo (lib.cortex_standin) parte in questo processo;
+# le opzioni --latency-ms, --tokens-per-s, --error-rate ne regolano il comportamento.
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parents[1]
+TIMEOUT_S = 120
+
+DOMANDE_OPENINGS = [
+    "Najdorf 6.Bg5 piano principale e ordine di mosse",
+    "Cosa gioca il Nero contro l'Attacco Inglese?",
+    "Perché 5...a6 nella Najdorf?",
+]
+DOMANDE_ANALYST = [
+    "Quali sono le 10 aperture che gioco di più?",
+    "Qual è il mio win rate nel blitz con il Bianco?",
+    "Contro quali avversari ho perso più spesso?",
+]
+DOMANDE_AGENT = [
+    "Mostrami le mie ultime partite",
+    "Come sono andate le ultime dieci partite?",
+]
+
+
+def _app_test(pagina: str):
+    from streamlit.testing.v1 import AppTest
+
+    return AppTest.from_file(str(APP_DIR / pagina), default_timeout=TIMEOUT_S)
+
+
+def _controlla(at) -> None:
+    """Un'eccezione nello script è un errore del passo (st.error mostrati inclusi)."""
+    errori = [e.value for e in at.exception] + [e.value for e in at.error]
+    if errori:
+        raise RuntimeError(str(errori[0])[:300])
+
+
+class Misure:
+    """Durate (secondi) ed errori per passo, di un utente virtuale o di tutti (unisci)."""
+
+    def __init__(self):
+        self.durate: Dict[str, List[float]] = defaultdict(list)
+        self.errori: Dict[str, List[str]] = defaultdict(list)
+
+    def passo(self, nome: str, azione: Callable[[], None]) -> bool:
+        inizio = time.perf_counter()
+        try:
+            azione()
+        except Exception as e:
+            self.errori[nome].append(f"{type(e).__name__}: {e}")
+            return False
+        self.durate[nome].append(time.perf_counter() - inizio)
+        return True
+
+    def unisci(self, altre: "Misure") -> None:
+        for nome, durate in altre.durate.items():
+            self.durate[nome].extend(durate)
+        for nome, errori in altre.errori.items():
+            self.errori[nome].extend(errori)
+
+    def riepilogo(self) -> List[dict]:
+        righe = []
+        for nome in sorted(set(self.durate) | set(self.errori)):
+            durate = np.array(self.durate.get(nome, []))
+            righe.append(
+                {
+                    "passo": nome,
+                    "ok": len(durate),
+                    "errori": len(self.errori.get(nome, [])),
+                    "p50_ms": round(float(np.percentile(durate, 50)) * 1000, 1) if len(durate) else None,
+                    "p95_ms": round(float(np.percentile(durate, 95)) * 1000, 1) if len(durate) else None,
+                    "max_ms": round(float(durate.max()) * 1000, 1) if len(durate) else None,
+                }
+            )
+        return righe
+
+
+# ---------- scenari: una sessione utente ciascuno ----------
+
+
+def scenario_explorer(misure: Misure, utente: int, giro: int) -> None:
+    at = _app_test("1_Chess_Game_Explorer.py")
+    if not misure.passo("explorer.apri", lambda: _controlla(at.run())):
+        return
+    successiva = [b for b in at.button if b.label == "Successiva ▶"]
+    if successiva and not successiva[0].disabled:
+        misure.passo("explorer.pagina_successiva", lambda: _controlla(successiva[0].click().run()))
+
+
+def scenario_forecast(misure: Misure, utente: int, giro: int) -> None:
+    at = _app_test("pages/3_Rating_Forecast.py")
+    if not misure.passo("forecast.apri", lambda: _controlla(at.run())):
+        return
+    orizzonte = [s for s in at.slider if s.label == "Giorni futuri da prevedere"]
+    if orizzonte:
+        misure.passo("forecast.orizzonte", lambda: _controlla(orizzonte[0].set_value(30 + giro).run()))
+
+
+def scenario_openings(misure: Misure, utente: int, giro: int) -> None:
+    at = _app_test("pages/4_Chess_Openings_Search.py")
+    if not misure.passo("openings.apri", lambda: _controlla(at.run())):
+        return
+    domanda = DOMANDE_OPENINGS[(utente + giro) % len(DOMANDE_OPENINGS)]
+    misure.passo("openings.domanda", lambda: _controlla(at.chat_input[0].set_value(domanda).run()))
+
+
+def scenario_agent(misure: Misure, utente: int, giro: int) -> None:
+    at = _app_test("pages/5_Chess_Agent.py")
+    if not misure.passo("agent.apri", lambda: _controlla(at.run())):
+        return
+    domanda = DOMANDE_AGENT[(utente + giro) % len(DOMANDE_AGENT)]
+    misure.passo("agent.domanda", lambda: _controlla(at.chat_input[0].set_value(domanda).run()))
+
+
+def scenario_analyst(misure: Misure, utente: int, giro: int) -> None:
+    at = _app_test("pages/2_Chess_Analyst.py")
+    if not misure.passo("analyst.apri", lambda: _controlla(at.run())):
+        return
+    domanda = DOMANDE_ANALYST[(utente + giro) % len(DOMANDE_ANALYST)]
+
+    def chiedi() -> None:
+        at.text_area[0].set_value(domanda)
+        [b for b in at.button if b.label == "Chiedi a Cortex Analyst"][0].click()
+        _controlla(at.run())
+        # la risposta arriva in background: si rilancia lo script finché non è in cronologia
+        scadenza = time.monotonic() + TIMEOUT_S
+        while at.session_state["analyst_pending"]:
+            if time.monotonic() > scadenza:
+                raise TimeoutError("Cortex Analyst non ha risposto in tempo")
+            time.sleep(0.05)
+            _controlla(at.run())
+
+    misure.passo("analyst.domanda", chiedi)
+
+
+SCENARI = {
+    "explorer": scenario_explorer,
+    "forecast": scenario_forecast,
+    "openings": scenario_openings,
+    "agent": scenario_agent,
+    "analyst": scenario_analyst,
+}
+
+
+def _utente(indice: int, scenari: List[str], giri: int, pausa_s: float) -> Misure:
+    """Un utente virtuale (in un processo a sé): ripete `giri` volte gli scenari."""
+    misure = Misure()
+    for giro in range(giri):
+        for nome in scenari:
+            SCENARI[nome](misure, indice, giro)
+            if pausa_s:
+                time.sleep(pausa_s)
+    return misure
+
+
+def esegui(scenari: List[str], utenti: int, giri: int, pausa_s: float = 0.0) -> Misure:
+    """Lancia `utenti` processi in parallelo e unisce le loro misure."""
+    misure = Misure()
+    contesto = multiprocessing.get_context("spawn")  # processi puliti, senza i thread del server
+    with ProcessPoolExecutor(max_workers=utenti, mp_context=contesto) as pool:
+        futures = [pool.submit(_utente, i, scenari, giri, pausa_s) for i in range(utenti)]
+        for future in futures:
+            misure.unisci(future.result())
+    return misure
+
+
+def stampa(righe: List[dict], durata_s: float) -> None:
+    intestazione = f"{'passo':<28}{'ok':>6}{'errori':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"
+    print(intestazione)
+    print("-" * len(intestazione))
+    for r in righe:
+        valori = [r["p50_ms"], r["p95_ms"], r["max_ms"]]
+        print(
+            f"{r['passo']:<28}{r['ok']:>6}{r['errori']:>8}"
+            + "".join(f"{'-' if v is None else v:>10}" for v in valori)
+        )
+    print(f"\nDurata totale: {durata_s:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Test di carico delle pagine Streamlit.")
+    parser.add_argument("--users", type=int, default=4, help="utenti virtuali in parallelo")
+    parser.add_argument("--iterations", type=int, default=3, help="ripetizioni degli scenari per utente")
+    parser.add_argument("--scenari", default=",".join(SCENARI), help="scenari separati da virgola")
+    parser.add_argument("--pausa-s", type=float, default=0.0, help="attesa tra uno scenario e l'altro")
+    parser.add_argument("--url", default=None, help="base URL di un server sostitutivo già avviato")
+    parser.add_argument("--standin", action="store_true", help="avvia il server sostitutivo in questo processo")
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-s", type=float, default=40.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--json", type=Path, default=None, help="salva il riepilogo in JSON")
+    args = parser.parse_args()
+
+    scenari = [s.strip() for s in args.scenari.split(",") if s.strip()]
+    sconosciuti = [s for s in scenari if s not in SCENARI]
+    if sconosciuti:
+        parser.error(f"Scenari sconosciuti: {', '.join(sconosciuti)} (ammessi: {', '.join(SCENARI)})")
+
+    if args.standin:
+        from .cortex_standin import StandinConfig, avvia_in_background
+
+        server = avvia_in_background(
+            StandinConfig(
+                latency_ms=args.latency_ms,
+                jitter_ms=args.jitter_ms,
+                tokens_per_s=args.tokens_per_s,
+                error_rate=args.error_rate,
+            )
+        )
+        args.url = server.base_url
+        print(f"Server sostitutivo su {args.url}")
+    if args.url:
+        # lo ereditano i processi degli utenti, prima che le pagine importino lib.snowflake_utils
+        os.environ["CORTEX_REST_BASE_URL"] = args.url
+
+    inizio = time.perf_counter()
+    misure = esegui(scenari, args.users, args.iterations, args.pausa_s)
+    durata = time.perf_counter() - inizio
+
+    righe = misure.riepilogo()
+    stampa(righe, durata)
+    for nome, errori in sorted(misure.errori.items()):
+        print(f"\n{nome}: {len(errori)} errori, es. {errori[0]}")
+
+    if args.json:
+        args.json.write_text(
+            json.dumps({"utenti": args.users, "giri": args.iterations, "durata_s": durata, "passi": righe}, indent=2),
+            encoding="utf-8",
+        )
+
+
+if __name__ == "__main__":
+    main()
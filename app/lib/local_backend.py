@@ -0,0 +1,128 @@
+# lib/local_backend.py
+
+import re
+from pathlib import Path
+from typing import Iterator
+
+import duckdb
+import pyarrow as pa
+import streamlit as st
+
+from .ingestion import get_games_dir, ingest_csvs
+
+APP_DIR = Path(__file__).resolve().parents[1]
+DEFINITION_SQL = APP_DIR / "duckdb_definition.sql"
+
+
+def _load_parquet(con, parquet_path: str) -> None:
+    """Aggiunge a LICHESS_GAMES le partite del Parquet che non ci sono già (chiave id)."""
+    con.execute(
+        f"""
+        INSERT INTO CHESS_DB.RAW.LICHESS_GAMES
+        SELECT p.*
+        FROM read_parquet('{parquet_path}') p
+        WHERE NOT EXISTS (
+            SELECT 1 FROM CHESS_DB.RAW.LICHESS_GAMES g WHERE g.id = p.id
+        )
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY p.id ORDER BY p.last_move_at_ms DESC) = 1
+        """
+    )
+
+
+def refresh_games_perspective(con) -> None:
+    """
+    Refresh incrementale di DT_GAMES_PERSPECTIVE (come la dynamic table su Snowflake):
+    materializza solo le partite non ancora presenti, in ordine di (player_name, game_date)
+    così le zone map di DuckDB permettono il pruning per giocatore e per data.
+    """
+    con.execute(
+        """
+        INSERT INTO CHESS_DB.RAW.DT_GAMES_PERSPECTIVE
+        SELECT d.*
+        FROM CHESS_DB.RAW.V_GAMES_DERIVED d
+        WHERE NOT EXISTS (
+            SELECT 1 FROM CHESS_DB.RAW.DT_GAMES_PERSPECTIVE t WHERE t.id = d.id
+        )
+        ORDER BY d.player_name, d.game_date
+        """
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_duckdb_connection() -> duckdb.DuckDBPyConnection:
+    """
+    Crea (e cache-a) un database DuckDB in memoria che replica CHESS_DB:
+    - CHESS_DB.RAW.LICHESS_GAMES caricata dal dataset Parquet di lib.ingestion
+      (prima si lancia un'ingestion incrementale dei CSV, che non fa nulla se non c'è niente di nuovo)
+    - gli oggetti di duckdb_definition.sql (DIM_PLAYER, DT_GAMES_PERSPECTIVE e le viste)
+    """
+    ingest_csvs()
+    parquet_glob = (get_games_dir() / "part-*.parquet").as_posix()
+
+    con = duckdb.connect()
+    con.execute("ATTACH ':memory:' AS CHESS_DB")
+    con.execute("CREATE SCHEMA CHESS_DB.RAW")
+    con.execute("CREATE SCHEMA CHESS_DB.ANALYTICS")
+    con.execute(
+        f"CREATE TABLE CHESS_DB.RAW.LICHESS_GAMES AS "
+        f"SELECT * FROM read_parquet('{parquet_glob}') LIMIT 0"
+    )
+    _load_parquet(con, parquet_glob)
+    con.execute(DEFINITION_SQL.read_text(encoding="utf-8"))
+    refresh_games_perspective(con)
+    return con
+
+
+def refresh_local_data() -> int:
+    """
+    Ingestion incrementale dei CSV e refresh del database locale già aperto,
+    senza ricostruirlo. Restituisce il numero di partite nuove.
+    """
+    result = ingest_csvs()
+    if result["parquet"] is None:
+        return 0
+
+    cur = get_duckdb_connection().cursor()
+    try:
+        _load_parquet(cur, Path(result["parquet"]).as_posix())
+        refresh_games_perspective(cur)
+    finally:
+        cur.close()
+    return result["rows_new"]
+
+
+def _to_duckdb_params(query: str, params: dict | list | tuple | None = None) -> str:
+    """
+    Traduce i placeholder di Snowflake in quelli DuckDB: pyformat (%(nome)s) in $nome,
+    con params lista i posizionali %s in ?. Come per il connettore Snowflake, con params
+    lista un % letterale si scrive %%.
+    """
+    if isinstance(params, (list, tuple)):
+        return re.sub(r"%(%|s)", lambda m: "?" if m.group(1) == "s" else "%", query)
+    return re.sub(r"%\((\w+)\)s", r"$\1", query)
+
+
+def iter_local_batches(
+    query: str, params: dict | list | tuple | None = None, batch_rows: int = 65_536
+) -> Iterator[pa.Table]:
+    """
+    Esegue una query sul database DuckDB locale e restituisce il risultato a batch Arrow.
+    Ogni chiamata usa un cursore dedicato (le connessioni DuckDB non sono thread-safe).
+    """
+    cur = get_duckdb_connection().cursor()
+    try:
+        # come in Snowflake, i nomi non qualificati puntano a CHESS_DB.ANALYTICS
+        cur.execute("USE CHESS_DB.ANALYTICS")
+        if isinstance(params, (list, tuple)):
+            reader = cur.execute(_to_duckdb_params(query, params), list(params))
+        else:
+            reader = cur.execute(_to_duckdb_params(query), params or {})
+        reader = reader.fetch_record_batch(batch_rows)
+        vuoto = True
+        for batch in reader:
+            vuoto = False
+            yield pa.Table.from_batches([batch])
+        if vuoto:
+            yield reader.schema.empty_table()
+    finally:
+        cur.close()
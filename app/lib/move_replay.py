@@ -0,0 +1,265 @@
+# lib/move_replay.py
+#
+# Replay delle mosse (SAN) di LICHESS_GAMES in una tabella di posizioni:
+#   una riga per posizione (ply 0 = iniziale) con id partita, ply, hash Zobrist, FEN
+#   e mossa in UCI che ci ha portato.
+#
+# Con la tabella "tutte le partite arrivate a questa posizione" diventa una ricerca
+# per hash invece di una scansione delle stringhe di mosse.
+#
+# Uso (dalla cartella app/):
+#   python -m lib.move_replay              # replay delle partite nuove del dataset Parquet
+#   python -m lib.move_replay --workers 8
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import chess
+import chess.polyglot
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import streamlit as st
+
+from .ingestion import get_data_dir, get_games_dir
+
+POSITIONS_SCHEMA = pa.schema(
+    [
+        ("game_id", pa.string()),
+        ("ply", pa.int16()),
+        ("zobrist", pa.uint64()),
+        ("fen", pa.string()),
+        ("uci", pa.string()),
+    ]
+)
+
+# Partite per task del pool: abbastanza da ammortizzare il passaggio tra processi
+GAMES_PER_TASK = 250
+
+
+def get_positions_dir() -> Path:
+    """Dataset Parquet delle posizioni: un file part-*.parquet per ogni run con partite nuove."""
+    positions_dir = get_data_dir() / "positions"
+    positions_dir.mkdir(parents=True, exist_ok=True)
+    return positions_dir
+
+
+_HASHER = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+_PEZZI = [
+    (piece_type, color, chess.Piece(piece_type, color).symbol(), 64 * ((piece_type - 1) * 2 + color))
+    for piece_type in chess.PIECE_TYPES
+    for color in chess.COLORS
+]
+
+
+def hash_e_fen(board: chess.Board) -> Tuple[int, str]:
+    """
+    Hash Zobrist (Polyglot) e FEN della posizione, in un solo passaggio sui pezzi.
+    Equivale a (chess.polyglot.zobrist_hash(board), board.fen()), ma visita solo le
+    case occupate invece di tutte le 64: è il punto caldo del replay.
+    """
+    griglia = [""] * 64
+    zobrist = 0
+    for piece_type, color, simbolo, base in _PEZZI:
+        for square in chess.scan_reversed(board.pieces_mask(piece_type, color)):
+            griglia[square] = simbolo
+            zobrist ^= _HASHER.array[base + square]
+    zobrist ^= _HASHER.hash_castling(board) ^ _HASHER.hash_ep_square(board) ^ _HASHER.hash_turn(board)
+
+    traverse = []
+    for rank in range(7, -1, -1):
+        traversa, vuote = [], 0
+        for simbolo in griglia[rank * 8:rank * 8 + 8]:
+            if simbolo:
+                if vuote:
+                    traversa.append(str(vuote))
+                    vuote = 0
+                traversa.append(simbolo)
+            else:
+                vuote += 1
+        if vuote:
+            traversa.append(str(vuote))
+        traverse.append("".join(traversa))
+
+    en_passant = chess.SQUARE_NAMES[board.ep_square] if board.has_legal_en_passant() else "-"
+    fen = " ".join(
+        [
+            "/".join(traverse),
+            "w" if board.turn == chess.WHITE else "b",
+            board.castling_xfen(),
+            en_passant,
+            str(board.halfmove_clock),
+            str(board.fullmove_number),
+        ]
+    )
+    return zobrist, fen
+
+
+def replay_game(moves: str | None) -> List[Tuple[int, int, str, str | None]]:
+    """
+    Rigioca le mosse SAN (separate da spazi) dalla posizione iniziale.
+    Restituisce (ply, zobrist, fen, uci) per la posizione iniziale (ply 0, uci None) e per
+    ogni semimossa; una mossa illegale o illeggibile chiude il replay lì (le posizioni
+    precedenti restano valide).
+    """
+    board = chess.Board()
+    records = [(0, *hash_e_fen(board), None)]
+    for ply, san in enumerate((moves or "").split(), start=1):
+        try:
+            move = board.parse_san(san)
+        except ValueError:
+            break
+        board.push(move)
+        records.append((ply, *hash_e_fen(board), move.uci()))
+    return records
+
+
+def _replay_chunk(games: List[Tuple[str, str]]) -> Dict[str, list]:
+    """Task del pool: replay di un gruppo di partite, in colonne (meno oggetti da serializzare)."""
+    colonne: Dict[str, list] = {name: [] for name in POSITIONS_SCHEMA.names}
+    for game_id, moves in games:
+        for ply, zobrist, fen, uci in replay_game(moves):
+            colonne["game_id"].append(game_id)
+            colonne["ply"].append(ply)
+            colonne["zobrist"].append(zobrist)
+            colonne["fen"].append(fen)
+            colonne["uci"].append(uci)
+    return colonne
+
+
+def replay_games(games: Iterable[Tuple[str, str]], workers: int | None = None) -> pa.Table:
+    """
+    Tabella delle posizioni di (id, moves). Le partite sono divise in gruppi da
+    GAMES_PER_TASK e rigiocate in parallelo su `workers` processi (default: tutti i core).
+    """
+    games = list(games)
+    chunks = [games[i:i + GAMES_PER_TASK] for i in range(0, len(games), GAMES_PER_TASK)]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(chunks) <= 1:
+        risultati = map(_replay_chunk, chunks)
+        tables = [pa.Table.from_pydict(c, schema=POSITIONS_SCHEMA) for c in risultati]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tables = [
+                pa.Table.from_pydict(c, schema=POSITIONS_SCHEMA)
+                for c in pool.map(_replay_chunk, chunks)
+            ]
+
+    if not tables:
+        return POSITIONS_SCHEMA.empty_table()
+    return pa.concat_tables(tables)
+
+
+def _replayed_ids() -> set[str]:
+    parts = list(get_positions_dir().glob("part-*.parquet"))
+    if not parts:
+        return set()
+    ids = ds.dataset(parts, format="parquet").to_table(columns=["game_id"]).column("game_id")
+    return set(ids.unique().to_pylist())
+
+
+def update_positions(workers: int | None = None) -> dict:
+    """
+    Replay incrementale: rigioca solo le partite del dataset di lib.ingestion che non sono
+    ancora nella tabella delle posizioni e le scrive in un nuovo Parquet, ordinate per hash
+    (le statistiche dei row group permettono di saltare quasi tutto il file in una ricerca).
+
+    Restituisce un riepilogo: partite rigiocate, posizioni scritte, file Parquet (o None).
+    """
+    parts = list(get_games_dir().glob("part-*.parquet"))
+    if not parts:
+        return {"games": 0, "positions": 0, "parquet": None}
+
+    games = ds.dataset(parts, format="parquet").to_table(columns=["id", "moves"])
+    already = _replayed_ids()
+    nuove = [
+        (game_id, moves)
+        for game_id, moves in zip(games.column("id").to_pylist(), games.column("moves").to_pylist())
+        if game_id is not None and game_id not in already
+    ]
+    # lo stesso id può comparire in più part file: basta rigiocarlo una volta
+    nuove = list(dict(nuove).items())
+    if not nuove:
+        return {"games": 0, "positions": 0, "parquet": None}
+
+    table = replay_games(nuove, workers=workers).sort_by("zobrist")
+
+    part_path = get_positions_dir() / f"part-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.parquet"
+    tmp_path = part_path.with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    tmp_path.replace(part_path)
+    return {"games": len(nuove), "positions": table.num_rows, "parquet": part_path}
+
+
+class PositionIndex:
+    """
+    Indice in memoria hash Zobrist -> partite, su array numpy ordinati per hash:
+    una ricerca è una bisezione (np.searchsorted), qualunque sia il numero di posizioni.
+    """
+
+    def __init__(self, table: pa.Table):
+        table = table.select(["zobrist", "game_id", "ply"]).sort_by("zobrist")
+        self._zobrist = table.column("zobrist").to_numpy()
+        self._game_id = np.asarray(table.column("game_id").to_pylist(), dtype=object)
+        self._ply = table.column("ply").to_numpy()
+
+    def __len__(self) -> int:
+        return len(self._zobrist)
+
+    def _intervallo(self, zobrist: int) -> slice:
+        key = np.uint64(zobrist)
+        return slice(
+            int(np.searchsorted(self._zobrist, key, side="left")),
+            int(np.searchsorted(self._zobrist, key, side="right")),
+        )
+
+    def partite(self, posizione: chess.Board | str | int) -> List[Tuple[str, int]]:
+        """
+        (id partita, ply) delle partite che sono passate dalla posizione:
+        una chess.Board, una FEN o direttamente l'hash Zobrist.
+        """
+        if isinstance(posizione, str):
+            posizione = chess.Board(posizione)
+        if isinstance(posizione, chess.Board):
+            posizione = chess.polyglot.zobrist_hash(posizione)
+        idx = self._intervallo(posizione)
+        return list(zip(self._game_id[idx].tolist(), self._ply[idx].tolist()))
+
+
+def load_positions() -> pa.Table:
+    """Tutta la tabella delle posizioni (vuota se il replay non è ancora stato fatto)."""
+    parts = list(get_positions_dir().glob("part-*.parquet"))
+    if not parts:
+        return POSITIONS_SCHEMA.empty_table()
+    return ds.dataset(parts, format="parquet", schema=POSITIONS_SCHEMA).to_table()
+
+
+@st.cache_resource(show_spinner=False)
+def get_position_index() -> PositionIndex:
+    """Indice delle posizioni condiviso dal processo (replay delle partite nuove all'avvio)."""
+    update_positions()
+    return PositionIndex(load_positions())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay delle mosse in una tabella di posizioni.")
+    parser.add_argument("--workers", type=int, default=None, help="processi del pool (default: tutti i core)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = update_positions(workers=args.workers)
+    print(
+        f"Rigiocate {result['games']} partite, {result['positions']} posizioni "
+        f"-> {result['parquet'] or 'nessun file'}"
+    )
+    print(f"Fatto in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
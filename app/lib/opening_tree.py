@@ -0,0 +1,203 @@
+# lib/opening_tree.py
+
+import re
+import threading
+from typing import Dict, List, Sequence
+
+import pandas as pd
+import streamlit as st
+
+from .backend import run_query
+from .games_service import data_watermark
+from .result_cache import FILTRO_TUTTI
+
+# Profondità dell'albero in semimosse: oltre, le aperture non si ripetono quasi più
+MAX_PLY = 20
+
+RISULTATI = ("win", "draw", "loss")
+
+
+def normalizza_mosse(testo: str | Sequence[str] | None) -> tuple[str, ...]:
+    """
+    Mosse iniziali in SAN come le scrive l'utente ("1.e4 c5 2.Nf3", "e4 c5 Nf3")
+    -> tupla di mosse nel formato della colonna moves: ("e4", "c5", "Nf3").
+    """
+    if testo is None:
+        return ()
+    if not isinstance(testo, str):
+        testo = " ".join(testo)
+    mosse = []
+    for parola in testo.split():
+        parola = re.sub(r"^\d+\.+", "", parola).strip()
+        if parola:
+            mosse.append(parola)
+    return tuple(mosse)
+
+
+class Nodo:
+    """Nodo dell'albero: partite passate da questa sequenza di mosse e loro risultati."""
+
+    __slots__ = ("figli", "win", "draw", "loss", "partite")
+
+    def __init__(self):
+        self.figli: Dict[str, "Nodo"] = {}
+        self.win = 0
+        self.draw = 0
+        self.loss = 0
+        self.partite: List[str] = []
+
+    @property
+    def totale(self) -> int:
+        return self.win + self.draw + self.loss
+
+
+class OpeningTree:
+    """
+    Albero dei prefissi (trie) delle prime MAX_PLY semimosse delle partite di un giocatore.
+
+    Ogni nodo tiene vittorie/patte/sconfitte (dal punto di vista del giocatore) e gli id
+    delle partite (posting list). Trovare un prefisso costa una ricerca in un dict per
+    mossa: il tempo dipende dalla lunghezza del prefisso, non dal numero di partite.
+    Le partite nuove si aggiungono senza ricostruire niente (aggiungi_df): quelle con un
+    id già presente si saltano, qualunque sia la loro data.
+    """
+
+    def __init__(self, max_ply: int = MAX_PLY):
+        self.radice = Nodo()
+        self.max_ply = max_ply
+        self._ids: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def contiene(self, game_id: str) -> bool:
+        return game_id in self._ids
+
+    def aggiungi(self, game_id: str, moves: str | None, risultato: str) -> bool:
+        """Aggiunge una partita (una volta sola per id). Restituisce False se c'era già."""
+        if game_id in self._ids or risultato not in RISULTATI:
+            return False
+        self._ids.add(game_id)
+
+        if not isinstance(moves, str):  # moves mancanti (None/NaN): solo nella radice
+            moves = ""
+        nodo = self.radice
+        percorso = [nodo]
+        for san in moves.split()[: self.max_ply]:
+            nodo = nodo.figli.setdefault(san, Nodo())
+            percorso.append(nodo)
+        for nodo in percorso:
+            setattr(nodo, risultato, getattr(nodo, risultato) + 1)
+            nodo.partite.append(game_id)
+        return True
+
+    def aggiungi_df(self, df: pd.DataFrame) -> int:
+        """Aggiunge le partite di un DataFrame (GAME_ID, MOVES, MY_RESULT)."""
+        aggiunte = 0
+        for game_id, moves, risultato in zip(df["GAME_ID"], df["MOVES"], df["MY_RESULT"]):
+            aggiunte += self.aggiungi(str(game_id), moves, risultato)
+        return aggiunte
+
+    def nodo(self, mosse: Sequence[str]) -> Nodo | None:
+        """Il nodo della sequenza di mosse, None se nessuna partita ci passa (o è troppo lunga)."""
+        nodo = self.radice
+        for san in mosse:
+            nodo = nodo.figli.get(san)
+            if nodo is None:
+                return None
+        return nodo
+
+    def partite(self, mosse: Sequence[str]) -> List[str]:
+        """Id delle partite che iniziano con queste mosse."""
+        nodo = self.nodo(mosse)
+        return list(nodo.partite) if nodo is not None else []
+
+    def prossime_mosse(self, mosse: Sequence[str]) -> pd.DataFrame:
+        """Mosse giocate dopo il prefisso, dalla più frequente, con i risultati del giocatore."""
+        nodo = self.nodo(mosse)
+        righe = []
+        if nodo is not None:
+            for san, figlio in nodo.figli.items():
+                righe.append(
+                    {
+                        "MOSSA": san,
+                        "PARTITE": figlio.totale,
+                        "VINTE": figlio.win,
+                        "PATTE": figlio.draw,
+                        "PERSE": figlio.loss,
+                        "PUNTEGGIO": round(100 * (figlio.win + 0.5 * figlio.draw) / figlio.totale, 1),
+                    }
+                )
+        df = pd.DataFrame(righe, columns=["MOSSA", "PARTITE", "VINTE", "PATTE", "PERSE", "PUNTEGGIO"])
+        return df.sort_values(["PARTITE", "MOSSA"], ascending=[False, True], ignore_index=True)
+
+
+def _where_giocatore(player: str, color: str) -> tuple[str, dict]:
+    where = " WHERE player_name = %(player)s"
+    params: dict = {"player": player}
+    if color != FILTRO_TUTTI:
+        where += " AND my_color = %(my_color)s"
+        params["my_color"] = color
+    return where, params
+
+
+def _carica_ids(player: str, color: str) -> pd.Series:
+    """Solo gli id delle partite del giocatore (per colore): bastano per sapere se ne mancano."""
+    where, params = _where_giocatore(player, color)
+    df = run_query("SELECT id AS GAME_ID FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI" + where, params)
+    return df["GAME_ID"].astype(str)
+
+
+def _carica_partite(player: str, color: str) -> pd.DataFrame:
+    """Partite del giocatore (per colore) da mettere nell'albero."""
+    where, params = _where_giocatore(player, color)
+    return run_query(
+        """
+        SELECT
+            id           AS GAME_ID,
+            moves        AS MOVES,
+            my_result    AS MY_RESULT
+        FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI
+        """
+        + where,
+        params,
+    )
+
+
+class OpeningTrees:
+    """
+    Alberi per (giocatore, colore), costruiti alla prima richiesta e poi aggiornati.
+    Il lock copre anche gli aggiornamenti: un albero non si legge mentre cresce.
+    """
+
+    def __init__(self):
+        self._alberi: Dict[tuple[str, str], OpeningTree] = {}
+        self._watermark: Dict[tuple[str, str], tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, player: str, color: str, watermark: tuple[int, int]) -> OpeningTree:
+        """
+        L'albero del giocatore; se il watermark dei dati è cambiato dall'ultima volta
+        si aggiungono le partite con un id che l'albero non ha ancora, anche se più vecchie
+        di quelle presenti (un nuovo export può contenerne). Prima si leggono solo gli id:
+        le mosse si rileggono solo se manca davvero qualche partita.
+        """
+        key = (player, color)
+        with self._lock:
+            albero = self._alberi.setdefault(key, OpeningTree())
+            if self._watermark.get(key) != watermark:
+                if len(albero) == 0 or not all(map(albero.contiene, _carica_ids(player, color))):
+                    albero.aggiungi_df(_carica_partite(player, color))
+                self._watermark[key] = watermark
+            return albero
+
+
+@st.cache_resource(show_spinner=False)
+def get_opening_trees() -> OpeningTrees:
+    """Alberi delle aperture condivisi dal processo (tutte le sessioni Streamlit)."""
+    return OpeningTrees()
+
+
+def get_opening_tree(player: str, color: str = FILTRO_TUTTI) -> OpeningTree:
+    """Albero delle partite del giocatore (tutte o con un colore), aggiornato ai dati correnti."""
+    return get_opening_trees().get(player, color, data_watermark())
@@ -0,0 +1,207 @@
+# lib/openings_search.py
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from .snowflake_utils import get_rest_auth
+
+SEARCH_SERVICE = "CHESS_DB/schemas/ANALYTICS/cortex-search-services/CHESS_OPENINGS_SEARCH"
+COLUMNS = ["chunk", "file_url", "relative_path", "language"]
+DEFAULT_FILTER = {"@and": [{"@eq": {"language": "English"}}]}
+
+# Cache dei risultati: numero di ricerche, durata, somiglianza minima per le quasi-duplicate
+MAX_ENTRIES = 256
+TTL_S = 3600
+SOGLIA_JACCARD = 0.75
+MAX_WORKERS = 4
+TIMEOUT = (10, 60)  # (connect, read)
+
+# Limite usato per il prefetch: il massimo dello slider, così copre qualunque richiesta
+PREFETCH_LIMIT = 10
+
+# Domande frequenti sugli ordini di mosse della Najdorf, cercate in anticipo
+DOMANDE_FREQUENTI = [
+    "Najdorf 6.Bg5 piano principale e ordine di mosse",
+    "Najdorf Attacco Inglese 6.Be3 e6 o e5",
+    "Najdorf 6.Be2 sistema classico",
+    "Najdorf 6.h3 ordine di mosse",
+    "Najdorf 6.Bc4 attacco Fischer-Sozin",
+    "Najdorf 6.f4 piani per il Nero",
+    "Najdorf 6.g3 fianchetto",
+    "Najdorf avvelenato 6.Bg5 e6 7.f4 Qb6",
+    "perché 5...a6 nella Siciliana Najdorf",
+    "Najdorf 6.Be3 Ng4",
+]
+
+# Parole che non aiutano a distinguere due domande
+_STOPWORDS = {
+    "a", "al", "alla", "che", "come", "con", "cosa", "da", "del", "della", "di", "e", "è",
+    "il", "in", "la", "le", "lo", "nel", "nella", "per", "qual", "quale", "quali", "si",
+    "un", "una", "the", "of", "and", "to", "in", "what", "how", "is", "for", "with",
+    "siciliana", "sicilian", "najdorf",
+}
+
+
+def tokens_domanda(query: str) -> frozenset[str]:
+    """
+    Insieme di parole significative di una domanda, usato per riconoscere le quasi-duplicate.
+    Le mosse (6.Bg5, 7...Qb6) diventano token senza numero e puntini ("bg5", "qb6").
+    """
+    parole = re.findall(r"[\w.]+", (query or "").lower())
+    tokens = set()
+    for parola in parole:
+        parola = re.sub(r"^\d+\.+", "", parola).strip(".")
+        if parola and parola not in _STOPWORDS:
+            tokens.add(parola)
+    return frozenset(tokens)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class SearchCache:
+    """
+    Cache LRU dei risultati di Cortex Search con chiave (query, limit, filter).
+
+    Una ricerca salvata con limite L risponde anche a richieste con limite <= L,
+    e a domande quasi uguali (Jaccard delle parole >= SOGLIA_JACCARD) con lo stesso filtro.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_s: float = TTL_S):
+        self._entries: OrderedDict = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chiave_filtro(filtro: Dict[str, Any] | None) -> str:
+        return json.dumps(filtro or {}, sort_keys=True)
+
+    def get(self, query: str, limit: int, filtro: Dict[str, Any] | None) -> List[dict] | None:
+        tokens = tokens_domanda(query)
+        chiave_filtro = self._chiave_filtro(filtro)
+        adesso = time.monotonic()
+
+        with self._lock:
+            migliore, punteggio = None, SOGLIA_JACCARD
+            for key in reversed(self._entries):
+                results, creato = self._entries[key]
+                q_tokens, q_limit, q_filtro = key
+                if q_filtro != chiave_filtro or q_limit < limit or adesso - creato > self._ttl_s:
+                    continue
+                somiglianza = jaccard(tokens, q_tokens)
+                if somiglianza == 1.0:
+                    migliore = key
+                    break
+                if somiglianza >= punteggio:
+                    migliore, punteggio = key, somiglianza
+
+            if migliore is None:
+                return None
+            self._entries.move_to_end(migliore)
+            return list(self._entries[migliore][0][:limit])
+
+    def put(self, query: str, limit: int, filtro: Dict[str, Any] | None, results: List[dict]) -> None:
+        key = (tokens_domanda(query), int(limit), self._chiave_filtro(filtro))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (list(results), time.monotonic())
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+class OpeningsSearchClient:
+    """
+    Client per il Cortex Search service CHESS_OPENINGS_SEARCH.
+
+    - risultati in cache (SearchCache), condivisa da tutte le sessioni
+    - cerca gira sul thread dello script: il prompt dipende dai risultati, non c'è niente
+      da sovrapporre; il pool di thread serve solo al prefetch delle domande frequenti
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+        self.cache = SearchCache()
+        self._prefetch_avviato = False
+        self._lock = threading.Lock()
+
+    def cerca(
+        self,
+        query: str,
+        limit: int,
+        filtro: Dict[str, Any] | None = DEFAULT_FILTER,
+    ) -> List[dict]:
+        """Risultati dalla cache o da Cortex Search, sul thread dello script."""
+        in_cache = self.cache.get(query, limit, filtro)
+        if in_cache is not None:
+            return in_cache
+
+        base_url, token = get_rest_auth()
+        return self._cerca(base_url, token, query, limit, filtro)
+
+    def prefetch(
+        self,
+        domande: Iterable[str] = DOMANDE_FREQUENTI,
+        limit: int = PREFETCH_LIMIT,
+        filtro: Dict[str, Any] | None = DEFAULT_FILTER,
+    ) -> None:
+        """Cerca in anticipo (una volta per processo) le domande frequenti."""
+        with self._lock:
+            if self._prefetch_avviato:
+                return
+            self._prefetch_avviato = True
+
+        base_url, token = get_rest_auth()
+        for domanda in domande:
+            if self.cache.get(domanda, limit, filtro) is None:
+                future = self._executor.submit(self._cerca, base_url, token, domanda, limit, filtro)
+                # un prefetch fallito non deve dare fastidio a nessuno
+                future.add_done_callback(lambda f: f.exception())
+
+    def _cerca(
+        self,
+        base_url: str,
+        token: str,
+        query: str,
+        limit: int,
+        filtro: Dict[str, Any] | None,
+    ) -> List[dict]:
+        url = f"{base_url}/api/v2/databases/{SEARCH_SERVICE}:query"
+        body = {"query": query, "limit": limit, "columns": COLUMNS}
+        if filtro:
+            body["filter"] = filtro
+
+        headers = {
+            "Authorization": f'Snowflake Token="{token}"',
+            "Content-Type": "application/json",
+        }
+
+        resp = self._http.post(url, json=body, headers=headers, timeout=TIMEOUT)
+        if resp.status_code >= 400:
+            raise RuntimeError(f"Errore Cortex Search {resp.status_code}:\n{resp.text}")
+
+        results = resp.json().get("results", [])
+        self.cache.put(query, limit, filtro, results)
+        return results
+
+
+@st.cache_resource(show_spinner=False)
+def get_openings_search_client() -> OpeningsSearchClient:
+    """Client condiviso dal processo (cache, pool di thread e connessioni HTTP)."""
+    return OpeningsSearchClient()
@@ -0,0 +1,138 @@
+# lib/result_cache.py
+
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+# Valore dei filtri che significa "nessun filtro" (come in games_service)
+FILTRO_TUTTI = "Tutti"
+
+# Limiti della cache: numero di risultati e memoria totale occupata dai DataFrame
+MAX_ENTRIES = 128
+MAX_BYTES = int(float(os.environ.get("CHESS_RESULT_CACHE_MB", "64")) * 1024 * 1024)
+
+# Filtri della sidebar: (player, speed, result, color, (min_rating, max_rating), mosse iniziali)
+Filters = tuple[str, str, str, str, tuple[int, int], tuple[str, ...]]
+# Cursore keyset: (game_date ISO, game_id)
+Cursor = tuple[str, str] | None
+
+
+def filters_cover(wide: Filters, narrow: Filters) -> bool:
+    """True se ogni riga che soddisfa `narrow` soddisfa anche `wide`."""
+    # il giocatore non è mai "Tutti": ogni risultato è la prospettiva di un solo giocatore
+    if wide[0] != narrow[0]:
+        return False
+
+    for w, n in zip(wide[1:4], narrow[1:4]):
+        if w != FILTRO_TUTTI and w != n:
+            return False
+
+    (w_min, w_max), (n_min, n_max) = wide[4], narrow[4]
+    if w_min is not None and (n_min is None or n_min < w_min):
+        return False
+    if w_max is not None and (n_max is None or n_max > w_max):
+        return False
+
+    # le mosse non sono nei risultati: si riusa solo un risultato con le stesse mosse iniziali
+    return wide[5] == narrow[5]
+
+
+def cursor_within(wide: Cursor, narrow: Cursor) -> bool:
+    """True se la pagina che parte da `narrow` inizia dentro (o dopo) quella che parte da `wide`."""
+    if wide is None:
+        return True
+    return narrow is not None and narrow <= wide
+
+
+def apply_filters(df: pd.DataFrame, filters: Filters, after: Cursor) -> pd.DataFrame:
+    """Riapplica in locale gli stessi predicati di games_service._build_where (più il cursore)."""
+    _, speed, result, color, (min_rating, max_rating), _ = filters
+    mask = pd.Series(True, index=df.index)
+
+    if speed != FILTRO_TUTTI:
+        mask &= df["SPEED"] == speed
+    if result != FILTRO_TUTTI:
+        mask &= df["MY_RESULT"] == result
+    if color != FILTRO_TUTTI:
+        mask &= df["MY_COLOR"] == color
+    if min_rating is not None:
+        mask &= df["OPPONENT_RATING"] >= int(min_rating)
+    if max_rating is not None:
+        mask &= df["OPPONENT_RATING"] <= int(max_rating)
+
+    if after is not None:
+        after_date, after_id = pd.Timestamp(after[0]), after[1]
+        game_date = pd.to_datetime(df["GAME_DATE"]).dt.normalize()
+        mask &= (game_date < after_date) | (
+            (game_date == after_date) & (df["GAME_ID"].astype(str) < after_id)
+        )
+
+    return df[mask.fillna(False)]
+
+
+class FilterResultCache:
+    """
+    Cache LRU dei risultati di load_games_page che sa rispondere a filtri più stretti.
+
+    Un risultato salvato con filtri F (e cursore c, limite L) contiene, in ordine,
+    tutte le righe di F fino alla sua ultima riga. Per una richiesta con filtri
+    F' ⊆ F e cursore c' ≥ c basta quindi filtrarlo in locale: la risposta è esatta se
+    il risultato salvato era completo (meno di L righe) oppure se dopo il filtro
+    restano almeno tante righe quante ne chiede la nuova richiesta.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def get(self, filters: Filters, after: Cursor, limit: int) -> pd.DataFrame | None:
+        with self._lock:
+            for key in reversed(self._entries):
+                df, complete, nbytes = self._entries[key]
+                wide_filters, wide_after, _ = key
+                if not (filters_cover(wide_filters, filters) and cursor_within(wide_after, after)):
+                    continue
+
+                local = apply_filters(df, filters, after)
+                if complete or len(local) >= limit:
+                    self._entries.move_to_end(key)
+                    return local.head(limit).reset_index(drop=True).copy()
+        return None
+
+    def count(self, filters: Filters) -> int | None:
+        """Numero di righe per `filters`, se una voce completa senza cursore le contiene tutte."""
+        with self._lock:
+            for (wide_filters, wide_after, _), (df, complete, _) in self._entries.items():
+                if complete and wide_after is None and filters_cover(wide_filters, filters):
+                    return len(apply_filters(df, filters, None))
+        return None
+
+    def put(self, filters: Filters, after: Cursor, limit: int, df: pd.DataFrame) -> None:
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self._max_bytes:
+            return
+
+        key = (filters, after, int(limit))
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (df, len(df) < limit, nbytes)
+            self._bytes += nbytes
+
+            while self._entries and (
+                len(self._entries) > self._max_entries or self._bytes > self._max_bytes
+            ):
+                _, (_, _, old_bytes) = self._entries.popitem(last=False)
+                self._bytes -= old_bytes
+
+
+@st.cache_resource(show_spinner=False)
+def get_result_cache() -> FilterResultCache:
+    """Cache condivisa dal processo (tutte le sessioni Streamlit)."""
+    return FilterResultCache()
@@ -0,0 +1,138 @@
+# lib/result_store.py
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from .ingestion import get_data_dir
+
+# Memoria massima dei risultati tenuti in RAM; oltre si scrivono su disco in Parquet
+MAX_BYTES = int(float(os.environ.get("CHESS_RESULT_STORE_MB", "128")) * 1024 * 1024)
+# Spazio massimo dei Parquet scritti su disco da questo processo; oltre si cancellano i meno usati
+MAX_DISK_BYTES = int(float(os.environ.get("CHESS_RESULT_STORE_DISK_MB", "1024")) * 1024 * 1024)
+# I file su disco più vecchi di così vengono cancellati all'avvio (anche quelli di altri processi)
+SPILL_TTL_S = 24 * 3600
+
+
+class ResultStore:
+    """
+    Deposito dei risultati (DataFrame) delle query SQL mostrate in cronologia.
+
+    La cronologia in session_state tiene solo un token per blocco; i DataFrame stanno qui,
+    in un LRU in memoria con un limite in byte. Quando il limite è superato i meno usati
+    vengono scritti in Parquet su disco e riletti alla richiesta successiva: ridisegnare
+    la cronologia non rilancia mai le query sul warehouse.
+
+    Anche il disco è un LRU con un limite in byte (max_disk_bytes): oltre, i file meno
+    usati si cancellano e quei risultati vanno ricalcolati (mostra_contenuto rilancia la
+    query). I file si scrivono in un .tmp e si rinominano sotto lock, e si leggono e
+    cancellano sotto lock: una lettura non trova mai un file a metà o appena sparito.
+    """
+
+    def __init__(self, spill_dir: Path, max_bytes: int = MAX_BYTES, max_disk_bytes: int = MAX_DISK_BYTES):
+        self._dir = spill_dir
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._memoria: OrderedDict[str, tuple[pd.DataFrame, int]] = OrderedDict()
+        self._bytes = 0
+        self._max_bytes = max_bytes
+        # file su disco di questo processo: token -> byte, dal meno usato
+        self._disco: OrderedDict[str, int] = OrderedDict()
+        self._disco_bytes = 0
+        self._max_disk_bytes = max_disk_bytes
+        # risultati tolti dalla memoria e non ancora su disco: get li trova qui
+        self._in_scrittura: dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+        self._pulisci_disco()
+
+    def _file(self, token: str) -> Path:
+        return self._dir / f"{token}.parquet"
+
+    def _pulisci_disco(self) -> None:
+        limite = time.time() - SPILL_TTL_S
+        for path in self._dir.glob("*.parquet*"):
+            if path.stat().st_mtime < limite:
+                path.unlink(missing_ok=True)
+
+    @property
+    def disk_bytes(self) -> int:
+        return self._disco_bytes
+
+    def put(self, df: pd.DataFrame) -> str:
+        """Salva un risultato e restituisce il token con cui rileggerlo."""
+        token = uuid.uuid4().hex
+        self._in_memoria(token, df)
+        return token
+
+    def get(self, token: str | None) -> pd.DataFrame | None:
+        """Il risultato del token (dalla memoria o dal disco), None se non c'è più."""
+        if not token:
+            return None
+        with self._lock:
+            voce = self._memoria.get(token)
+            if voce is not None:
+                self._memoria.move_to_end(token)
+                return voce[0]
+            if token in self._in_scrittura:
+                return self._in_scrittura[token]
+            if token not in self._disco:
+                return None
+            df = pd.read_parquet(self._file(token))
+            self._disco_bytes -= self._disco.pop(token)
+            self._file(token).unlink(missing_ok=True)
+            # torna in memoria nello stesso lock: un get concorrente lo trova già lì
+            da_scrivere = self._aggiungi(token, df)
+
+        self._scrivi_su_disco(da_scrivere)
+        return df
+
+    def _in_memoria(self, token: str, df: pd.DataFrame) -> None:
+        with self._lock:
+            da_scrivere = self._aggiungi(token, df)
+        self._scrivi_su_disco(da_scrivere)
+
+    def _aggiungi(self, token: str, df: pd.DataFrame) -> list[tuple[str, pd.DataFrame]]:
+        """Mette df nell'LRU in memoria (col lock preso); restituisce i risultati da scrivere su disco."""
+        nbytes = int(df.memory_usage(deep=True).sum())
+        self._memoria[token] = (df, nbytes)
+        self._bytes += nbytes
+        da_scrivere = []
+        while len(self._memoria) > 1 and self._bytes > self._max_bytes:
+            vecchio, (vecchio_df, vecchi_bytes) = self._memoria.popitem(last=False)
+            self._bytes -= vecchi_bytes
+            self._in_scrittura[vecchio] = vecchio_df
+            da_scrivere.append((vecchio, vecchio_df))
+        return da_scrivere
+
+    def _scrivi_su_disco(self, da_scrivere: list[tuple[str, pd.DataFrame]]) -> None:
+        # la scrittura (lenta) è fuori dal lock; il file compare col rename, sotto lock
+        for vecchio, vecchio_df in da_scrivere:
+            tmp = self._file(vecchio).with_suffix(".parquet.tmp")
+            try:
+                vecchio_df.to_parquet(tmp, index=False)
+                dimensione = tmp.stat().st_size
+            except Exception:
+                tmp.unlink(missing_ok=True)
+                with self._lock:
+                    self._in_scrittura.pop(vecchio, None)
+                continue
+            with self._lock:
+                self._in_scrittura.pop(vecchio, None)
+                os.replace(tmp, self._file(vecchio))
+                self._disco[vecchio] = dimensione
+                self._disco_bytes += dimensione
+                while self._disco and self._disco_bytes > self._max_disk_bytes:
+                    eliminato, byte_eliminati = self._disco.popitem(last=False)
+                    self._disco_bytes -= byte_eliminati
+                    self._file(eliminato).unlink(missing_ok=True)
+
+
+@st.cache_resource(show_spinner=False)
+def get_result_store() -> ResultStore:
+    """Deposito condiviso dal processo (tutte le sessioni Streamlit)."""
+    return ResultStore(get_data_dir() / "analyst_results")
@@ -1,19 +1,41 @@
 # lib/snowflake_utils.py
 
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
 
 import streamlit as st
 import snowflake.connector
+from snowflake.connector.cursor import SnowflakeCursor
+from snowflake.connector.errors import DatabaseError
 from dotenv import load_dotenv
 
 # Carica le variabili dal .env una volta sola
 load_dotenv()
 
+T = TypeVar("T")
 
-@st.cache_resource(show_spinner=False)
-def get_sf_connection():
+# Numero massimo di connessioni aperte contemporaneamente (una per query in corso)
+POOL_SIZE = int(os.environ.get("SNOWFLAKE_POOL_SIZE", "4"))
+# Attesa massima per avere una connessione libera dal pool
+POOL_TIMEOUT_S = float(os.environ.get("SNOWFLAKE_POOL_TIMEOUT", "30"))
+# Una connessione ferma da più di così viene verificata con un SELECT 1 prima dell'uso
+HEALTHCHECK_AFTER_S = 300
+
+# Base URL delle REST API Cortex. Vuota: l'host dell'account Snowflake; impostata
+# (es. http://127.0.0.1:8765) si usa un server sostitutivo, vedi lib.cortex_standin
+REST_BASE_URL = os.environ.get("CORTEX_REST_BASE_URL", "").strip().rstrip("/")
+
+# Codici Snowflake per sessione/token scaduti: si riconnette e si riprova
+SESSION_EXPIRED_ERRNOS = {390111, 390112, 390114}
+
+
+def _connect() -> snowflake.connector.SnowflakeConnection:
     """
-    Crea (e cache-a) una connessione a Snowflake usando le env vars.
+    Apre una nuova connessione a Snowflake usando le env vars.
 
     Env richieste:
     - SNOWFLAKE_ACCOUNT
@@ -22,15 +44,15 @@ def get_sf_connection():
     - opzionali: SNOWFLAKE_WAREHOUSE, SNOWFLAKE_DATABASE, SNOWFLAKE_SCHEMA
     """
     try:
-        conn = snowflake.connector.connect(
+        return snowflake.connector.connect(
             account=os.environ["SNOWFLAKE_ACCOUNT"],
             user=os.environ["SNOWFLAKE_USER"],
             password=os.environ["SNOWFLAKE_PASSWORD"],
             warehouse=os.environ.get("SNOWFLAKE_WAREHOUSE", "CHESS_WH"),
             database=os.environ.get("SNOWFLAKE_DATABASE", "CHESS_DB"),
             schema=os.environ.get("SNOWFLAKE_SCHEMA", "RAW"),
+            client_session_keep_alive=True,
         )
-        return conn
     except KeyError as ke:
         st.error(
             f"Manca una variabile d'ambiente per Snowflake: {ke}. "
@@ -40,3 +62,132 @@ def get_sf_connection():
     except Exception as e:
         st.error(f"Errore di connessione a Snowflake: {e}")
         st.stop()
+
+
+def is_session_expired(exc: BaseException) -> bool:
+    """True se l'errore indica una sessione o un token Snowflake scaduti."""
+    return isinstance(exc, DatabaseError) and getattr(exc, "errno", None) in SESSION_EXPIRED_ERRNOS
+
+
+class SnowflakePool:
+    """
+    Pool limitato di connessioni Snowflake condiviso da tutte le sessioni Streamlit.
+
+    Ogni query prende in prestito una connessione (una per thread) e la restituisce
+    alla fine, così utenti diversi non si mettono in coda sulla stessa connessione.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT_S):
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._size = size
+        self._timeout = timeout
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.is_closed():
+            return False
+        if time.monotonic() - idle_since < HEALTHCHECK_AFTER_S:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise TimeoutError(
+                f"Nessuna connessione Snowflake libera dopo {self._timeout:.0f}s "
+                f"(pool da {self._size})."
+            )
+        try:
+            while True:
+                try:
+                    conn, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return _connect()
+                if self._is_healthy(conn, idle_since):
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken: bool = False) -> None:
+        try:
+            if broken or conn.is_closed():
+                self._discard(conn)
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _discard(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+@st.cache_resource(show_spinner=False)
+def get_sf_pool() -> SnowflakePool:
+    """Crea (e cache-a) il pool di connessioni, uno per processo."""
+    return SnowflakePool()
+
+
+@contextmanager
+def sf_connection() -> Iterator[snowflake.connector.SnowflakeConnection]:
+    """
+    Prende in prestito una connessione dal pool e la restituisce all'uscita.
+    Se la connessione risulta scaduta viene scartata (la prossima sarà nuova).
+    """
+    pool = get_sf_pool()
+    conn = pool.acquire()
+    broken = False
+    try:
+        yield conn
+    except Exception as e:
+        broken = is_session_expired(e)
+        raise
+    finally:
+        pool.release(conn, broken=broken)
+
+
+@contextmanager
+def sf_cursor() -> Iterator[SnowflakeCursor]:
+    """Cursore su una connessione del pool, chiuso sempre all'uscita."""
+    with sf_connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+
+def run_with_reconnect(work: Callable[[snowflake.connector.SnowflakeConnection], T]) -> T:
+    """
+    Esegue work(conn) su una connessione del pool; se la sessione è scaduta
+    riprova una volta su una connessione nuova, in modo trasparente.
+    """
+    try:
+        with sf_connection() as conn:
+            return work(conn)
+    except DatabaseError as e:
+        if not is_session_expired(e):
+            raise
+    with sf_connection() as conn:
+        return work(conn)
+
+
+def get_rest_auth() -> tuple[str, str]:
+    """
+    Base URL (https://<host dell'account>) e token di sessione per le REST API Cortex
+    (Analyst, Search, ...), presi da una connessione sana del pool.
+    Con CORTEX_REST_BASE_URL non si apre nessuna connessione: il token è CORTEX_REST_TOKEN.
+    """
+    if REST_BASE_URL:
+        return REST_BASE_URL, os.environ.get("CORTEX_REST_TOKEN", "standin")
+    with sf_connection() as conn:
+        return f"https://{conn.host}", conn.rest.token
@@ -0,0 +1,161 @@
+# lib/sse.py
+
+import re
+import time
+from typing import Iterable, Iterator
+
+import streamlit as st
+
+# Ogni quanto (al massimo) ridisegnare il testo in streaming, e dopo quanti caratteri
+# in attesa ridisegnare comunque
+RENDER_INTERVAL_S = 0.05
+RENDER_MAX_CHARS = 2048
+
+_FINE_RIGA = re.compile(rb"\r\n|\r|\n")
+
+
+def iter_sse(chunks: Iterable[bytes]) -> Iterator[tuple[str, str]]:
+    """
+    Parser incrementale di Server-Sent Events: riceve i byte così come arrivano
+    (es. resp.iter_content(chunk_size=None)) e restituisce (event, data) per ogni frame.
+
+    - accetta fine riga \\n, \\r\\n e \\r, anche spezzate tra un chunk e l'altro
+    - più righe data: dello stesso frame sono unite con \\n
+    - l'ultimo frame viene emesso anche se lo stream finisce senza riga vuota
+    """
+    # pezzi della riga non ancora terminata: ogni byte arrivato viene esaminato una volta sola,
+    # anche quando un frame grande (es. un result_set) arriva in tanti chunk piccoli
+    pezzi: list[bytes] = []
+    cr_in_sospeso = False  # il chunk precedente finiva con \r: un \n iniziale è la sua metà
+    event, data_lines = None, []
+
+    def _frame():
+        return event or "message", "\n".join(data_lines)
+
+    def _campo(raw: bytes) -> None:
+        nonlocal event
+        # decodifica per riga: un carattere UTF-8 non viene mai spezzato a metà
+        line = raw.decode("utf-8", errors="replace")
+        if line.startswith(":"):
+            return  # commento / keep-alive
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event = value.strip()
+        elif field == "data":
+            data_lines.append(value)
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        inizio = 0
+        if cr_in_sospeso and chunk.startswith(b"\n"):
+            inizio = 1
+        cr_in_sospeso = False
+
+        for fine in _FINE_RIGA.finditer(chunk, inizio):
+            raw = chunk[inizio:fine.start()]
+            if pezzi:
+                raw = b"".join(pezzi) + raw
+                pezzi = []
+            inizio = fine.end()
+            if fine.group() == b"\r" and inizio == len(chunk):
+                cr_in_sospeso = True
+
+            if not raw:
+                if data_lines:
+                    yield _frame()
+                event, data_lines = None, []
+            else:
+                _campo(raw)
+
+        if inizio < len(chunk):
+            pezzi.append(chunk[inizio:])
+
+    raw = b"".join(pezzi)
+    if raw:
+        _campo(raw)
+    if data_lines:
+        yield _frame()
+
+
+def _ultimo_confine(testo: str) -> int:
+    """
+    Posizione subito dopo l'ultimo paragrafo completo (riga vuota) che non cade
+    dentro un blocco di codice ``` aperto; 0 se non ce n'è.
+    """
+    idx = testo.rfind("\n\n")
+    while idx >= 0:
+        if testo.count("```", 0, idx) % 2 == 0:
+            return idx + 2
+        idx = testo.rfind("\n\n", 0, idx)
+    return 0
+
+
+class StreamingMarkdown:
+    """
+    Disegna in streaming un testo markdown che arriva a pezzi (delta di un LLM).
+
+    - i delta finiscono in una lista e si uniscono solo quando si ridisegna
+    - si ridisegna al più ogni `interval_s` secondi (o quando ci sono `max_chars` caratteri
+      in attesa), non a ogni delta
+    - i paragrafi completi vengono "congelati" in un elemento proprio e non si ridisegnano
+      più: a ogni aggiornamento si manda solo l'ultimo paragrafo, non tutta la risposta
+    """
+
+    def __init__(
+        self,
+        parent=None,
+        interval_s: float = RENDER_INTERVAL_S,
+        max_chars: int = RENDER_MAX_CHARS,
+    ):
+        self._slot = (parent or st).empty()
+        self._box = self._slot.container()
+        self._coda_el = self._box.empty()
+        self._chiusi: list[str] = []
+        self._coda: list[str] = []
+        self._pendenti = 0
+        self._ultimo = 0.0
+        self._interval_s = interval_s
+        self._max_chars = max_chars
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chiusi) + "".join(self._coda)
+
+    def add(self, delta: str) -> None:
+        if not delta:
+            return
+        self._coda.append(delta)
+        self._pendenti += len(delta)
+        adesso = time.monotonic()
+        if adesso - self._ultimo >= self._interval_s or self._pendenti >= self._max_chars:
+            self._flush(adesso)
+
+    def _flush(self, adesso: float) -> None:
+        testo = "".join(self._coda)
+        taglio = _ultimo_confine(testo)
+        if taglio:
+            self._coda_el.markdown(testo[:taglio])
+            self._chiusi.append(testo[:taglio])
+            self._coda_el = self._box.empty()
+            testo = testo[taglio:]
+
+        self._coda = [testo] if testo else []
+        if testo:
+            self._coda_el.markdown(testo)
+        self._pendenti = 0
+        self._ultimo = adesso
+
+    def close(self, final_text: str | None = None) -> str:
+        """
+        Ultimo aggiornamento. Se `final_text` (la risposta aggregata) è diverso dal testo
+        arrivato a delta, lo sostituisce. Restituisce il testo mostrato.
+        """
+        if final_text and final_text != self.text:
+            self._slot.markdown(final_text)
+            self._chiusi, self._coda = [final_text], []
+        else:
+            self._flush(time.monotonic())
+        return self.text
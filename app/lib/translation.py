@@ -0,0 +1,247 @@
+# lib/translation.py
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from .backend import BACKEND_SNOWFLAKE, run_query
+from .ingestion import get_data_dir
+
+# Oltre questa lunghezza il testo viene spezzato (paragrafi, poi frasi) e tradotto a pezzi
+MAX_CHARS = 2000
+# Pezzi tradotti da una singola query (una riga per pezzo)
+MAX_BATCH = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    key         TEXT PRIMARY KEY,
+    target      TEXT NOT NULL,
+    source_text TEXT NOT NULL,
+    translated  TEXT NOT NULL,
+    created_at  REAL NOT NULL
+);
+"""
+
+# La stessa query traduce tutti i pezzi: FLATTEN dell'array JSON, una riga per elemento
+_TRANSLATE_SQL = """
+SELECT
+    f.index AS I,
+    SNOWFLAKE.CORTEX.TRANSLATE(f.value::STRING, '', %(target)s) AS T
+FROM TABLE(FLATTEN(INPUT => PARSE_JSON(%(testi)s))) f
+"""
+
+# Traduzioni già lette dal disco in questo processo (evita anche la lettura SQLite ai rerun)
+_MEMORIA: dict[str, str] = {}
+_MEMORIA_MAX = 4096
+# Pezzi che Cortex non ha tradotto (o query fallita): chiave -> scadenza. Fino ad allora si
+# mostra l'originale senza rilanciare la query a ogni rerun
+_FALLITI: dict[str, float] = {}
+FALLITI_TTL_S = 600
+_lock = threading.Lock()
+
+
+def _db_path() -> Path:
+    return get_data_dir() / "translations.sqlite"
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(_db_path(), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _chiave(testo: str, target: str) -> str:
+    return hashlib.sha256(f"{target}\x00{testo}".encode("utf-8")).hexdigest()
+
+
+def _taglia(testo: str, max_chars: int) -> List[str]:
+    """Taglio netto, cercando almeno uno spazio su cui spezzare."""
+    pezzi = []
+    while len(testo) > max_chars:
+        taglio = testo.rfind(" ", 0, max_chars)
+        if taglio <= 0:
+            taglio = max_chars
+        pezzi.append(testo[:taglio])
+        testo = testo[taglio:]
+    pezzi.append(testo)
+    return pezzi
+
+
+def dividi_testo(testo: str, max_chars: int = MAX_CHARS) -> List[Tuple[str, str]]:
+    """
+    Spezza un testo lungo in pezzi di al massimo `max_chars` caratteri.
+    Restituisce coppie (pezzo, separatore che lo segue): unendo pezzo + separatore
+    si ricostruisce il testo originale. Si spezza prima sui paragrafi, poi sulle frasi.
+    """
+    if len(testo) <= max_chars:
+        return [(testo, "")]
+
+    risultato: List[Tuple[str, str]] = []
+    parti = re.split(r"(\n\s*\n)", testo)
+    for i in range(0, len(parti), 2):
+        paragrafo = parti[i]
+        separatore = parti[i + 1] if i + 1 < len(parti) else ""
+        if len(paragrafo) <= max_chars:
+            risultato.append((paragrafo, separatore))
+            continue
+
+        frasi = re.split(r"(?<=[.!?])(\s+)", paragrafo)
+        corrente, sep_corrente = "", ""
+        for j in range(0, len(frasi), 2):
+            frase = frasi[j]
+            sep_frase = frasi[j + 1] if j + 1 < len(frasi) else ""
+            if corrente and len(corrente) + len(sep_corrente) + len(frase) > max_chars:
+                risultato.append((corrente, sep_corrente))
+                corrente, sep_corrente = "", ""
+            if len(frase) > max_chars:
+                *interi, frase = _taglia(frase, max_chars)
+                risultato.extend((pezzo, "") for pezzo in interi)
+            corrente = f"{corrente}{sep_corrente}{frase}"
+            sep_corrente = sep_frase
+        risultato.append((corrente, sep_corrente + separatore))
+
+    # un pezzo vuoto porta solo il suo separatore: va attaccato al pezzo precedente,
+    # altrimenti il testo ricomposto perde gli a capo (o gli spazi) tra i paragrafi
+    compatto: List[Tuple[str, str]] = []
+    for pezzo, separatore in risultato:
+        if pezzo or not compatto:
+            compatto.append((pezzo, separatore))
+        else:
+            compatto[-1] = (compatto[-1][0], compatto[-1][1] + separatore)
+    return compatto
+
+
+def _leggi_cache(chiavi: Iterable[str]) -> dict[str, str]:
+    chiavi = list(chiavi)
+    trovate = {}
+    with _lock:
+        for k in chiavi:
+            if k in _MEMORIA:
+                trovate[k] = _MEMORIA[k]
+    mancanti = [k for k in chiavi if k not in trovate]
+    if not mancanti:
+        return trovate
+
+    conn = _connect()
+    try:
+        for i in range(0, len(mancanti), 500):
+            gruppo = mancanti[i:i + 500]
+            segnaposto = ",".join("?" * len(gruppo))
+            trovate.update(
+                conn.execute(
+                    f"SELECT key, translated FROM translations WHERE key IN ({segnaposto})",
+                    gruppo,
+                ).fetchall()
+            )
+    finally:
+        conn.close()
+    _ricorda(trovate)
+    return trovate
+
+
+def _scrivi_cache(righe: List[Tuple[str, str, str, str]]) -> None:
+    """righe: (key, target, source_text, translated)."""
+    if not righe:
+        return
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                [(*r, now) for r in righe],
+            )
+    finally:
+        conn.close()
+    _ricorda({r[0]: r[3] for r in righe})
+
+
+def _ricorda(traduzioni: dict[str, str]) -> None:
+    with _lock:
+        if len(_MEMORIA) + len(traduzioni) > _MEMORIA_MAX:
+            _MEMORIA.clear()
+        _MEMORIA.update(traduzioni)
+
+
+def _falliti_recenti(chiavi: Iterable[str]) -> set[str]:
+    adesso = time.monotonic()
+    with _lock:
+        for k in [k for k, scadenza in _FALLITI.items() if scadenza <= adesso]:
+            del _FALLITI[k]
+        return {k for k in chiavi if k in _FALLITI}
+
+
+def _ricorda_falliti(chiavi: Iterable[str]) -> None:
+    scadenza = time.monotonic() + FALLITI_TTL_S
+    with _lock:
+        if len(_FALLITI) > _MEMORIA_MAX:
+            _FALLITI.clear()
+        _FALLITI.update((k, scadenza) for k in chiavi)
+
+
+def _traduci_su_snowflake(pezzi: List[str], target: str) -> List[str | None]:
+    """
+    Una query per ogni gruppo di MAX_BATCH pezzi; restituisce le traduzioni nello stesso
+    ordine (None se Cortex non ha restituito nulla per quel pezzo).
+    """
+    tradotti: List[str | None] = [None] * len(pezzi)
+    for inizio in range(0, len(pezzi), MAX_BATCH):
+        gruppo = pezzi[inizio:inizio + MAX_BATCH]
+        df = run_query(
+            _TRANSLATE_SQL,
+            {"testi": json.dumps(gruppo), "target": target},
+            backend=BACKEND_SNOWFLAKE,
+        )
+        for indice, testo in zip(df["I"], df["T"]):
+            if isinstance(testo, str) and testo:
+                tradotti[inizio + int(indice)] = testo
+    return tradotti
+
+
+def traduci_testi(testi: Iterable[str], target: str = "it") -> dict[str, str]:
+    """
+    Traduce un insieme di testi con SNOWFLAKE.CORTEX.TRANSLATE (lingua sorgente automatica).
+
+    - cache persistente su SQLite (data/translations.sqlite), condivisa tra processi
+    - i pezzi non in cache vengono tradotti tutti insieme, in una sola query per gruppo
+    - i testi più lunghi di MAX_CHARS sono spezzati su paragrafi/frasi e ricomposti
+
+    Restituisce {testo originale: testo tradotto}. Gli errori Snowflake vengono propagati;
+    i pezzi non tradotti (o della query fallita) restano originali per FALLITI_TTL_S secondi
+    senza nuove query.
+    """
+    originali = {t for t in testi if t and t.strip()}
+    if not originali:
+        return {}
+
+    divisi = {t: dividi_testo(t.strip()) for t in originali}
+    pezzi = {p for parti in divisi.values() for p, _ in parti if p.strip()}
+    chiavi = {p: _chiave(p, target) for p in pezzi}
+
+    in_cache = _leggi_cache(chiavi.values())
+    falliti = _falliti_recenti(chiavi.values())
+    da_tradurre = sorted(p for p in pezzi if chiavi[p] not in in_cache and chiavi[p] not in falliti)
+
+    if da_tradurre:
+        try:
+            tradotti = _traduci_su_snowflake(da_tradurre, target)
+        except Exception:
+            _ricorda_falliti(chiavi[p] for p in da_tradurre)
+            raise
+        nuovi = [
+            (chiavi[p], target, p, t) for p, t in zip(da_tradurre, tradotti) if t is not None
+        ]
+        _ricorda_falliti(chiavi[p] for p, t in zip(da_tradurre, tradotti) if t is None)
+        _scrivi_cache(nuovi)
+        in_cache.update({k: t for k, _, _, t in nuovi})
+
+    return {
+        t: "".join(in_cache.get(chiavi.get(p), p) + sep for p, sep in divisi[t])
+        for t in originali
+    }
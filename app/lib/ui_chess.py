@@ -1,8 +1,17 @@
 # lib/ui_chess.py
 
+import os
+
 import streamlit as st
 import streamlit.components.v1 as components
 
+from .board_svg import svg_partita
+
+# Scacchiera di default: "locale" (SVG dalle mosse salvate) o "lichess" (iframe di lichess.org)
+BOARD_RENDERER = os.environ.get("CHESS_BOARD_RENDERER", "locale").strip().lower()
+# Più semimosse di qualunque partita: "vai alla fine"
+MAX_PLY_PARTITA = 10_000
+
 
 def render_lichess_board(game_id: str | None, height: int = 450):
     """Mostra la scacchiera Lichess per una partita specifica."""
@@ -17,3 +26,108 @@ def render_lichess_board(game_id: str | None, height: int = 450):
         height=height,
         scrolling=True,
     )
+
+
+def _imposta_ply(chiave: str, valore: int) -> None:
+    st.session_state[chiave] = valore
+
+
+def render_local_board(game_id: str | None, height: int = 450, key: str = "board"):
+    """
+    Scacchiera disegnata in locale dalle mosse della partita, con i pulsanti per
+    scorrere le mosse. Ogni posizione si disegna una volta sola (cache degli SVG).
+    """
+    if not game_id:
+        st.info("Seleziona una partita per vederla sulla scacchiera.")
+        return
+
+    chiave_ply = f"{key}_ply_{game_id}"
+    # senza una mossa scelta si parte dalla posizione finale, come su Lichess
+    risultato = svg_partita(game_id, st.session_state.get(chiave_ply, MAX_PLY_PARTITA), size=height)
+    if risultato is None:
+        st.warning(f"Partita `{game_id}` non trovata: non posso disegnare la scacchiera.")
+        return
+    svg, n_ply, mossa = risultato
+    ply = min(st.session_state.get(chiave_ply, n_ply), n_ply)
+    st.session_state[chiave_ply] = ply
+
+    col_inizio, col_indietro, col_avanti, col_fine = st.columns(4)
+    col_inizio.button(
+        "⏮", key=f"{chiave_ply}_inizio", on_click=_imposta_ply, args=(chiave_ply, 0),
+        disabled=ply == 0, use_container_width=True,
+    )
+    col_indietro.button(
+        "◀", key=f"{chiave_ply}_indietro", on_click=_imposta_ply, args=(chiave_ply, ply - 1),
+        disabled=ply == 0, use_container_width=True,
+    )
+    col_avanti.button(
+        "▶", key=f"{chiave_ply}_avanti", on_click=_imposta_ply, args=(chiave_ply, ply + 1),
+        disabled=ply >= n_ply, use_container_width=True,
+    )
+    col_fine.button(
+        "⏭", key=f"{chiave_ply}_fine", on_click=_imposta_ply, args=(chiave_ply, n_ply),
+        disabled=ply >= n_ply, use_container_width=True,
+    )
+
+    st.markdown(
+        f'<div style="display:flex;justify-content:center">{svg}</div>',
+        unsafe_allow_html=True,
+    )
+    if n_ply:
+        st.slider("Semimossa", min_value=0, max_value=n_ply, key=chiave_ply)
+    st.caption(f"{mossa} (semimossa {ply} di {n_ply})" if mossa else "Posizione iniziale")
+
+
+def render_board(game_id: str | None, height: int = 450, key: str = "board"):
+    """
+    Scacchiera della partita: locale di default (CHESS_BOARD_RENDERER), con la
+    possibilità di aprire l'iframe di Lichess per la partita selezionata.
+    """
+    usa_lichess = st.toggle(
+        "Scacchiera Lichess (online)",
+        value=BOARD_RENDERER == "lichess",
+        key=f"{key}_lichess",
+    )
+    if usa_lichess:
+        render_lichess_board(game_id, height=height)
+    else:
+        render_local_board(game_id, height=height, key=key)
+
+
+# Colonne che identificano una partita nei risultati (Analyst, Agent)
+COLONNE_ID_PARTITA = ("id", "game_id", "partita_id")
+
+
+def colonna_partita(df) -> str | None:
+    """Nome della colonna con l'id della partita, se c'è."""
+    candidate = [c for c in df.columns if str(c).lower() in COLONNE_ID_PARTITA]
+    return candidate[0] if candidate else None
+
+
+def tabella_partite(df, key: str) -> str | None:
+    """
+    Mostra un DataFrame di risultati. Se contiene una colonna partita le righe sono
+    selezionabili e viene restituito l'id della partita selezionata (altrimenti None).
+    """
+    col_partita = colonna_partita(df)
+    if not col_partita:
+        st.dataframe(df, use_container_width=True)
+        return None
+
+    evento = st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key=key,
+    )
+
+    try:
+        righe_selezionate = evento.selection.rows
+    except AttributeError:
+        righe_selezionate = []
+
+    if not righe_selezionate:
+        return None
+    return str(df.iloc[righe_selezionate[0]][col_partita])
@@ -1,13 +1,21 @@
 # pages/2_Chess_Analyst.py
 
+import os
+
 import streamlit as st
-import requests
 import pandas as pd
 
+from concurrent.futures import CancelledError
 from typing import Any, Dict, List, Optional
 
-from lib.snowflake_utils import get_sf_connection
-from lib.ui_chess import render_lichess_board
+from lib import answer_cache
+from lib.analyst_client import RichiestaAnnullata, get_analyst_client, messaggio_utente
+from lib.backend import BACKEND_SNOWFLAKE, downcast_dtypes, iter_query_batches, run_query
+from lib.chat_history import messaggio_analyst
+from lib.games_service import list_players
+from lib.result_store import get_result_store
+from lib.translation import traduci_testi
+from lib.ui_chess import render_board, tabella_partite
 
 
 # =========================
@@ -46,39 +54,36 @@ st.title("Chess Analyst")
 
 
 # =========================
-# Costanti
+# Traduzione generica EN->IT via Snowflake Cortex
 # =========================
-FILE_MODELLO_SEMANTICO = "@CHESS_DB.ANALYTICS.SEMANTIC_MODELS/scacchi_semantica.yaml"
+PREFISSO_INTERPRETAZIONE = "This is our interpretation of your question:"
 
 
-# =========================
-# Traduzione generica EN->IT via Snowflake Cortex
-# =========================
-@st.cache_data(show_spinner=False, ttl=3600)
-def traduci_in_italiano(testo: str) -> str:
-    """
-    Traduce un testo in italiano usando SNOWFLAKE.CORTEX.TRANSLATE.
-    - Usa autodetect lingua sorgente ('') e target 'it'
-    - Cache per evitare costi/latency ai rerun
-    """
-    testo = (testo or "").strip()
-    if not testo:
-        return testo
+def testi_da_tradurre(blocchi: List[Dict[str, Any]]) -> List[str]:
+    """Testi (text e suggerimenti) di una risposta Analyst che mostra_contenuto tradurrà."""
+    testi = []
+    for item in (blocchi or []):
+        item_type = item.get("type")
+        if item_type == "text":
+            testo_raw = item.get("text", "") or ""
+            if testo_raw.startswith(PREFISSO_INTERPRETAZIONE):
+                testo_raw = testo_raw[len(PREFISSO_INTERPRETAZIONE):].lstrip()
+            testi.append(testo_raw)
+        elif item_type in ("suggestions", "suggestion"):
+            testi.extend(str(s) for s in (item.get("suggestions", []) or []))
+    return testi
 
-    # Evita costi/latency su testi enormi (opzionale)
-    if len(testo) > 2000:
-        return testo
 
-    conn = get_sf_connection()
-    cur = conn.cursor()
+def traduci_in_italiano(testi: List[str]) -> Dict[str, str]:
+    """
+    Traduce in italiano tutti i testi in un colpo solo (lib.translation: una query
+    SNOWFLAKE.CORTEX.TRANSLATE per tutti i testi non ancora in cache).
+    Restituisce {originale: tradotto}; se Cortex non è disponibile restituisce {}
+    e si mostrano gli originali.
+    """
     try:
-        cur.execute(
-            "SELECT SNOWFLAKE.CORTEX.TRANSLATE(%(t)s, '', 'it')",
-            {"t": testo},
-        )
-        row = cur.fetchone()
-        return row[0] if row and row[0] else testo
-    except Exception as e:
+        return traduci_testi(testi, target="it")
+    except Exception:
         # Non bloccare la UI: fallback al testo originale
         # Mostra un warning UNA sola volta per sessione
         if not st.session_state.get("_warn_traduzione_cortex", False):
@@ -87,90 +92,110 @@ def traduci_in_italiano(testo: str) -> str:
                 "Nota: non riesco a tradurre automaticamente alcuni testi (Cortex Translate non disponibile o non autorizzato per questo ruolo). "
                 "In quei casi vedrai l'originale."
             )
-        return testo
-    finally:
-        try:
-            cur.close()
-        except Exception:
-            pass
+        return {}
 
 
-def formatta_e_traduci_testo_analyst(testo_raw: str) -> str:
+def formatta_e_traduci_testo_analyst(testo_raw: str, traduzioni: Dict[str, str]) -> str:
     """
     Gestisce solo il caso speciale 'interpretation' (titolo in italiano),
-    e per tutto il resto fa traduzione generica in italiano.
+    e per tutto il resto usa la traduzione generica in italiano.
     """
     testo_raw = testo_raw or ""
 
-    prefisso = "This is our interpretation of your question:"
-    if testo_raw.startswith(prefisso):
-        resto = testo_raw[len(prefisso):].lstrip()
-        resto_it = traduci_in_italiano(resto)
+    if testo_raw.startswith(PREFISSO_INTERPRETAZIONE):
+        resto = testo_raw[len(PREFISSO_INTERPRETAZIONE):].lstrip()
+        resto_it = traduzioni.get(resto, resto)
         return f"**Questa è la nostra interpretazione della tua domanda:**\n\n{resto_it}"
 
-    return traduci_in_italiano(testo_raw)
+    return traduzioni.get(testo_raw, testo_raw)
 
 
 # =========================
-# Chiamata Cortex Analyst (REST)
+# Esecuzione SQL generato
 # =========================
-def chiama_cortex_analyst(domanda: str) -> Dict[str, Any]:
+# Righe massime lette per ogni query generata da Analyst
+MAX_RIGHE_RISULTATI = int(os.environ.get("CHESS_ANALYST_MAX_ROWS", "100000"))
+
+
+def esegui_sql(statement: str, segnaposto=None) -> pd.DataFrame:
     """
-    Chiama il REST API di Cortex Analyst usando:
-    - il file YAML sullo stage (FILE_MODELLO_SEMANTICO)
-    - il token di sessione della connessione Snowflake
+    Esegue la SQL di Analyst su Snowflake leggendo il risultato a batch Arrow
+    (al massimo MAX_RIGHE_RISULTATI righe, tipi ridotti per occupare meno memoria).
+    Con un `segnaposto` (st.empty) mostra le prime righe e l'avanzamento mentre arrivano.
     """
-    domanda = (domanda or "").strip()
-    if not domanda:
-        raise ValueError("La domanda è vuota.")
-
-    conn = get_sf_connection()
+    if segnaposto is None:
+        return run_query(
+            statement, max_rows=MAX_RIGHE_RISULTATI, downcast=True, backend=BACKEND_SNOWFLAKE
+        )
 
-    host = conn.host
-    session_token = conn.rest.token
-    url = f"https://{host}/api/v2/cortex/analyst/message"
+    pezzi = []
+    for pezzo in iter_query_batches(
+        statement, max_rows=MAX_RIGHE_RISULTATI, backend=BACKEND_SNOWFLAKE
+    ):
+        pezzi.append(pezzo)
+        with segnaposto.container():
+            st.caption(f"Lette {sum(len(p) for p in pezzi)} righe...")
+            st.dataframe(pezzi[0], use_container_width=True, hide_index=True)
+    segnaposto.empty()
 
-    body = {
-        "messages": [
-            {
-                "role": "user",
-                "content": [{"type": "text", "text": domanda}],
-            }
-        ],
-        "semantic_model_file": FILE_MODELLO_SEMANTICO,
-    }
+    df = downcast_dtypes(pd.concat(pezzi, ignore_index=True))
+    df.attrs["truncated"] = len(df) >= MAX_RIGHE_RISULTATI
+    return df
 
-    headers = {
-        "Authorization": f'Snowflake Token="{session_token}"',
-        "Content-Type": "application/json",
-    }
 
-    resp = requests.post(url, json=body, headers=headers, timeout=60)
-    request_id = resp.headers.get("X-Snowflake-Request-Id")
+def esegui_blocchi_sql(
+    blocchi: List[Dict[str, Any]],
+) -> tuple[Dict[int, pd.DataFrame], Dict[int, str]]:
+    """
+    Esegue una volta sola le query dei blocchi sql di una risposta.
+    Le chiavi sono gli indici di blocco usati da mostra_contenuto (da 1).
+    Restituisce (risultati, errori): le query che falliscono finiscono in `errori`.
+    """
+    risultati, errori = {}, {}
+    for indice_blocco, item in enumerate(blocchi or [], start=1):
+        statement = item.get("statement", "") if item.get("type") == "sql" else ""
+        if not statement:
+            continue
+        try:
+            risultati[indice_blocco] = esegui_sql(statement)
+        except Exception as e:
+            errori[indice_blocco] = str(e)
+    return risultati, errori
 
-    if resp.status_code >= 400:
-        raise RuntimeError(
-            f"Errore Cortex Analyst {resp.status_code} (request_id={request_id}):\n{resp.text}"
-        )
 
-    resp_json = resp.json()
-    resp_json["request_id"] = request_id
-    return resp_json
+def salva_risultati(risultati: Dict[int, pd.DataFrame]) -> Dict[int, str]:
+    """Mette i DataFrame nel ResultStore: in cronologia restano solo i token."""
+    store = get_result_store()
+    return {indice: store.put(df) for indice, df in risultati.items()}
 
 
 # =========================
 # Rendering contenuti Analyst
 # =========================
-def mostra_contenuto(blocchi: List[Dict[str, Any]]):
+def mostra_contenuto(
+    blocchi: List[Dict[str, Any]],
+    risultati: Optional[Dict[int, str]] = None,
+    errori: Optional[Dict[int, str]] = None,
+    chiave: str = "",
+    traduzioni: Optional[Dict[str, str]] = None,
+):
     """
     Mostra il contenuto restituito da Cortex Analyst:
     - text: tradotto in italiano
     - suggestions/follow-up: tradotti in italiano
-    - sql: mostrata come SQL (NON tradotta) + risultati
+    - sql: mostrata come SQL (NON tradotta) + risultati, letti dal ResultStore con i token
+      di `risultati` (la query si esegue solo se manca il risultato o con "Aggiorna").
+      `risultati` ed `errori` vengono aggiornati sul posto, così la cronologia li ricorda.
     - se nei risultati c'è una colonna partita (id/game_id/partita_id), riga selezionabile
       e aggiorna la scacchiera in basso.
+    `chiave` distingue i widget delle diverse risposte in cronologia.
+    `traduzioni` viene da traduci_in_italiano (se manca si traducono qui i testi del blocco).
     """
-    conn = get_sf_connection()
+    risultati = {} if risultati is None else risultati
+    errori = {} if errori is None else errori
+    store = get_result_store()
+    if traduzioni is None:
+        traduzioni = traduci_in_italiano(testi_da_tradurre(blocchi))
     indice_blocco = 0
 
     for item in (blocchi or []):
@@ -179,14 +204,14 @@ def mostra_contenuto(blocchi: List[Dict[str, Any]]):
 
         if item_type == "text":
             testo_raw = item.get("text", "")
-            st.markdown(formatta_e_traduci_testo_analyst(testo_raw))
+            st.markdown(formatta_e_traduci_testo_analyst(testo_raw, traduzioni))
 
         elif item_type in ("suggestions", "suggestion"):
             suggerimenti = item.get("suggestions", []) or []
             if suggerimenti:
                 with st.expander("Suggerimenti di follow-up", expanded=False):
                     for s in suggerimenti:
-                        st.markdown(f"- {traduci_in_italiano(str(s))}")
+                        st.markdown(f"- {traduzioni.get(str(s), str(s))}")
 
         elif item_type == "sql":
             statement = item.get("statement", "")
@@ -197,44 +222,36 @@ def mostra_contenuto(blocchi: List[Dict[str, Any]]):
                 st.code(statement, language="sql")
 
             with st.expander("Risultati", expanded=True):
-                try:
-                    df = pd.read_sql(statement, conn)
-                except Exception as e:
-                    st.error(f"Errore eseguendo la query SQL:\n{e}")
+                df = store.get(risultati.get(indice_blocco))
+                aggiorna = st.button(
+                    "Aggiorna",
+                    key=f"aggiorna_analyst_{chiave}_{indice_blocco}",
+                    help="Rilancia la query per avere dati aggiornati.",
+                )
+                if aggiorna or (df is None and indice_blocco not in errori):
+                    try:
+                        df = esegui_sql(statement, st.empty())
+                    except Exception as e:
+                        errori[indice_blocco] = str(e)
+                        df = None
+                    else:
+                        risultati[indice_blocco] = store.put(df)
+                        errori.pop(indice_blocco, None)
+
+                if df is None:
+                    st.error(f"Errore eseguendo la query SQL:\n{errori.get(indice_blocco)}")
                     continue
 
                 if df.empty:
                     st.info("La query non ha restituito risultati.")
                     continue
+                if df.attrs.get("truncated"):
+                    st.caption(f"Mostrate solo le prime {MAX_RIGHE_RISULTATI} righe.")
 
-                # Cerco una colonna ID partita
-                candidate_cols = [
-                    c for c in df.columns if c.lower() in ("id", "game_id", "partita_id")
-                ]
-                col_partita = candidate_cols[0] if candidate_cols else None
-
-                if col_partita:
-                    evento = st.dataframe(
-                        df,
-                        use_container_width=True,
-                        hide_index=True,
-                        on_select="rerun",
-                        selection_mode="single-row",
-                        key=f"risultati_analyst_{indice_blocco}",
-                    )
-
-                    try:
-                        righe_selezionate = evento.selection.rows
-                    except AttributeError:
-                        righe_selezionate = []
-
-                    if righe_selezionate:
-                        idx = righe_selezionate[0]
-                        partita_id = df.iloc[idx][col_partita]
-                        st.session_state.analyst_selected_game_id = str(partita_id)
-                        st.success(f"Partita selezionata: {partita_id}")
-                else:
-                    st.dataframe(df, use_container_width=True)
+                partita_id = tabella_partite(df, key=f"risultati_analyst_{chiave}_{indice_blocco}")
+                if partita_id:
+                    st.session_state.analyst_selected_game_id = partita_id
+                    st.success(f"Partita selezionata: {partita_id}")
 
         else:
             # Blocchi non previsti: li ignoriamo silenziosamente
@@ -247,6 +264,10 @@ def mostra_contenuto(blocchi: List[Dict[str, Any]]):
 if "analyst_history" not in st.session_state:
     st.session_state.analyst_history = []
 
+# richiesta Analyst in corso: {"question", "player", "history", "future"}
+if "analyst_pending" not in st.session_state:
+    st.session_state.analyst_pending = None
+
 
 # =========================
 # UI: input domanda
@@ -254,6 +275,8 @@ if "analyst_history" not in st.session_state:
 st.markdown('<div class="section-spacer"></div>', unsafe_allow_html=True)
 st.subheader("Fai una domanda sulle tue partite")
 
+giocatore = st.sidebar.selectbox("Giocatore", options=list_players(), index=0)
+
 domanda = st.text_area(
     "Domanda:",
     placeholder='Esempio: "Quali sono le 10 aperture con cui ho il win rate peggiore nel blitz?"',
@@ -267,21 +290,138 @@ with col1:
     bottone_chiedi = st.button("Chiedi a Cortex Analyst", use_container_width=True)
 
 with col2:
-    st.write("")
+    usa_contesto = st.checkbox(
+        "Tieni conto delle domande precedenti",
+        value=True,
+        help="Invia ad Analyst anche gli ultimi scambi con lo stesso giocatore (entro un limite fisso).",
+    )
+
+client = get_analyst_client()
+
+
+def storia_conversazione(giocatore: str) -> list:
+    """
+    Turni precedenti con lo stesso giocatore (dall'ultimo cambio di giocatore),
+    come messaggi user/analyst; il client li compatta entro il budget.
+    """
+    storia = []
+    for item in st.session_state.analyst_history:
+        if item.get("player") != giocatore:
+            storia = []
+            continue
+        storia.append(messaggio_utente(item.get("question", ""), giocatore))
+        storia.append(messaggio_analyst(item.get("response", {}) or {}))
+    return storia
+
 
 if bottone_chiedi:
     if not domanda.strip():
         st.warning("Scrivi prima una domanda.")
     else:
-        with st.spinner("Interrogo Cortex Analyst..."):
+        storia = storia_conversazione(giocatore) if usa_contesto else []
+        try:
+            in_cache = answer_cache.cerca(domanda, giocatore, storia)
+        except Exception:
+            # la cache è solo un'ottimizzazione: se non è disponibile si chiama Analyst
+            in_cache = None
+
+        if in_cache is not None:
+            st.session_state.analyst_history.append(
+                {
+                    "question": domanda,
+                    "player": giocatore,
+                    "from_cache": True,
+                    "response": in_cache["response"],
+                    "results": salva_risultati(in_cache["results"]),
+                    "errors": {},
+                }
+            )
+        else:
             try:
-                risposta_json = chiama_cortex_analyst(domanda)
+                future = client.invia(domanda, giocatore, storia=storia)
             except Exception as e:
                 st.error(f"Errore nella chiamata a Cortex Analyst:\n\n{e}")
-            else:
-                st.session_state.analyst_history.append(
-                    {"question": domanda, "response": risposta_json}
+                st.stop()
+
+        # una nuova domanda rilascia quella ancora in corso: se è la stessa, invia l'ha
+        # appena ripresa (un'attesa in più) e annulla toglie quella vecchia, così la
+        # sessione conta una sola attesa e può ancora annullarla davvero
+        pending = st.session_state.analyst_pending
+        if pending:
+            client.annulla(pending["future"])
+            st.session_state.analyst_pending = None
+        if in_cache is None:
+            st.session_state.analyst_pending = {
+                "question": domanda,
+                "player": giocatore,
+                "history": storia,
+                "future": future,
+            }
+
+
+@st.fragment(run_every=0.5)
+def mostra_richiesta_in_corso():
+    """
+    Controlla la richiesta Analyst in corso senza bloccare la pagina:
+    quando arriva la risposta la aggiunge alla cronologia e rilancia lo script.
+    Il frammento si disegna solo se c'è una richiesta in corso; ogni uscita rilancia
+    l'intero script, così senza richieste il polling si ferma.
+    """
+    pending = st.session_state.analyst_pending
+    if not pending:
+        return
+
+    future = pending["future"]
+    if not future.done():
+        col_stato, col_annulla = st.columns([3, 1])
+        with col_stato:
+            st.info(f"Interrogo Cortex Analyst... ({pending['question']})")
+        with col_annulla:
+            if st.button("Annulla", use_container_width=True):
+                client.annulla(future)
+                st.session_state.analyst_pending = None
+                st.rerun(scope="app")
+        return
+
+    st.session_state.analyst_pending = None
+    try:
+        risposta_json = future.result()
+    except (RichiestaAnnullata, CancelledError):
+        pass
+    except Exception as e:
+        st.session_state.analyst_error = str(e)
+    else:
+        blocchi = (risposta_json.get("message", {}) or {}).get("content", []) or []
+        risultati, errori = esegui_blocchi_sql(blocchi)
+        if not errori:
+            try:
+                answer_cache.salva(
+                    pending["question"],
+                    pending["player"],
+                    risposta_json,
+                    risultati,
+                    pending.get("history"),
                 )
+            except Exception:
+                pass
+        st.session_state.analyst_history.append(
+            {
+                "question": pending["question"],
+                "player": pending["player"],
+                "response": risposta_json,
+                "results": salva_risultati(risultati),
+                "errors": errori,
+            }
+        )
+    st.rerun(scope="app")
+
+
+if st.session_state.analyst_pending:
+    mostra_richiesta_in_corso()
+
+errore = st.session_state.pop("analyst_error", None)
+if errore:
+    st.error(f"Errore nella chiamata a Cortex Analyst:\n\n{errore}")
 
 
 # =========================
@@ -293,16 +433,38 @@ st.subheader("Cronologia conversazione")
 if not st.session_state.analyst_history:
     st.info("Fai una prima domanda per vedere qui le risposte.")
 else:
-    for item in reversed(st.session_state.analyst_history):
+    storia = st.session_state.analyst_history
+
+    # una sola traduzione (batch + cache) per tutti i testi della cronologia
+    traduzioni = traduci_in_italiano(
+        [
+            testo
+            for item in storia
+            for testo in testi_da_tradurre(
+                ((item.get("response", {}) or {}).get("message", {}) or {}).get("content", [])
+            )
+        ]
+    )
+
+    for indice_voce in range(len(storia) - 1, -1, -1):
+        item = storia[indice_voce]
         q = item.get("question", "")
         resp = item.get("response", {}) or {}
 
         st.markdown(f"**Tu:** {q}")
+        if item.get("from_cache"):
+            st.caption("Risposta dalla cache (nessuna chiamata a Cortex Analyst).")
 
         msg = resp.get("message", {}) or {}
         content_blocks = msg.get("content", []) or []
 
-        mostra_contenuto(content_blocks)
+        mostra_contenuto(
+            content_blocks,
+            item.setdefault("results", {}),
+            item.setdefault("errors", {}),
+            chiave=str(indice_voce),
+            traduzioni=traduzioni,
+        )
         st.markdown("---")
 
 
@@ -315,6 +477,6 @@ st.subheader("Scacchiera dalla risposta di Analyst")
 game_id = st.session_state.get("analyst_selected_game_id")
 
 if game_id:
-    render_lichess_board(game_id, height=480)
+    render_board(game_id, height=480, key="analyst_board")
 else:
     st.info("Seleziona una partita da una delle tabelle dei risultati per vederla qui.")
@@ -1,16 +1,45 @@
 # pages/3_Rating_Forecast.py
 
 import streamlit as st
-import pandas as pd
 import altair as alt
 
-from lib.snowflake_utils import get_sf_connection
+from lib.forecasting import (
+    MAX_PERIODS,
+    dati_grafico,
+    forecast_locale,
+    forecast_snowflake,
+    load_rating_history,
+)
+from lib.games_service import data_watermark, list_players
 
 st.set_page_config(page_title="Rating Forecast", layout="wide")
 st.title("📈 Previsione del Rating")
 
 st.sidebar.header("Impostazioni previsione")
 
+player = st.sidebar.selectbox("Giocatore", options=list_players(), index=0)
+
+MOTORE_LOCALE = "Locale (Holt smorzato)"
+MOTORE_SNOWFLAKE = "Snowflake ML"
+
+motore = st.sidebar.radio(
+    "Motore di previsione",
+    [MOTORE_LOCALE, MOTORE_SNOWFLAKE],
+    index=0,
+    help="Il motore locale stima il modello una volta per giocatore e per aggiornamento dei dati; "
+    "Snowflake ML interroga RATING_FORECAST_MODEL nel warehouse.",
+)
+
+# None = smorzamento del trend scelto dalla stima (griglia di valori)
+smorzamento = None
+if motore == MOTORE_LOCALE:
+    smorzamento = st.sidebar.select_slider(
+        "Smorzamento del trend (φ)",
+        options=["auto", 0.8, 0.9, 0.95, 0.98, 1.0],
+        value="auto",
+    )
+    smorzamento = None if smorzamento == "auto" else float(smorzamento)
+
 # --- Modo di selezione dei giorni futuri ---
 selection_mode = st.sidebar.radio(
     "Previsioni per i giorni futuri: ",
@@ -22,7 +51,7 @@ if selection_mode == "Slider":
     periods = st.sidebar.slider(
         "Giorni futuri da prevedere",
         min_value=1,
-        max_value=250,
+        max_value=MAX_PERIODS,
         value=180,
         step=1,
     )
@@ -30,32 +59,30 @@ else:
     periods = st.sidebar.number_input(
         "Giorni futuri da prevedere",
         min_value=1,
-        max_value=250,
+        max_value=MAX_PERIODS,
         value=180,
         step=1,
     )
 
 st.sidebar.markdown(f"Prevediamo i prossimi **{periods}** giorni")
 
+if motore == MOTORE_LOCALE:
+    descrizione_motore = "un modello di Holt con trend smorzato stimato localmente"
+else:
+    descrizione_motore = "`SNOWFLAKE.ML.FORECAST`"
+
 st.write(
-    "Il grafico mostra il tuo rating storico su Lichess (utente `spellbind`) "
-    "e la previsione calcolata con `SNOWFLAKE.ML.FORECAST`."
+    f"Il grafico mostra il rating storico su Lichess dell'utente `{player}` "
+    f"e la previsione calcolata con {descrizione_motore}."
 )
 
 st.markdown("<br>", unsafe_allow_html=True) 
 
-conn = get_sf_connection()
-
 # ---------------- Storico ----------------
+watermark = data_watermark()
+
 with st.spinner("Carico dati storici..."):
-    df_hist = pd.read_sql(
-        """
-        SELECT ts, rating
-        FROM CHESS_DB.ANALYTICS.V_RATING_DAILY
-        ORDER BY ts
-        """,
-        conn,
-    )
+    df_hist = load_rating_history(player, watermark)
 
 if df_hist.empty:
     st.warning("Non ci sono dati storici disponibili per il rating.")
@@ -102,63 +129,22 @@ st.sidebar.markdown(
     f"Mostriamo gli **ultimi {hist_points}** giorni di storico."
 )
 
-# tieni solo gli ultimi `hist_points` record
+# tieni solo gli ultimi `hist_points` record (già caricati: nessuna nuova query)
 df_hist = df_hist.tail(hist_points)
 
 # ---------------- Forecast ----------------
-with st.spinner("Calcolo la previsione dal modello Snowflake..."):
-    df_fore = pd.read_sql(
-        f"""
-        SELECT
-            ts,
-            forecast,
-            lower_bound,
-            upper_bound
-        FROM TABLE(
-            CHESS_DB.ANALYTICS.RATING_FORECAST_MODEL!FORECAST(
-                FORECASTING_PERIODS => {periods}
-            )
-        )
-        ORDER BY ts
-        """,
-        conn,
-    )
+# le previsioni a MAX_PERIODS sono in cache: qui si prendono solo le prime righe,
+# quindi gli slider non lanciano query né ricalcoli
+if motore == MOTORE_LOCALE:
+    with st.spinner("Calcolo la previsione..."):
+        df_fore = forecast_locale(player, watermark, smorzamento).head(int(periods))
+else:
+    with st.spinner("Calcolo la previsione dal modello Snowflake..."):
+        df_fore = forecast_snowflake(player, watermark).head(int(periods))
 
 # --------- Preparazione dati per il grafico ---------
 
-# storico
-df_hist_plot = df_hist.copy()
-df_hist_plot["VALUE"] = df_hist_plot["RATING"]
-df_hist_plot["LOWER_BOUND"] = None
-df_hist_plot["UPPER_BOUND"] = None
-df_hist_plot["SERIES"] = "Storico"
-df_hist_plot = df_hist_plot[["TS", "VALUE", "LOWER_BOUND", "UPPER_BOUND", "SERIES"]]
-
-# forecast
-df_fore_plot = df_fore.rename(
-    columns={
-        "FORECAST": "VALUE",
-        "LOWER_BOUND": "LOWER_BOUND",
-        "UPPER_BOUND": "UPPER_BOUND",
-    }
-)
-df_fore_plot["SERIES"] = "Forecast"
-df_fore_plot = df_fore_plot[["TS", "VALUE", "LOWER_BOUND", "UPPER_BOUND", "SERIES"]]
-
-# --- trucco per togliere il “gap” visivo tra storico e forecast ---
-last_hist_ts = df_hist_plot["TS"].max()
-first_fore_ts = df_fore_plot["TS"].min()
-
-if pd.notna(last_hist_ts) and pd.notna(first_fore_ts):
-    first_fore_row = df_fore_plot.iloc[0].copy()
-    first_fore_row["TS"] = last_hist_ts
-    df_fore_plot = pd.concat(
-        [pd.DataFrame([first_fore_row]), df_fore_plot],
-        ignore_index=True
-    ).sort_values("TS")
-
-# uniamo storia + forecast
-df_all = pd.concat([df_hist_plot, df_fore_plot], ignore_index=True)
+df_all = dati_grafico(df_hist, df_fore)
 
 # --- Calcola automaticamente il range dell'asse Y con un po' di margine ---
 min_val = df_all["VALUE"].min()
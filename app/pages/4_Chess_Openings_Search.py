@@ -1,9 +1,11 @@
 # pages/4_Chess_Openings_Chat.py
 
-import streamlit as st
-import pandas as pd
 import requests
-from lib.snowflake_utils import get_sf_connection
+import streamlit as st
+from lib.context_packing import build_prompt
+from lib.cortex_complete import CompletionNonDisponibile, complete_sql, stream_complete
+from lib.openings_search import get_openings_search_client
+from lib.sse import StreamingMarkdown
 
 st.set_page_config(
     page_title="Chess Openings Chat",
@@ -48,100 +50,42 @@ if "openings_chat_messages" not in st.session_state:
 if "openings_last_context" not in st.session_state:
     st.session_state.openings_last_context = ""
 
+# Ricerche in cache condivisa; le domande frequenti sulla Najdorf si cercano in anticipo
+search_client = get_openings_search_client()
+try:
+    search_client.prefetch()
+except Exception:
+    pass
 
-def query_cortex_search(query: str, limit: int | None = None) -> list[dict]:
-    """
-    Chiama il servizio CHESS_OPENINGS_SEARCH via REST API e restituisce
-    una lista di risultati (chunk, file_url, relative_path, language, ecc.).
-    Se 'limit' è None, usa il valore scelto nella sidebar (num_chunks) oppure 5.
-    """
-    from streamlit import session_state as ss  # per sicurezza
-
-    if limit is None:
-        limit = ss.get("num_chunks", 5)
-
-    conn = get_sf_connection()
-
-    host = conn.host
-    session_token = conn.rest.token
-
-    url = (
-        f"https://{host}/api/v2/databases/CHESS_DB/"
-        f"schemas/ANALYTICS/cortex-search-services/CHESS_OPENINGS_SEARCH:query"
-    )
-
-    body = {
-        "query": query,
-        "limit": limit,
-        "columns": ["chunk", "file_url", "relative_path", "language"],
-        "filter": {"@and": [{"@eq": {"language": "English"}}]},
-    }
-
-    headers = {
-        "Authorization": f'Snowflake Token="{session_token}"',
-        "Content-Type": "application/json",
-    }
 
-    resp = requests.post(url, json=body, headers=headers, timeout=60)
-    if resp.status_code >= 400:
-        raise RuntimeError(
-            f"Errore Cortex Search {resp.status_code}:\n{resp.text}"
-        )
-
-    resp_json = resp.json()
-    return resp_json.get("results", [])
-
-
-def call_cortex_complete(model: str, prompt: str) -> str:
+def genera_risposta(model: str, prompt: str, stream: StreamingMarkdown) -> str:
     """
-    Chiama SNOWFLAKE.CORTEX.COMPLETE via SQL usando la stessa connessione
-    che usi per tutto il resto.
-    """
-    conn = get_sf_connection()
-    df = pd.read_sql(
-        "SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, %s) AS RESULT",
-        conn,
-        params=[model, prompt],
-    )
-    return df["RESULT"].iloc[0]
+    Risposta dell'LLM disegnata token per token (COMPLETE in streaming via REST).
+    Se lo streaming non è disponibile, o si interrompe per un errore di rete,
+    ripiega su SNOWFLAKE.CORTEX.COMPLETE via SQL.
 
-
-def build_prompt(question: str, chunks: list[dict]) -> tuple[str, str]:
-    """
-    Costruisce il prompt per il modello LLM:
-    - include contesto estratto dai PDF (chunks)
-    - istruisce il modello a rispondere in italiano e solo se il contesto basta
+    Se l'utente manda un nuovo messaggio Streamlit interrompe questo run: uscendo dal
+    `with` la connessione viene chiusa e la generazione in corso si ferma.
     """
-    context_parts = []
-    for i, r in enumerate(chunks):
-        context_parts.append(
-            f"Documento {i+1} ({r['relative_path']}):\n{r['chunk']}"
-        )
-    context_str = "\n\n".join(context_parts)
-
-    prompt = f"""
-[INST]
-Sei un assistente di scacchi specializzato in aperture, soprattutto Siciliana Najdorf. Ti viene fornito un contesto estratto da libri PDF
-e appunti caricati in Snowflake.
-
-Usa **solo** le informazioni nel contesto per rispondere alla domanda dell'utente.
-Se le informazioni non sono sufficienti, rispondi soltanto:
-"Non so rispondere a questa domanda con i dati che ho."
-
-Rispondi sempre in italiano, in modo chiaro e comprensibile per un giocatore
-tra 1700 e 2300 Elo.
-
-<context>
-{context_str}
-</context>
-
-<question>
-{question}
-</question>
-[/INST]
-Risposta (in italiano):
-"""
-    return prompt, context_str
+    precedente = st.session_state.get("openings_stream")
+    if precedente is not None:
+        precedente.close()
+
+    try:
+        completion = stream_complete(model, prompt)
+    except (CompletionNonDisponibile, requests.RequestException):
+        return complete_sql(model, prompt)
+
+    st.session_state.openings_stream = completion
+    try:
+        with completion:
+            for delta in completion:
+                stream.add(delta)
+    except requests.RequestException:
+        return complete_sql(model, prompt)
+    finally:
+        st.session_state.openings_stream = None
+    return stream.text
 
 
 # ---- UI chat: mostra la cronologia ----
@@ -169,47 +113,48 @@ if user_q:
     # risposta assistente
     with st.chat_message("assistant", avatar=icons["assistant"]):
         placeholder = st.empty()
-        with st.spinner("Sto pensando e cercando nei PDF..."):
-            # 1) Cerca nei PDF con Cortex Search
-            results = query_cortex_search(user_q)
-
-            if not results:
-                answer = "Non ho trovato passaggi rilevanti nei PDF per rispondere a questa domanda."
-                placeholder.markdown(answer)
-                st.session_state.openings_chat_messages.append(
-                    {"role": "assistant", "content": answer}
-                )
+        with st.spinner("Sto cercando nei PDF..."):
+            # 1) Risultati di Cortex Search sui PDF (o dalla cache)
+            results = search_client.cerca(user_q, num_chunks)
+
+        if not results:
+            answer = "Non ho trovato passaggi rilevanti nei PDF per rispondere a questa domanda."
+            placeholder.markdown(answer)
+            st.session_state.openings_chat_messages.append(
+                {"role": "assistant", "content": answer}
+            )
+        else:
+            # 2) Costruisci il prompt per l'LLM
+            prompt, context_str = build_prompt(user_q, results, model_name)
+
+            # salva l'ultimo contesto usato nello stato
+            st.session_state.openings_last_context = context_str
+
+            # 3) Chiama COMPLETE: la risposta compare man mano che viene generata
+            stream = StreamingMarkdown(placeholder)
+            raw_answer = genera_risposta(model_name, prompt, stream).strip()
+
+            # Se il modello dice esplicitamente che non sa rispondere,
+            # NON aggiungiamo i riferimenti (sarebbe fuorviante).
+            dont_know_msg = "Non so rispondere a questa domanda con i dati che ho."
+            if raw_answer.startswith(dont_know_msg):
+                full_answer = raw_answer
             else:
-                # 2) Costruisci il prompt per l'LLM
-                prompt, context_str = build_prompt(user_q, results)
-
-                # salva l'ultimo contesto usato nello stato
-                st.session_state.openings_last_context = context_str
-
-                # 3) Chiama SNOWFLAKE.CORTEX.COMPLETE
-                raw_answer = call_cortex_complete(model_name, prompt).strip()
-
-                # Se il modello dice esplicitamente che non sa rispondere,
-                # NON aggiungiamo i riferimenti (sarebbe fuorviante).
-                dont_know_msg = "Non so rispondere a questa domanda con i dati che ho."
-                if raw_answer.startswith(dont_know_msg):
-                    full_answer = raw_answer
-                else:
-                    # 4) Costruisci elenco dei PDF usati come riferimento (senza link)
-                    unique_files = sorted({r["relative_path"] for r in results})
+                # 4) Costruisci elenco dei PDF usati come riferimento (senza link)
+                unique_files = sorted({r["relative_path"] for r in results})
 
-                    references_md = "###### Riferimenti (PDF utilizzati)\n\n"
-                    for fname in unique_files:
-                        references_md += f"- {fname}\n"
+                references_md = "###### Riferimenti (PDF utilizzati)\n\n"
+                for fname in unique_files:
+                    references_md += f"- {fname}\n"
 
-                    full_answer = raw_answer + "\n\n" + references_md
+                full_answer = raw_answer + "\n\n" + references_md
 
-                # Mostra risposta (con o senza riferimenti a seconda del caso)
-                placeholder.markdown(full_answer)
+            # Mostra risposta (con o senza riferimenti a seconda del caso)
+            stream.close(full_answer)
 
-                st.session_state.openings_chat_messages.append(
-                    {"role": "assistant", "content": full_answer}
-                )
+            st.session_state.openings_chat_messages.append(
+                {"role": "assistant", "content": full_answer}
+            )
 
 # ---- Debug: mostra sempre l'ultimo contesto se richiesto ----
 if debug and st.session_state.openings_last_context:
@@ -1,11 +1,13 @@
 # pages/5_Chess_Agent.py
-import json
-import re
 import requests
 import streamlit as st
 
-from lib.ui_chess import render_lichess_board
-from lib.snowflake_utils import get_sf_connection
+from lib.agent_events import AgentRun
+from lib.chat_history import AGENT_MAX_TOKENS, compatta
+from lib.result_store import get_result_store
+from lib.ui_chess import render_board, tabella_partite
+from lib.snowflake_utils import REST_BASE_URL, get_rest_auth
+from lib.sse import StreamingMarkdown, iter_sse
 
 DB = "CHESS_DB"
 SCHEMA = "ANALYTICS"
@@ -18,31 +20,10 @@ def to_msg(role: str, text: str) -> dict:
     return {"role": role, "content": [{"type": "text", "text": text}]}
 
 
-def sse_events(resp):
-    event = None
-    data_lines = []
-
-    # decode_unicode=False => ottieni bytes, decodifichi tu in UTF-8 (zero mojibake)
-    for raw in resp.iter_lines(decode_unicode=False):
-        if not raw:
-            if event is not None:
-                yield event, "\n".join(data_lines)
-            event, data_lines = None, []
-            continue
-
-        line = raw.decode("utf-8", errors="replace").strip()
-
-        if line.startswith("event:"):
-            event = line[len("event:"):].strip()
-        elif line.startswith("data:"):
-            data_lines.append(line[len("data:"):].strip())
-
-def call_agent(messages):
-    conn = get_sf_connection()
-    host = conn.host
-    pat = st.secrets["SNOWFLAKE_PAT"]
-
-    url = f"https://{host}/api/v2/databases/{DB}/schemas/{SCHEMA}/agents/{AGENT}:run"
+def agent_headers() -> tuple[str, dict]:
+    base_url, token = get_rest_auth()
+    # con il server sostitutivo (CORTEX_REST_BASE_URL) il PAT non serve
+    pat = token if REST_BASE_URL else st.secrets["SNOWFLAKE_PAT"]
     headers = {
         "Authorization": f"Bearer {pat}",
         "Content-Type": "application/json",
@@ -51,7 +32,48 @@ def call_agent(messages):
         "X-Snowflake-Role": "ACCOUNTADMIN",
         "X-Snowflake-Warehouse": "CHESS_WH",
     }
-    body = {"messages": messages, "tool_choice": {"type": "auto"}}
+    return base_url, headers
+
+
+def crea_thread() -> dict | None:
+    """
+    Crea un thread Cortex lato server: la cronologia la tiene Snowflake e a ogni turno
+    si invia solo la nuova domanda. None se l'API dei thread non è disponibile.
+    """
+    base_url, headers = agent_headers()
+    try:
+        r = requests.post(
+            f"{base_url}/api/v2/cortex/threads",
+            headers={**headers, "Accept": "application/json"},
+            json={"origin_application": "chess_copilot"},
+            timeout=(10, 30),
+        )
+        r.raise_for_status()
+        data = r.json()
+    except (requests.RequestException, ValueError):
+        return None
+    thread_id = data.get("thread_id") if isinstance(data, dict) else data
+    return {"id": thread_id, "parent_message_id": 0} if thread_id else None
+
+
+def call_agent(messages, thread: dict | None = None):
+    base_url, headers = agent_headers()
+
+    url = f"{base_url}/api/v2/databases/{DB}/schemas/{SCHEMA}/agents/{AGENT}:run"
+    if thread:
+        # con un thread basta l'ultimo messaggio: il resto è già sul server
+        body = {
+            "thread_id": thread["id"],
+            "parent_message_id": thread["parent_message_id"],
+            "messages": messages[-1:],
+            "tool_choice": {"type": "auto"},
+        }
+    else:
+        # senza thread si invia la cronologia, compattata entro AGENT_MAX_TOKENS
+        body = {
+            "messages": compatta(messages, max_tokens=AGENT_MAX_TOKENS),
+            "tool_choice": {"type": "auto"},
+        }
 
     # ✅ stream=True per SSE reale
     # ✅ timeout tuple: (connect_timeout, read_timeout)
@@ -65,6 +87,25 @@ def call_agent(messages):
     return r
 
 
+def mostra_tabelle(tabelle: list[dict], chiave: str):
+    """
+    Tabelle di risultati già calcolate dall'agente (niente query in più):
+    le righe con un id partita sono selezionabili e aggiornano la scacchiera.
+    """
+    store = get_result_store()
+    for i, tabella in enumerate(tabelle):
+        df = store.get(tabella["token"])
+        if df is None:
+            continue
+        st.markdown(f"**{tabella['title']}**")
+        if tabella.get("sql"):
+            with st.expander("SQL eseguito dall'agente", expanded=False):
+                st.code(tabella["sql"], language="sql")
+        partita_id = tabella_partite(df, key=f"tabella_agent_{chiave}_{i}")
+        if partita_id:
+            st.session_state.agent_selected_game_id = partita_id
+
+
 # Stato chat
 if "agent_api_messages" not in st.session_state:
     st.session_state.agent_api_messages = []
@@ -72,11 +113,15 @@ if "chat_ui" not in st.session_state:
     st.session_state.chat_ui = []
 if "agent_selected_game_id" not in st.session_state:
     st.session_state.agent_selected_game_id = None
+# thread Cortex della conversazione: {"id", "parent_message_id"}; False = API non disponibile
+if "agent_thread" not in st.session_state:
+    st.session_state.agent_thread = None
 
 # Render cronologia UI
-for m in st.session_state.chat_ui:
+for indice, m in enumerate(st.session_state.chat_ui):
     with st.chat_message(m["role"]):
         st.markdown(m["content"])
+        mostra_tabelle(m.get("tables", []), chiave=str(indice))
 
 user_q = st.chat_input("Chiedimi di partite, rating o aperture…")
 if user_q:
@@ -84,39 +129,42 @@ if user_q:
     st.session_state.agent_api_messages.append(to_msg("user", user_q))
 
     with st.chat_message("assistant"):
-        placeholder = st.empty()
-        out = ""
-
-        resp = call_agent(st.session_state.agent_api_messages)
-
-        # Stream: mostriamo i delta e poi teniamo il testo finale
-        final_text = None
-        for ev, data in sse_events(resp):
-            if ev == "response.text.delta":
-                payload = json.loads(data)
-                out += payload.get("text", "")
-                placeholder.markdown(out)
-            elif ev == "response":
-                payload = json.loads(data)
-                # fallback: prova a estrarre testo finale dalla risposta aggregata
-                content = payload.get("response", {}).get("content", [])
-                texts = [c.get("text", "") for c in content if c.get("type") == "text"]
-                if texts:
-                    final_text = "\n".join(texts)
-
-        if final_text:
-            out = final_text
-            placeholder.markdown(out)
-
-    st.session_state.chat_ui.append({"role": "assistant", "content": out})
+        stream = StreamingMarkdown()
+
+        if st.session_state.agent_thread is None:
+            st.session_state.agent_thread = crea_thread() or False
+        thread = st.session_state.agent_thread or None
+
+        resp = call_agent(st.session_state.agent_api_messages, thread)
+
+        # Stream: mostriamo i delta (a blocchi di ~50 ms) e raccogliamo tool e tabelle
+        run = AgentRun()
+        with resp:
+            for ev, data in iter_sse(resp.iter_content(chunk_size=None)):
+                delta = run.gestisci(ev, data)
+                if delta:
+                    stream.add(delta)
+
+        out = stream.close(run.final_text)
+
+        if thread:
+            if run.message_id is not None:
+                thread["parent_message_id"] = run.message_id
+            else:
+                # senza id del messaggio non si può continuare il thread: si torna alla cronologia
+                st.session_state.agent_thread = False
+
+        store = get_result_store()
+        tabelle = [
+            {"title": t.title, "sql": t.sql, "token": store.put(t.df)} for t in run.tables
+        ]
+        mostra_tabelle(tabelle, chiave=str(len(st.session_state.chat_ui)))
+
+    st.session_state.chat_ui.append({"role": "assistant", "content": out, "tables": tabelle})
     st.session_state.agent_api_messages.append(to_msg("assistant", out))
 
-    m = re.search(r"GAME_ID\s*[:=]\s*([A-Za-z0-9]+)", out)
-    if m:
-        st.session_state.agent_selected_game_id = m.group(1)
-
 # Scacchiera se trovata
 gid = st.session_state.agent_selected_game_id
 if gid:
     st.subheader("♟️ Scacchiera")
-    render_lichess_board(gid, height=480)
+    render_board(gid, height=480, key="agent_board")
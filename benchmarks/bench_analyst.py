@@ -0,0 +1,67 @@
+# benchmarks/bench_analyst.py
+#
+# Risultati delle query di Cortex Analyst: DataFrame costruito dai batch Arrow (come
+# esegui_sql della pagina) e rilettura dal ResultStore, che è quello che mostra_contenuto
+# fa a ogni rerun per ogni risposta in cronologia.
+
+import pandas as pd
+import pytest
+
+from lib.backend import downcast_dtypes, iter_query_batches, run_query
+from lib.result_store import ResultStore
+
+# Default di CHESS_ANALYST_MAX_ROWS nella pagina Analyst
+MAX_RIGHE_RISULTATI = 100_000
+
+# Una SQL "da Analyst" che cresce con il dataset: tutte le partite del giocatore
+STATEMENT = """
+    SELECT id AS GAME_ID, game_date, speed, my_color, my_result, opening_name,
+           opponent_name, opponent_rating, my_rating
+    FROM CHESS_DB.ANALYTICS.V_PARTITE_GIOCATORI
+    WHERE player_name = %(player)s
+    ORDER BY game_date DESC
+"""
+
+
+def test_run_query_downcast(benchmark, player):
+    """esegui_sql senza segnaposto (risposte precalcolate in background)."""
+    benchmark.pedantic(
+        run_query,
+        args=(STATEMENT, {"player": player}),
+        kwargs={"max_rows": MAX_RIGHE_RISULTATI, "downcast": True},
+        rounds=5,
+    )
+
+
+def test_batch_concat_downcast(benchmark, player):
+    """esegui_sql con segnaposto: i batch arrivano uno alla volta, poi concat e downcast."""
+
+    def costruisci() -> pd.DataFrame:
+        pezzi = list(iter_query_batches(STATEMENT, {"player": player}, max_rows=MAX_RIGHE_RISULTATI))
+        return downcast_dtypes(pd.concat(pezzi, ignore_index=True))
+
+    benchmark.pedantic(costruisci, rounds=5)
+
+
+@pytest.fixture
+def risultato(player):
+    return run_query(STATEMENT, {"player": player}, max_rows=MAX_RIGHE_RISULTATI, downcast=True)
+
+
+def test_result_store_memoria(benchmark, tmp_path, risultato):
+    store = ResultStore(tmp_path)
+    token = store.put(risultato)
+    benchmark(store.get, token)
+
+
+def test_result_store_disco(benchmark, tmp_path, risultato):
+    """Risultato scritto su disco (memoria piena): ogni lettura rilegge il Parquet."""
+    store = ResultStore(tmp_path, max_bytes=1)
+    token = store.put(risultato)
+    piccolo = risultato.head(1)
+
+    def spingi_su_disco() -> None:
+        # un risultato più recente: quello misurato è il meno usato e finisce su disco
+        store.put(piccolo)
+
+    benchmark.pedantic(store.get, args=(token,), setup=spingi_su_disco, rounds=10)
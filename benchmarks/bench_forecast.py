@@ -0,0 +1,56 @@
+# benchmarks/bench_forecast.py
+#
+# Rating Forecast: storico dal database, stima del Holt smorzato e DataFrame del grafico
+# (storico + previsione) che la pagina ricostruisce a ogni rerun.
+
+import pytest
+
+from lib.forecasting import (
+    MAX_HIST_POINTS,
+    MAX_PERIODS,
+    dati_grafico,
+    fit_holt_damped,
+    forecast_locale,
+    load_rating_history,
+    serie_giornaliera,
+)
+from lib.games_service import data_watermark
+
+# (giorni di storico, giorni di previsione) degli slider della pagina
+ORIZZONTI = [(30, 30), (365, 90), (MAX_HIST_POINTS, MAX_PERIODS)]
+
+
+@pytest.fixture(scope="session")
+def storico(player):
+    return load_rating_history(player, data_watermark())
+
+
+def test_load_rating_history(benchmark, player):
+    watermark = data_watermark()
+    benchmark.pedantic(
+        load_rating_history, args=(player, watermark), setup=load_rating_history.clear, rounds=10
+    )
+
+
+def test_fit_holt_damped(benchmark, storico):
+    benchmark(lambda: fit_holt_damped(serie_giornaliera(storico).to_numpy()))
+
+
+@pytest.mark.parametrize("storia,periodi", ORIZZONTI)
+def test_dati_grafico(benchmark, player, storico, storia, periodi):
+    df_fore = forecast_locale(player, data_watermark()).head(periodi)
+    benchmark(dati_grafico, storico.tail(storia), df_fore)
+
+
+@pytest.mark.parametrize("storia,periodi", ORIZZONTI)
+def test_rerun_pagina(benchmark, player, storia, periodi):
+    """Un rerun della pagina con le cache già calde: loader in cache, slicing e grafico."""
+    watermark = data_watermark()
+
+    def rerun():
+        df_hist = load_rating_history(player, watermark).tail(storia)
+        df_fore = forecast_locale(player, watermark).head(periodi)
+        return dati_grafico(df_hist, df_fore)
+
+    rerun()
+    benchmark(rerun)
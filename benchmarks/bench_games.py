@@ -0,0 +1,63 @@
+# benchmarks/bench_games.py
+#
+# Game Explorer: costruzione della query e lettura delle pagine di partite (DuckDB locale).
+
+import pytest
+
+from lib.games_service import _build_where, count_games, load_games, load_games_page, page_cursor
+from lib.result_cache import FILTRO_TUTTI, get_result_cache
+
+# Filtri della sidebar: quelli di default della pagina e una combinazione stretta
+FILTRI = {
+    "default": (FILTRO_TUTTI, FILTRO_TUTTI, FILTRO_TUTTI, (1200, 2300), ()),
+    "stretti": ("blitz", "win", "white", (1500, 2100), ("e4", "c5")),
+}
+PAGE_SIZE = 100
+
+
+def test_build_where(benchmark):
+    benchmark(_build_where, "spellbind", "blitz", "win", "white", (1200, 2300), ("e4", "c5", "Nf3"))
+
+
+@pytest.mark.parametrize("filtri", FILTRI, ids=list(FILTRI))
+def test_load_games_query(benchmark, player, filtri):
+    """Prima pagina con la cache dei risultati vuota: query e conversione in pandas."""
+    speed, result, color, rating, mosse = FILTRI[filtri]
+    benchmark.pedantic(
+        load_games,
+        args=(player, speed, result, color, rating, PAGE_SIZE, mosse),
+        setup=get_result_cache.clear,
+        rounds=10,
+    )
+
+
+@pytest.mark.parametrize("filtri", FILTRI, ids=list(FILTRI))
+def test_load_games_rerun(benchmark, player, filtri):
+    """La stessa pagina a ogni rerun di Streamlit: risposta dalla cache dei risultati."""
+    speed, result, color, rating, mosse = FILTRI[filtri]
+    load_games(player, speed, result, color, rating, PAGE_SIZE, mosse)
+    benchmark(load_games, player, speed, result, color, rating, PAGE_SIZE, mosse)
+
+
+def test_load_games_page_successiva(benchmark, player):
+    """Seconda pagina con paginazione keyset, senza cache."""
+    speed, result, color, rating, mosse = FILTRI["default"]
+    after = page_cursor(load_games_page(player, speed, result, color, rating, mosse, PAGE_SIZE))
+    benchmark.pedantic(
+        load_games_page,
+        args=(player, speed, result, color, rating, mosse, PAGE_SIZE, after),
+        setup=get_result_cache.clear,
+        rounds=10,
+    )
+
+
+def test_count_games(benchmark, player):
+    speed, result, color, rating, mosse = FILTRI["default"]
+
+    def svuota():
+        get_result_cache.clear()
+        count_games.clear()
+
+    benchmark.pedantic(
+        count_games, args=(player, speed, result, color, rating, mosse), setup=svuota, rounds=10
+    )
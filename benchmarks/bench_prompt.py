@@ -0,0 +1,37 @@
+# benchmarks/bench_prompt.py
+#
+# Chat aperture: prompt con 10 chunk grandi di Cortex Search (deduplica MinHash, unione
+# dei pezzi sovrapposti, budget del modello).
+
+import random
+
+import pytest
+
+from lib.context_packing import CONTEXT_BUDGET, build_prompt
+from lib.cortex_standin import SEARCH_CHUNKS
+
+NUM_CHUNKS = 10
+PAROLE_PER_CHUNK = 1_500
+DOMANDA = "Qual è il piano del Nero nella Najdorf contro l'Attacco Inglese?"
+
+
+def chunk_grandi(num: int = NUM_CHUNKS, parole: int = PAROLE_PER_CHUNK) -> list[dict]:
+    """
+    Chunk come quelli di Cortex Search, lunghi `parole` parole (testo dei PDF di prova
+    rimescolato). Ci sono anche un quasi-duplicato e due pezzi consecutivi sovrapposti
+    dello stesso PDF, per far lavorare deduplica e unione.
+    """
+    rng = random.Random(0)
+    vocabolario = " ".join(SEARCH_CHUNKS).split()
+    testi = [" ".join(rng.choices(vocabolario, k=parole)) for _ in range(num)]
+    testi[3] = testi[2].replace("Black", "White", 1)  # quasi-duplicato
+    testi[5] = " ".join(testi[4].split()[-60:] + testi[5].split()[60:])  # continua il 4
+    pdf = [f"najdorf_{i // 2 + 1}.pdf" for i in range(num)]
+    return [{"chunk": testo, "relative_path": path} for testo, path in zip(testi, pdf)]
+
+
+@pytest.mark.parametrize("model", list(CONTEXT_BUDGET))
+def test_build_prompt(benchmark, model):
+    chunks = chunk_grandi()
+    prompt, contesto = benchmark(build_prompt, DOMANDA, chunks, model)
+    assert DOMANDA in prompt and contesto
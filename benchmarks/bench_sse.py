@@ -0,0 +1,94 @@
+# benchmarks/bench_sse.py
+#
+# Stream SSE del Cortex Agent: parsing dei frame (lib.sse.iter_sse) e costruzione
+# della risposta evento per evento (lib.agent_events.AgentRun).
+
+import json
+
+import pytest
+
+from lib.agent_events import AgentRun, result_set_to_df
+from lib.sse import iter_sse
+
+# Righe del result_set nel tool_result e delta di testo della risposta
+RIGHE = (1_000, 20_000)
+DELTA = 5_000
+# Dimensione dei pezzi in cui arriva lo stream (resp.iter_content)
+CHUNK_BYTES = (1_024, 16_384)
+
+
+def _evento(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+def _result_set(righe: int) -> dict:
+    """result_set come lo manda l'agente: valori come stringhe, tipi in rowType."""
+    return {
+        "resultSetMetaData": {
+            "rowType": [
+                {"name": "GAME_ID", "type": "text"},
+                {"name": "GAME_DATE", "type": "date"},
+                {"name": "MY_RESULT", "type": "text"},
+                {"name": "OPENING_NAME", "type": "text"},
+                {"name": "OPPONENT_RATING", "type": "fixed"},
+            ]
+        },
+        "data": [
+            [f"g{i:07d}", str(19_000 + i % 700), ("win", "draw", "loss")[i % 3], "Sicilian Defense: Najdorf Variation", str(1200 + i % 900)]
+            for i in range(righe)
+        ],
+    }
+
+
+def stream_agente(righe: int, delta: int = DELTA) -> bytes:
+    """Uno stream :run completo: tool_use, tool_result con la tabella, delta di testo, risposta."""
+    eventi = [
+        _evento("metadata", {"metadata": {"role": "user", "message_id": 1}}),
+        _evento("response.tool_use", {"tool_use_id": "toolu_1", "name": "partite_giocatore", "input": {}}),
+        _evento(
+            "response.tool_result",
+            {
+                "tool_use_id": "toolu_1",
+                "name": "partite_giocatore",
+                "status": "success",
+                "content": [{"type": "json", "json": {"sql": "SELECT 1", "result_set": _result_set(righe)}}],
+            },
+        ),
+    ]
+    eventi += [_evento("response.text.delta", {"content_index": 1, "text": f"parola{i} "}) for i in range(delta)]
+    eventi.append(_evento("metadata", {"metadata": {"role": "assistant", "message_id": 2}}))
+    eventi.append(_evento("response", {"role": "assistant", "content": [{"type": "text", "text": "fine"}]}))
+    return b"".join(eventi)
+
+
+def _a_pezzi(stream: bytes, chunk_bytes: int) -> list[bytes]:
+    return [stream[i:i + chunk_bytes] for i in range(0, len(stream), chunk_bytes)]
+
+
+@pytest.mark.parametrize("chunk_bytes", CHUNK_BYTES)
+@pytest.mark.parametrize("righe", RIGHE)
+def test_iter_sse(benchmark, righe, chunk_bytes):
+    pezzi = _a_pezzi(stream_agente(righe), chunk_bytes)
+    frame = benchmark(lambda: sum(1 for _ in iter_sse(pezzi)))
+    assert frame == DELTA + 5
+
+
+@pytest.mark.parametrize("righe", RIGHE)
+def test_agent_run(benchmark, righe):
+    """Parsing + stato della risposta, come nel ciclo di call_agent della pagina Agent."""
+    pezzi = _a_pezzi(stream_agente(righe), CHUNK_BYTES[-1])
+
+    def consuma() -> AgentRun:
+        run = AgentRun()
+        for event, data in iter_sse(pezzi):
+            run.gestisci(event, data)
+        return run
+
+    run = benchmark(consuma)
+    assert len(run.tables[0].df) == righe
+
+
+@pytest.mark.parametrize("righe", RIGHE)
+def test_result_set_to_df(benchmark, righe):
+    result_set = _result_set(righe)
+    benchmark(result_set_to_df, result_set)
@@ -0,0 +1,119 @@
+# benchmarks/conftest.py
+#
+# Benchmark (pytest-benchmark) dei percorsi caldi dell'app: query delle partite, parsing
+# degli stream SSE, prompt della chat aperture, dati del grafico di previsione e
+# DataFrame dei risultati di Analyst/Agent.
+#
+# Le misure che dipendono dai dati girano sul backend DuckDB locale, con dataset
+# sintetici ottenuti moltiplicando i CSV Lichess (vedi prepara_dataset).
+#
+# Uso (dalla cartella benchmarks/):
+#   python -m pytest                           # scale 10x e 100x, risultati salvati in .benchmarks/
+#   python -m pytest --scala 10,100,1000       # anche 1000x (~6,5 milioni di partite, molta RAM)
+#   python -m pytest --benchmark-compare --benchmark-compare-fail=median:20%
+
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+sys.path.insert(0, str(APP_DIR))
+
+# i benchmark non toccano mai Snowflake né un server sostitutivo
+os.environ["CHESS_BACKEND"] = "duckdb"
+os.environ.pop("CORTEX_REST_BASE_URL", None)
+
+import streamlit as st  # noqa: E402
+
+from lib.games_service import list_players  # noqa: E402
+from lib.ingestion import DEFAULT_CSV_FILES, GAMES_SCHEMA, REPO_ROOT, get_games_dir, ingest_csvs  # noqa: E402
+from lib.local_backend import get_duckdb_connection  # noqa: E402
+
+# Dataset sintetici: data/bench/x<scala>/, generati una volta e riusati tra un run e l'altro
+BENCH_DATA_DIR = REPO_ROOT / "data" / "bench"
+SCALE_DEFAULT = "10,100"
+
+# Colonne delle copie sintetiche, nell'ordine di GAMES_SCHEMA (k = numero della copia)
+COLONNE_COPIA = {
+    "id": "g.id || '-' || k.k",
+    "created_at_ms": "g.created_at_ms - k.k",
+    "last_move_at_ms": "g.last_move_at_ms - k.k",
+    "created_at": "g.created_at - to_milliseconds(k.k)",
+    "last_move_at": "g.last_move_at - to_milliseconds(k.k)",
+}
+
+# fuori da `streamlit run` le cache avvisano a ogni chiamata che manca il runtime
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--scala",
+        default=SCALE_DEFAULT,
+        help="moltiplicatori dei CSV Lichess per i dataset sintetici, separati da virgola",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "scala" in metafunc.fixturenames:
+        scale = [int(s) for s in metafunc.config.getoption("--scala").split(",") if s.strip()]
+        metafunc.parametrize("scala", scale, ids=[f"x{s}" for s in scale], scope="session")
+
+
+def prepara_dataset(scala: int) -> Path:
+    """
+    Cartella dati (CHESS_LOCAL_DATA_DIR) con `scala` volte le partite dei CSV Lichess.
+
+    Le copie hanno id diversi (id-k) e finiscono k millisecondi prima dell'originale:
+    stesse date, stessi giocatori, `scala` volte le partite per giorno. Restano tutte sotto
+    il watermark dell'ingestion, quindi i CSV non vengono ricaricati.
+    Il dataset si rigenera se i CSV sono più recenti.
+    """
+    data_dir = BENCH_DATA_DIR / f"x{scala}"
+    pronto = data_dir / "dataset.ok"
+    csv_mtime = max(p.stat().st_mtime for p in DEFAULT_CSV_FILES if p.exists())
+    if pronto.exists() and pronto.stat().st_mtime >= csv_mtime:
+        return data_dir
+
+    shutil.rmtree(data_dir, ignore_errors=True)
+    os.environ["CHESS_LOCAL_DATA_DIR"] = str(data_dir)
+    ingest_csvs()
+    originali = (get_games_dir() / "part-*.parquet").as_posix()
+    if scala > 1:
+        copie = (get_games_dir() / "part-sintetico.parquet").as_posix()
+        colonne = ", ".join(f"{COLONNE_COPIA.get(c, 'g.' + c)} AS {c}" for c in GAMES_SCHEMA.names)
+        duckdb.execute(
+            f"""
+            COPY (
+                SELECT {colonne}
+                FROM read_parquet('{originali}') g, range(1, {int(scala)}) k(k)
+            ) TO '{copie}' (FORMAT PARQUET, COMPRESSION ZSTD)
+            """
+        )
+    pronto.write_text(str(scala), encoding="utf-8")
+    return data_dir
+
+
+@pytest.fixture(scope="session")
+def dataset(scala):
+    """
+    Attiva il dataset sintetico della scala: punta lì CHESS_LOCAL_DATA_DIR, svuota le
+    cache di Streamlit e costruisce il database DuckDB prima delle misure.
+    """
+    data_dir = prepara_dataset(scala)
+    os.environ["CHESS_LOCAL_DATA_DIR"] = str(data_dir)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    get_duckdb_connection()
+    return data_dir
+
+
+@pytest.fixture(scope="session")
+def player(dataset):
+    """Il giocatore di default del club (il primo di DIM_PLAYER)."""
+    return list_players()[0]
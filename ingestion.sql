@@ -38,87 +38,139 @@ CREATE OR REPLACE TABLE LICHESS_GAMES (
 );
 
 
+-- Stage e file format per il bulk load dei Parquet prodotti da app/lib/ingestion.py
+-- (PUT sullo stage -> COPY INTO tabella temporanea -> MERGE su id in LICHESS_GAMES)
+CREATE OR REPLACE FILE FORMAT LICHESS_PARQUET
+    TYPE = PARQUET
+    USE_LOGICAL_TYPE = TRUE;
 
+CREATE OR REPLACE STAGE LICHESS_STAGE
+    FILE_FORMAT = LICHESS_PARQUET;
 
-CREATE OR REPLACE VIEW V_GAMES_ANALYST AS
-SELECT
-    id,
-    rated,
-    variant,
-    speed,
-    perf,
-
-    created_at,
-    CAST(created_at AS DATE) AS game_date,
-    last_move_at,
-    DATEDIFF('second', created_at, last_move_at) AS game_duration_seconds,
-
-    status,
-    winner,
 
-    moves,
-    ARRAY_SIZE(SPLIT(moves, ' ')) AS ply_count, 
-
-    opening_name,
-    opening_eco,
-
-    white_name,
-    white_rating,
-    black_name,
-    black_rating,
-
-    CASE
-        WHEN white_name = 'spellbind' THEN 'white'
-        WHEN black_name = 'spellbind' THEN 'black'
-        ELSE NULL
-    END AS my_color,
 
-    CASE
-        WHEN white_name = 'spellbind' AND winner = 'white' THEN 'win'
-        WHEN black_name = 'spellbind' AND winner = 'black' THEN 'win'
-        WHEN winner IS NULL OR winner = '' THEN 'draw'
-        WHEN (white_name = 'spellbind' OR black_name = 'spellbind') THEN 'loss'
-        ELSE NULL
-    END AS my_result,
 
-    CASE
-        WHEN white_name = 'spellbind' THEN black_name
-        WHEN black_name = 'spellbind' THEN white_name
-        ELSE NULL
-    END AS opponent_name,
+-- Giocatori del club di cui analizziamo le partite (prima 'spellbind' era cablato nella vista).
+-- IS_DEFAULT indica il giocatore mostrato dalle viste "dal mio punto di vista".
+CREATE OR REPLACE TABLE DIM_PLAYER (
+    PLAYER_NAME STRING NOT NULL,
+    IS_DEFAULT  BOOLEAN DEFAULT FALSE,
+    CONSTRAINT PK_DIM_PLAYER PRIMARY KEY (PLAYER_NAME)
+);
 
-    CASE
-        WHEN white_name = 'spellbind' THEN black_rating
-        WHEN black_name = 'spellbind' THEN white_rating
-        ELSE NULL
-    END AS opponent_rating,
+INSERT INTO DIM_PLAYER (PLAYER_NAME, IS_DEFAULT) VALUES
+    ('spellbind', TRUE),
+    ('Mouseslippin_Jimmy', FALSE);
+
+
+-- Tabella analitica "di prospettiva", materializzata e aggiornata in modo incrementale:
+-- una riga per (partita, lato), cioè ogni partita vista dal Bianco e dal Nero.
+-- Le colonne derivate (colore, rating avversario, ply_count, ...) vengono calcolate
+-- una volta sola in fase di refresh invece che a ogni query; il clustering su
+-- (player_name, game_date) fa sì che le query di un giocatore leggano solo le sue
+-- micro-partizioni, qualunque sia il numero di giocatori caricati.
+CREATE OR REPLACE DYNAMIC TABLE DT_GAMES_PERSPECTIVE
+    TARGET_LAG = '1 hour'
+    WAREHOUSE = CHESS_WH
+    REFRESH_MODE = INCREMENTAL
+    CLUSTER BY (player_name, game_date)
+AS
+SELECT
+    d.*,
 
     CASE
-        WHEN
-            CASE
-                WHEN white_name = 'spellbind' THEN black_rating
-                WHEN black_name = 'spellbind' THEN white_rating
-                ELSE NULL
-            END IS NULL THEN NULL
-        WHEN
-            CASE
-                WHEN white_name = 'spellbind' THEN black_rating
-                WHEN black_name = 'spellbind' THEN white_rating
-                ELSE NULL
-            END < 1800 THEN '<1800'
-        WHEN
-            CASE
-                WHEN white_name = 'spellbind' THEN black_rating
-                WHEN black_name = 'spellbind' THEN white_rating
-                ELSE NULL
-            END < 2000 THEN '1800-1999'
-        WHEN
-            CASE
-                WHEN white_name = 'spellbind' THEN black_rating
-                WHEN black_name = 'spellbind' THEN white_rating
-                ELSE NULL
-            END < 2200 THEN '2000-2199'
+        WHEN d.opponent_rating IS NULL THEN NULL
+        WHEN d.opponent_rating < 1800 THEN '<1800'
+        WHEN d.opponent_rating < 2000 THEN '1800-1999'
+        WHEN d.opponent_rating < 2200 THEN '2000-2199'
         ELSE '>=2200'
-    END AS opponent_rating_bucket
-
-FROM LICHESS_GAMES;
\ No newline at end of file
+    END AS opponent_rating_bucket,
+
+    d.my_rating - d.opponent_rating AS rating_diff,
+
+    IFF(d.my_result = 'win', 1, 0) AS is_win,
+    IFF(d.winner IS NULL OR d.winner = '', 1, 0) AS is_draw
+
+FROM (
+    SELECT
+        s.id,
+        s.rated,
+        s.variant,
+        s.speed,
+        s.perf,
+
+        s.created_at,
+        CAST(s.created_at AS DATE) AS game_date,
+        s.last_move_at,
+        DATEDIFF('second', s.created_at, s.last_move_at) AS game_duration_seconds,
+
+        s.status,
+        s.winner,
+
+        s.moves,
+        ARRAY_SIZE(SPLIT(s.moves, ' ')) AS ply_count,
+
+        s.opening_name,
+        s.opening_eco,
+
+        s.white_name,
+        s.white_rating,
+        s.black_name,
+        s.black_rating,
+
+        s.player_name,
+        s.my_color,
+
+        CASE
+            WHEN s.winner = s.my_color THEN 'win'
+            WHEN s.winner IS NULL OR s.winner = '' THEN 'draw'
+            ELSE 'loss'
+        END AS my_result,
+
+        IFF(s.my_color = 'white', s.white_rating, s.black_rating) AS my_rating,
+        IFF(s.my_color = 'white', s.black_name, s.white_name) AS opponent_name,
+        IFF(s.my_color = 'white', s.black_rating, s.white_rating) AS opponent_rating
+
+    FROM (
+        SELECT g.*, g.white_name AS player_name, 'white' AS my_color
+        FROM LICHESS_GAMES g
+        WHERE g.white_name IS NOT NULL
+        UNION ALL
+        SELECT g.*, g.black_name AS player_name, 'black' AS my_color
+        FROM LICHESS_GAMES g
+        WHERE g.black_name IS NOT NULL
+    ) s
+) d;
+
+
+-- Vista storica mantenuta per compatibilità: partite del giocatore di default
+CREATE OR REPLACE VIEW V_GAMES_ANALYST AS
+SELECT
+    g.id,
+    g.rated,
+    g.variant,
+    g.speed,
+    g.perf,
+    g.created_at,
+    g.game_date,
+    g.last_move_at,
+    g.game_duration_seconds,
+    g.status,
+    g.winner,
+    g.moves,
+    g.ply_count,
+    g.opening_name,
+    g.opening_eco,
+    g.white_name,
+    g.white_rating,
+    g.black_name,
+    g.black_rating,
+    g.my_color,
+    g.my_result,
+    g.opponent_name,
+    g.opponent_rating,
+    g.opponent_rating_bucket
+FROM DT_GAMES_PERSPECTIVE g
+JOIN DIM_PLAYER p
+  ON p.player_name = g.player_name
+ AND p.is_default;
@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import sys
+from pathlib import Path
+
+# i moduli dell'app si importano come `lib.xxx`, come quando si lancia dalla cartella app/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
@@ -0,0 +1,57 @@
+# tests/test_translation.py
+
+import random
+
+import pytest
+
+from lib import translation
+from lib.translation import dividi_testo, traduci_testi
+
+
+def _ricomponi(pezzi):
+    return "".join(p + s for p, s in pezzi)
+
+
+@pytest.mark.parametrize(
+    "testo,max_chars",
+    [
+        ("Aaaa bbbb. Cccc dddd e! \n\nEeee", 12),
+        ("Uno. Due. Tre.\n\nQuattro cinque sei sette. Otto!\n\n\nNove", 10),
+        ("\n\nInizio con a capo. E poi una frase.", 8),
+        ("Una parola lunghissimasenzaspazi. Fine.\n \nAltro", 6),
+    ],
+)
+def test_dividi_testo_ricompone(testo, max_chars):
+    pezzi = dividi_testo(testo, max_chars)
+    assert _ricomponi(pezzi) == testo
+    assert all(len(p) <= max_chars for p, _ in pezzi)
+
+
+def test_dividi_testo_ricompone_testi_casuali():
+    rng = random.Random(0)
+    parole = ["Aaaa", "bb.", "ccc!", "dd?", "e", " ", "  ", "\n", "\n\n", " \n\n ", "fffffffffffff"]
+    for _ in range(2000):
+        testo = " ".join(rng.choice(parole) for _ in range(rng.randint(1, 30)))
+        assert _ricomponi(dividi_testo(testo, rng.randint(4, 20))) == testo
+
+
+def test_pezzi_non_tradotti_non_rilanciano_la_query(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHESS_LOCAL_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(translation, "_FALLITI", {})
+    chiamate = []
+
+    def traduci(pezzi, target):
+        chiamate.append(list(pezzi))
+        return [None] * len(pezzi)
+
+    monkeypatch.setattr(translation, "_traduci_su_snowflake", traduci)
+    assert traduci_testi(["Hello world"]) == {"Hello world": "Hello world"}
+    assert traduci_testi(["Hello world"]) == {"Hello world": "Hello world"}
+    assert len(chiamate) == 1
+
+    # scaduto il TTL si riprova
+    monkeypatch.setattr(translation, "FALLITI_TTL_S", 0)
+    translation._FALLITI.clear()
+    traduci_testi(["Hello world"])
+    traduci_testi(["Hello world"])
+    assert len(chiamate) == 3